@@ -3,13 +3,28 @@ from typing import Optional
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import event
 from sqlalchemy.orm import Session
-from database import get_db
+from database import run_db
 from models import User
 from config import settings
+from user_cache import AuthenticatedUser, UserPrincipalCache, TokenCache
 
 security = HTTPBearer()
 
+# Authenticated users and decoded tokens, so hot requests skip the DB and JWT work
+user_cache = UserPrincipalCache(ttl=settings.USER_CACHE_TTL, max_size=settings.USER_CACHE_SIZE)
+token_cache = TokenCache(max_size=settings.USER_CACHE_SIZE)
+
+@event.listens_for(User, "after_update")
+def _invalidate_cached_user(mapper, connection, target):
+    # Deactivation (or any other change) must not be masked by the cache
+    user_cache.invalidate(target.id)
+
+@event.listens_for(User, "after_delete")
+def _drop_cached_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -21,16 +36,23 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 def verify_token(token: str) -> Optional[dict]:
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
-        return payload
     except JWTError:
         return None
+    token_cache.put(token, payload)
+    return payload
+
+def load_principal(db: Session, user_id: int) -> Optional[AuthenticatedUser]:
+    user = db.query(User).filter(User.id == user_id).first()
+    return AuthenticatedUser.from_user(user) if user else None
 
 async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> AuthenticatedUser:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -43,12 +65,15 @@ async def get_current_user(
     user_id: int = payload.get("sub")
     if user_id is None:
         raise credentials_exception
-    user = db.query(User).filter(User.id == int(user_id)).first()
+    user = await user_cache.get_async(int(user_id))
     if user is None:
-        raise credentials_exception
+        user = await run_db(load_principal, int(user_id))
+        if user is None:
+            raise credentials_exception
+        await user_cache.put_async(user)
     return user
 
-async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
+async def get_current_active_user(current_user: AuthenticatedUser = Depends(get_current_user)) -> AuthenticatedUser:
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
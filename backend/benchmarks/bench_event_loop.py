@@ -0,0 +1,111 @@
+"""Concurrent logins and positions calls with and without the thread pools.
+
+Models the two blocking paths of the API: a login spends its time in bcrypt
+(CPU, releases the GIL) and a positions call waits on a broker HTTP request.
+"inline" runs them on the event loop like the old handlers; "offloaded"
+routes them through the bounded broker/hash executors. The loop-lag column is
+the worst delay seen by a 10ms heartbeat task, i.e. how long every other
+request and WebSocket was frozen.
+
+    cd backend && python benchmarks/bench_event_loop.py --logins 20 --positions 50
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from executors import BoundedExecutor  # noqa: E402
+
+try:
+    import bcrypt
+
+    _SALT = bcrypt.gensalt(rounds=12)
+
+    def hash_password(password: str) -> bytes:
+        return bcrypt.hashpw(password.encode(), _SALT)
+except ImportError:
+    def hash_password(password: str) -> bytes:
+        # Similar cost to bcrypt rounds=12 when bcrypt isn't installed
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), b"salt", 200_000)
+
+
+def broker_positions(latency: float) -> dict:
+    time.sleep(random.uniform(0.5, 1.5) * latency)
+    return {"net": []}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def heartbeat(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lags.append(time.perf_counter() - started - 0.01)
+
+
+async def scenario(mode: str, logins: int, positions: int, latency: float):
+    broker = BoundedExecutor("broker", 32, 1024)
+    hashing = BoundedExecutor("hash", 4, 1024)
+    timings = {"login": [], "positions": []}
+    burst = {}
+
+    # Latency is measured from the start of the burst, so time spent waiting
+    # behind another request's blocking work is included
+    async def login():
+        if mode == "offloaded":
+            await hashing.run(hash_password, "secret")
+        else:
+            hash_password("secret")
+        timings["login"].append(time.perf_counter() - burst["started"])
+
+    async def get_positions():
+        if mode == "offloaded":
+            await broker.run(broker_positions, latency)
+        else:
+            broker_positions(latency)
+        timings["positions"].append(time.perf_counter() - burst["started"])
+
+    stop, lags = asyncio.Event(), []
+    beat = asyncio.create_task(heartbeat(stop, lags))
+    await asyncio.sleep(0.02)
+    requests = [login() for _ in range(logins)] + [get_positions() for _ in range(positions)]
+    random.shuffle(requests)
+    burst["started"] = time.perf_counter()
+    await asyncio.gather(*requests)
+    wall = time.perf_counter() - burst["started"]
+    stop.set()
+    await beat
+    broker.shutdown()
+    hashing.shutdown()
+    return wall, timings, max(lags) if lags else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=20)
+    parser.add_argument("--positions", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    print(f"{args.logins} logins + {args.positions} positions calls, "
+          f"{args.latency_ms:.0f}ms broker latency")
+    for mode in ("inline", "offloaded"):
+        wall, timings, lag = asyncio.run(scenario(mode, args.logins, args.positions, args.latency_ms / 1000))
+        login_ms = [t * 1000 for t in timings["login"]]
+        pos_ms = [t * 1000 for t in timings["positions"]]
+        print(f"{mode:<10} wall={wall * 1000:8.0f}ms  "
+              f"login p50/p99={percentile(login_ms, 50):7.0f}/{percentile(login_ms, 99):7.0f}ms  "
+              f"positions p50/p99={percentile(pos_ms, 50):7.0f}/{percentile(pos_ms, 99):7.0f}ms  "
+              f"max loop lag={lag * 1000:7.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Implied volatility and Greeks throughput.
+
+Times the raw batched solve (Newton IV + Black-Scholes Greeks) over random
+NIFTY legs, then ``GreeksService`` over 50 accounts x 200 positions cold and
+with a warm (instrument, LTP bucket) cache, the way /api/positions and the
+WebSocket frames use it.
+
+    cd backend && python benchmarks/bench_greeks.py --legs 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_risk_engine import SyntheticMaster, UNDERLYINGS, option_price  # noqa: E402
+from greeks import GreeksService, bs_greeks, bs_price, implied_vol  # noqa: E402
+from instruments import UNDERLYING_TOKENS  # noqa: E402
+from market_data import LTPBook  # noqa: E402
+
+RATE = 0.065
+
+
+def bench_batch(legs, runs):
+    rng = np.random.default_rng(5)
+    spot = np.full(legs, 23500.0)
+    strike = 23500 + rng.integers(-40, 41, legs) * 50.0
+    t = rng.uniform(1 / 365, 60 / 365, legs)
+    kind = rng.choice([-1.0, 1.0], legs)
+    true_sigma = rng.uniform(0.08, 0.6, legs)
+    price = bs_price(spot, strike, t, RATE, true_sigma, kind)
+
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        sigma = implied_vol(price, spot, strike, t, RATE, kind)
+        bs_greeks(spot, strike, t, RATE, sigma, kind)
+        best = min(best, time.perf_counter() - started)
+
+    # Legs with under 0.5 of time value have no well-defined volatility
+    time_value = price - np.maximum(kind * (spot - strike * np.exp(-RATE * t)), 0)
+    meaningful = time_value > 0.5
+    error = np.abs(sigma - true_sigma)[meaningful]
+    print(f"batch solve  {legs} legs  best={best * 1000:8.2f}ms  {legs / (best * 1000):8.0f} legs/ms  "
+          f"max IV error={np.nanmax(error):.2e}  unsolved={np.isnan(sigma[meaningful]).sum()}")
+
+
+def bench_service(accounts, positions, runs):
+    random.seed(9)
+    master = SyntheticMaster()
+    book = LTPBook()
+    for name, token in UNDERLYING_TOKENS.items():
+        if name in UNDERLYINGS:
+            book.update(token, UNDERLYINGS[name][1])
+
+    rows = []
+    contracts = list(master.instruments.values())
+    for account_id in range(accounts):
+        for instrument in random.sample(contracts, positions):
+            rows.append({
+                "account_id": account_id,
+                "instrument_token": instrument.instrument_token,
+                "quantity": random.choice((-2, -1, 1, 2)) * instrument.lot_size,
+                "last_price": option_price(instrument, UNDERLYINGS[instrument.name][1]),
+            })
+
+    cold, warm = [], []
+    for _ in range(runs):
+        service = GreeksService(master, book, risk_free_rate=RATE)
+        started = time.perf_counter()
+        service.annotate(rows)
+        cold.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        service.annotate(rows)
+        warm.append(time.perf_counter() - started)
+
+    unique = len({row["instrument_token"] for row in rows})
+    print(f"service      {len(rows)} rows ({unique} contracts)  cold={min(cold) * 1000:7.2f}ms  "
+          f"warm={min(warm) * 1000:7.2f}ms  ({len(rows) / (min(warm) * 1000):.0f} rows/ms cached)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--legs", type=int, default=100000)
+    parser.add_argument("--accounts", type=int, default=50)
+    parser.add_argument("--positions", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    for legs in sorted({1000, 10000, args.legs}):
+        bench_batch(legs, args.runs)
+    bench_service(args.accounts, args.positions, args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Cold-start latency: importing ``main`` and booting the server until /health answers.
+
+Each run is a fresh interpreter (``python -X importtime -c "import main"``), so
+nothing is served from a warm module cache. Prints the median wall time and
+the heaviest modules ``main`` imports; ``--serve`` also starts uvicorn and times the
+first successful /health, which includes the lifespan warm-up of the
+database and Redis. ``--max-ms`` makes the script exit non-zero when the
+median import time regresses past a budget.
+
+    cd backend && python benchmarks/bench_import_time.py --runs 5 --serve
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from collections import defaultdict
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def bench_env(args):
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", args.database_url)
+    env.setdefault("REDIS_URL", args.redis_url)
+    return env
+
+
+def import_once(env):
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND, env=env, capture_output=True, text=True
+    )
+    elapsed = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        sys.exit(f"import main failed:\n{result.stderr[-2000:]}")
+
+    # Cumulative ms per module imported directly by main (one level of
+    # indentation below it), plus every module name that was loaded at all
+    direct, loaded = {}, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        loaded.add(name.strip().split(".")[0])
+        if name.startswith("   ") and not name.startswith("    "):
+            direct[name.strip()] = int(cumulative_us) / 1000
+    return elapsed, direct, loaded
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve_once(env, timeout):
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                sys.exit(f"uvicorn exited with {server.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - started) * 1000
+            except OSError:
+                time.sleep(0.01)
+        sys.exit(f"/health did not answer within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=12, help="heaviest direct imports to list")
+    parser.add_argument("--serve", action="store_true", help="also time uvicorn until /health answers")
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if the median import exceeds this")
+    parser.add_argument("--database-url", default="sqlite:////tmp/zap-bench-startup.db")
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0")
+    args = parser.parse_args()
+
+    env = bench_env(args)
+    walls = []
+    modules = defaultdict(list)
+    loaded = set()
+    for _ in range(args.runs):
+        wall, direct, loaded = import_once(env)
+        walls.append(wall)
+        for name, ms in direct.items():
+            modules[name].append(ms)
+
+    median = statistics.median(walls)
+    print(f"import main  runs={args.runs}  median={median:7.1f}ms  min={min(walls):7.1f}ms  max={max(walls):7.1f}ms")
+    print(f"{'imported by main':<32} {'median ms':>10}")
+    heaviest = sorted(modules.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    for name, samples in heaviest[:args.top]:
+        print(f"{name:<32} {statistics.median(samples):>10.1f}")
+    lazy = [name for name in ("kiteconnect", "passlib", "twisted") if name in loaded]
+    print(f"deferred modules imported eagerly: {', '.join(lazy) if lazy else 'none'}")
+
+    if args.serve:
+        boots = [serve_once(env, timeout=60) for _ in range(args.runs)]
+        print(f"uvicorn -> /health  median={statistics.median(boots):7.1f}ms  max={max(boots):7.1f}ms")
+
+    if args.max_ms is not None and median > args.max_ms:
+        sys.exit(f"median import {median:.1f}ms is over the {args.max_ms:.1f}ms budget")
+
+
+if __name__ == "__main__":
+    main()
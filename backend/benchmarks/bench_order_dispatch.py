@@ -0,0 +1,139 @@
+"""Placement skew between the first and last account for a multi-account order.
+
+Compares the old sequential loop with ``dispatch_leg`` as ``place_order`` runs
+it: fan-out, the broker scheduler's per-key buckets and the broker thread
+pools from ``main``. Only KiteConnect is stubbed, with a ``place_order`` that
+sleeps for a broker-like latency. ``--refresh-load`` keeps that many
+positions-refresh calls queued on the shared broker pool meanwhile, to show
+orders don't wait behind them.
+
+    cd backend && python benchmarks/bench_order_dispatch.py --accounts 25 --runs 50 --refresh-load 300
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+import main  # noqa: E402
+from executors import ExecutorSaturated  # noqa: E402
+from models import ZerodhaAccount  # noqa: E402
+from rate_limiter import DEFAULT, PRIORITY_REFRESH  # noqa: E402
+
+
+class StubKiteConnect:
+    VARIETY_REGULAR = "regular"
+    VARIETY_AMO = "amo"
+    VALIDITY_DAY = "DAY"
+
+    def __init__(self, latency_ms: float, jitter_ms: float):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.fills = []
+
+    def _sleep(self):
+        time.sleep(max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000)
+
+    def place_order(self, variety, **params):
+        self._sleep()
+        self.fills.append(time.perf_counter())
+        return str(random.randint(10**14, 10**15))
+
+    def positions(self):
+        self._sleep()
+        return {"net": [], "day": []}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_sequential(kite, accounts):
+    kite.fills = []
+    for _ in accounts:
+        kite.place_order(variety=kite.VARIETY_REGULAR, tradingsymbol="NIFTY")
+    return max(kite.fills) - min(kite.fills)
+
+
+async def refresh_load(kite, accounts, depth, stop: asyncio.Event):
+    # Keeps ``depth`` refresh calls in flight on the shared pool
+    async def one(account):
+        while not stop.is_set():
+            try:
+                await main.broker.call(account.api_key, DEFAULT, kite.positions, priority=PRIORITY_REFRESH)
+            except ExecutorSaturated:
+                await asyncio.sleep(0.01)
+
+    workers = [asyncio.create_task(one(accounts[i % len(accounts)])) for i in range(depth)]
+    await stop.wait()
+    await asyncio.gather(*workers)
+
+
+async def run_dispatch(kite, accounts, leg, runs, load):
+    stop = asyncio.Event()
+    loader = asyncio.create_task(refresh_load(kite, accounts, load, stop)) if load else None
+    await asyncio.sleep(0.2 if load else 0)
+
+    skews, walls, failures = [], [], 0
+    for _ in range(runs):
+        kite.fills = []
+        started = time.perf_counter()
+        results, _ = await main.dispatch_leg(accounts, leg)
+        walls.append(time.perf_counter() - started)
+        failures += sum(1 for r in results if not r["success"])
+        if kite.fills:
+            skews.append(max(kite.fills) - min(kite.fills))
+
+    stop.set()
+    if loader is not None:
+        await loader
+    return skews, walls, failures
+
+
+def report(name, values):
+    values_ms = [v * 1000 for v in values]
+    print(f"{name:<26} p50={percentile(values_ms, 50):8.1f}ms  "
+          f"p99={percentile(values_ms, 99):8.1f}ms  mean={statistics.mean(values_ms):8.1f}ms")
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=25)
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--refresh-load", type=int, default=0,
+                        help="refresh calls kept in flight on the shared broker pool")
+    args = parser.parse_args()
+
+    kite = StubKiteConnect(args.latency_ms, args.jitter_ms)
+    main.get_kite_instance = lambda account: kite
+    accounts = [
+        ZerodhaAccount(id=i + 1, nickname=f"acc{i + 1}", api_key=f"key{i + 1}", access_token="token")
+        for i in range(args.accounts)
+    ]
+    leg = main.OrderLeg(tradingsymbol="NIFTY25JAN23500CE", exchange="NFO", transaction_type="BUY", quantity=65,
+                        product="MIS", order_type="MARKET", price=None, amo=False, tag="zapbench")
+
+    sequential = [run_sequential(kite, accounts) for _ in range(args.runs)]
+    skews, walls, failures = asyncio.run(run_dispatch(kite, accounts, leg, args.runs, args.refresh_load))
+
+    print(f"first-to-last fill skew, {args.accounts} accounts, {args.runs} runs, "
+          f"{args.latency_ms:.0f}±{args.jitter_ms:.0f}ms broker latency, "
+          f"{args.refresh_load} refresh calls in flight")
+    report("sequential skew", sequential)
+    report("dispatch_leg skew", skews)
+    report("dispatch_leg wall time", walls)
+    print(f"failed legs: {failures}/{args.runs * args.accounts}")
+    print(f"pools: broker={main.broker_executor.stats()} order={main.order_executor.stats()}")
+
+
+if __name__ == "__main__":
+    main_()
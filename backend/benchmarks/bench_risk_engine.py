@@ -0,0 +1,181 @@
+"""Pre-trade risk check latency across many accounts.
+
+Builds synthetic NIFTY/BANKNIFTY/SENSEX option books (default 50 accounts x
+200 positions), then times the parts of ``RiskEngine``: the cold column build
+from snapshots, and the warm path ``place_order`` runs (gather live prices,
+what-if grid, notional, per-account check) against the 5 ms budget.
+
+The warm path is timed twice: with the very same snapshot strings, and with
+snapshots re-serialized under a new ``ts`` before every run, which is what
+the positions refresher produces every few seconds even when no position
+moved.
+
+    cd backend && python benchmarks/bench_risk_engine.py --accounts 50 --positions 200
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from instruments import Instrument, UNDERLYING_TOKENS  # noqa: E402
+from market_data import LTPBook  # noqa: E402
+from positions_cache import POSITION_FIELDS, PositionsSnapshot  # noqa: E402
+from risk import RiskEngine  # noqa: E402
+
+UNDERLYINGS = {
+    # name: (exchange, spot, strike step, lot size)
+    "NIFTY": ("NFO", 23500.0, 50, 65),
+    "BANKNIFTY": ("NFO", 49800.0, 100, 35),
+    "SENSEX": ("BFO", 77200.0, 100, 20),
+}
+EXPIRIES = ("2025-01-30", "2025-02-06", "2025-02-27")
+
+
+class SyntheticMaster:
+    """Just enough of ``InstrumentMaster`` for the engine: ``loaded`` and ``by_token``."""
+
+    loaded = True
+
+    def __init__(self, strikes_each_side: int = 40):
+        self.instruments = {}
+        token = 10_000_000
+        for name, (exchange, spot, step, lot) in UNDERLYINGS.items():
+            atm = round(spot / step) * step
+            for expiry in EXPIRIES:
+                for k in range(-strikes_each_side, strikes_each_side + 1):
+                    strike = atm + k * step
+                    for option_type in ("CE", "PE"):
+                        token += 1
+                        self.instruments[token] = Instrument(
+                            instrument_token=token,
+                            tradingsymbol=f"{name}{expiry.replace('-', '')}{int(strike)}{option_type}",
+                            name=name, exchange=exchange, expiry=expiry, strike=strike,
+                            option_type=option_type, lot_size=lot, tick_size=0.05,
+                        )
+
+    def by_token(self, token):
+        return self.instruments.get(token)
+
+
+def option_price(instrument, spot):
+    intrinsic = max(0.0, (spot - instrument.strike) if instrument.option_type == "CE" else (instrument.strike - spot))
+    return round(intrinsic + max(5.0, 0.01 * spot - 0.3 * abs(spot - instrument.strike)), 2)
+
+
+def make_snapshot(account_id, master, positions):
+    rows = []
+    for instrument in random.sample(list(master.instruments.values()), positions):
+        spot = UNDERLYINGS[instrument.name][1]
+        price = option_price(instrument, spot)
+        lots = random.choice((-4, -3, -2, -1, 1, 2, 3, 4))
+        quantity = lots * instrument.lot_size
+        avg = price * random.uniform(0.8, 1.2)
+        pos = {
+            "tradingsymbol": instrument.tradingsymbol, "exchange": instrument.exchange,
+            "quantity": quantity, "product": "NRML", "average_price": avg, "last_price": price,
+            "instrument_token": instrument.instrument_token, "multiplier": 1,
+            "buy_value": avg * quantity if quantity > 0 else 0.0,
+            "sell_value": -avg * quantity if quantity < 0 else 0.0,
+        }
+        pos["pnl"] = pos["sell_value"] - pos["buy_value"] + quantity * price
+        rows.append([pos.get(name) for name in POSITION_FIELDS])
+    return PositionsSnapshot(account_id=account_id, ts=time.time(), rows=rows).dumps()
+
+
+def refreshed(raw):
+    # The same rows under a new ts, as the next refresh writes them
+    now = time.time()
+    return {
+        account_id: PositionsSnapshot(account_id, now, PositionsSnapshot.loads(account_id, value).rows).dumps()
+        for account_id, value in raw.items()
+    }
+
+
+def rebuilds(engine):
+    # Identity of every cached book; a rebuilt book is a new object
+    return {account_id: id(book) for account_id, book in engine._books.items()}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def report(name, samples_ms):
+    print(f"{name:<28} p50={percentile(samples_ms, 50):7.3f}ms  p99={percentile(samples_ms, 99):7.3f}ms  "
+          f"mean={statistics.fmean(samples_ms):7.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, default=50)
+    parser.add_argument("--positions", type=int, default=200)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    master = SyntheticMaster()
+    book = LTPBook()
+    for name, token in UNDERLYING_TOKENS.items():
+        if name in UNDERLYINGS:
+            book.update(token, UNDERLYINGS[name][1])
+    engine = RiskEngine(master, book)
+
+    account_ids = list(range(1, args.accounts + 1))
+    raw = {account_id: make_snapshot(account_id, master, args.positions) for account_id in account_ids}
+    # Live ticks for a third of the contracts
+    for token, instrument in list(master.instruments.items())[::3]:
+        book.update(token, option_price(instrument, UNDERLYINGS[instrument.name][1] * 1.002))
+
+    started = time.perf_counter()
+    portfolio = engine.portfolio(raw, account_ids)
+    cold_ms = (time.perf_counter() - started) * 1000
+
+    leg = next(i for i in master.instruments.values() if i.name == "NIFTY" and i.option_type == "CE")
+    timings = {"portfolio (warm)": [], "check": [], "portfolio + check": [], "exposure": [],
+               "refresh: portfolio": [], "refresh: portfolio + check": []}
+    for _ in range(args.runs):
+        t0 = time.perf_counter()
+        portfolio = engine.portfolio(raw, account_ids)
+        t1 = time.perf_counter()
+        checks = engine.check(portfolio, leg, "SELL", 10 * leg.lot_size, max_loss=5_000_000)
+        t2 = time.perf_counter()
+        engine.exposure(portfolio)
+        t3 = time.perf_counter()
+        timings["portfolio (warm)"].append((t1 - t0) * 1000)
+        timings["check"].append((t2 - t1) * 1000)
+        timings["portfolio + check"].append((t2 - t0) * 1000)
+        timings["exposure"].append((t3 - t2) * 1000)
+
+    rebuilt_before = rebuilds(engine)
+    for _ in range(args.runs):
+        raw = refreshed(raw)
+        t0 = time.perf_counter()
+        portfolio = engine.portfolio(raw, account_ids)
+        t1 = time.perf_counter()
+        engine.check(portfolio, leg, "SELL", 10 * leg.lot_size, max_loss=5_000_000)
+        t2 = time.perf_counter()
+        timings["refresh: portfolio"].append((t1 - t0) * 1000)
+        timings["refresh: portfolio + check"].append((t2 - t0) * 1000)
+    assert rebuilds(engine) == rebuilt_before, "a new ts alone rebuilt account books"
+
+    rows = len(portfolio.qty)
+    print(f"{args.accounts} accounts x {args.positions} positions = {rows} rows, "
+          f"{len(engine.moves)} price moves, {args.runs} runs")
+    print(f"{'cold build (parse + columns)':<28} {cold_ms:7.3f}ms")
+    for name, samples in timings.items():
+        report(name, samples)
+    blocked = sum(1 for check in checks if not check.allowed)
+    print(f"accounts blocked by the sample limit: {blocked}/{len(checks)}")
+    for name in ("portfolio + check", "refresh: portfolio + check"):
+        p99 = percentile(timings[name], 99)
+        print(f"p99 {name:<26} {p99:7.3f}ms, {'within' if p99 < 5 else 'OVER'} the 5 ms budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Serialization CPU and bytes per frame for positions payloads.
+
+Builds 50 accounts x 200 option positions (with Greeks) and times:
+
+    rest      GET /api/positions body: response-model dump, then stdlib json
+              (JSONResponse) vs orjson (FastJSONResponse), and the rows
+              projected straight to orjson the way the endpoint now does
+    snapshot  the WebSocket snapshot frame: send_json's json.dumps vs orjson
+              text vs columnar msgpack
+    delta     a delta frame after LTP and P&L move on --moved of the rows
+
+Frames come from the real PositionStreamer, and every msgpack frame is
+decoded back and checked against the JSON one.
+
+    cd backend && python benchmarks/bench_serialization.py --accounts 50 --positions 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydantic import TypeAdapter  # noqa: E402
+
+from position_stream import PositionStreamer, open_position_rows  # noqa: E402
+from schemas import PositionResponse  # noqa: E402
+from serialization import MSGPACK, FrameEncoder, decode_columnar, dumps, dumps_str  # noqa: E402
+
+USER = 1
+POSITION_FIELDS = tuple(PositionResponse.model_fields)
+
+
+class CaptureManager:
+    def __init__(self):
+        self.frames = []
+
+    def has_connections(self, user_id):
+        return True
+
+    async def broadcast_to_user(self, user_id, frame):
+        self.frames.append(frame)
+
+
+def book(accounts: int, positions: int) -> dict:
+    random.seed(3)
+    out = {}
+    for account_id in range(1, accounts + 1):
+        rows = []
+        for i in range(positions):
+            strike = 22000 + 50 * i
+            price = round(random.uniform(5, 400), 2)
+            quantity = random.choice((-3, -2, -1, 1, 2, 3)) * 25
+            rows.append({
+                "id": account_id * 1000 + i,
+                "tradingsymbol": f"NIFTY24JAN{strike}{'CE' if i % 2 else 'PE'}",
+                "exchange": "NFO",
+                "instrument_token": 10000000 + account_id * 1000 + i,
+                "product": "NRML",
+                "quantity": quantity,
+                "average_price": price,
+                "last_price": price,
+                "pnl": 0.0,
+            })
+        out[account_id] = rows
+    return out
+
+
+def with_greeks(account_id: int, positions: List[dict]) -> dict:
+    rows = open_position_rows(account_id, positions)
+    for row in rows.values():
+        row.update(iv=round(random.uniform(0.1, 0.3), 4), delta=round(random.uniform(-50, 50), 3),
+                   gamma=round(random.uniform(0, 1), 5), theta=round(random.uniform(-90, 0), 2),
+                   vega=round(random.uniform(0, 40), 2))
+    return rows
+
+
+def tick(positions: dict, share: float) -> None:
+    for rows in positions.values():
+        for pos in rows:
+            if random.random() < share:
+                pos["last_price"] = round(max(0.05, pos["last_price"] * (1 + random.gauss(0, 0.01))), 2)
+                pos["pnl"] = round((pos["last_price"] - pos["average_price"]) * pos["quantity"], 2)
+
+
+def project(rows: List[dict]) -> List[dict]:
+    return [{field: row.get(field) for field in POSITION_FIELDS} for row in rows]
+
+
+def best_of(fn, runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def stdlib_send_json(frame) -> str:
+    # What WebSocket.send_json did
+    return json.dumps(frame, separators=(",", ":"), ensure_ascii=False)
+
+
+def report(name: str, rows: list) -> None:
+    base_ms = rows[0][1] * 1000
+    for label, seconds, size in rows:
+        print(f"{name:9} {label:22} {seconds * 1000:9.2f}ms {size:11,d} bytes  "
+              f"{base_ms / (seconds * 1000):5.1f}x cpu  {rows[0][2] / size:5.1f}x smaller")
+
+
+def check_roundtrip(streamer: PositionStreamer, frames: list, encoder: FrameEncoder) -> None:
+    known = None
+    state = {}
+    for frame in frames:
+        known = decode_columnar(encoder.encode(MSGPACK, USER, frame), known)
+        if frame["type"] == "snapshot":
+            state = {key: dict(row) for key, row in frame["positions"].items()}
+        else:
+            for key, fields in frame["changed"].items():
+                state.setdefault(key, {}).update(fields)
+            for key in frame["removed"]:
+                state.pop(key, None)
+    ids = streamer.ids(USER)
+    decoded = {row.pop("key"): row for row in known.values()}
+    assert decoded.keys() == state.keys(), "msgpack frames lost or invented rows"
+    for key, row in state.items():
+        assert decoded[key] == row and ids[key] is not None, f"msgpack row {key} differs"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, default=50)
+    parser.add_argument("--positions", type=int, default=200, help="positions per account")
+    parser.add_argument("--moved", type=float, default=0.3, help="share of rows whose LTP moves per delta")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    positions = book(args.accounts, args.positions)
+    rows_by_account = {account_id: with_greeks(account_id, rows) for account_id, rows in positions.items()}
+    manager = CaptureManager()
+    streamer = PositionStreamer(manager)
+    encoder = FrameEncoder(streamer.ids)
+    streamer.seed(USER, rows_by_account)
+    snapshot = streamer.snapshot_frame(USER)
+
+    tick(positions, args.moved)
+
+    async def next_delta():
+        for account_id, rows in positions.items():
+            updated = open_position_rows(account_id, rows)
+            for key, row in updated.items():
+                row.update({name: rows_by_account[account_id][key][name]
+                            for name in ("iv", "delta", "gamma", "theta", "vega")})
+            streamer.publish(USER, account_id, updated)
+        # Flush now rather than after the coalescing window
+        frame = await streamer.flush(USER)
+        for task in list(streamer._flush_tasks.values()):
+            task.cancel()
+        return frame
+
+    delta = asyncio.run(next_delta())
+
+    print(f"{args.accounts} accounts x {args.positions} positions, "
+          f"{len(delta['changed'])} rows changed in the delta, best of {args.runs}")
+
+    # REST body: FastAPI validates and dumps through the response model, then renders
+    all_rows = [row for rows in rows_by_account.values() for row in rows.values()]
+    adapter = TypeAdapter(List[PositionResponse])
+    body = adapter.dump_python(adapter.validate_python(all_rows), mode="json")
+    model_time = best_of(lambda: adapter.dump_python(adapter.validate_python(all_rows), mode="json"), args.runs)
+    stdlib_body = json.dumps(body, ensure_ascii=False, allow_nan=False, separators=(",", ":"))
+    report("rest", [
+        ("model + json", model_time + best_of(
+            lambda: json.dumps(body, ensure_ascii=False, allow_nan=False, separators=(",", ":")), args.runs),
+         len(stdlib_body.encode())),
+        ("model + orjson", model_time + best_of(lambda: dumps(body), args.runs), len(dumps(body))),
+        ("rows + orjson", best_of(lambda: dumps(project(all_rows)), args.runs), len(dumps(project(all_rows)))),
+    ])
+
+    for name, frame in (("snapshot", snapshot), ("delta", delta)):
+        report(name, [
+            ("json (send_json)", best_of(lambda: stdlib_send_json(frame), args.runs),
+             len(stdlib_send_json(frame).encode())),
+            ("orjson text", best_of(lambda: dumps_str(frame), args.runs), len(dumps(frame))),
+            ("msgpack columnar", best_of(lambda: encoder.encode(MSGPACK, USER, frame), args.runs),
+             len(encoder.encode(MSGPACK, USER, frame))),
+        ])
+
+    check_roundtrip(streamer, [snapshot, delta], encoder)
+    print("msgpack frames decode to the same rows as the JSON frames")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""Local stand-in for the Kite Connect REST API, for load tests.
+
+Serves the routes the backend calls (session token, profile, positions, orders,
+order placement, instrument dumps) in Kite's response envelope, with
+configurable latency, random failures and per-api-key rate limits that
+answer 429 the way Kite does. Every api key gets its own book of option
+positions drawn from the bundled instrument sample; last prices random-walk
+on each read so the WebSocket stream always has deltas to push.
+
+    cd backend && python benchmarks/kite_simulator.py --port 8900 --latency-ms 40 --error-rate 0.01
+    KITE_API_ROOT=http://127.0.0.1:8900 uvicorn main:app
+
+GET /_sim/stats returns request, throttle and failure counts per route.
+"""
+import argparse
+import asyncio
+import csv
+import itertools
+import os
+import random
+import sys
+import uuid
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import uvicorn  # noqa: E402
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.responses import JSONResponse, PlainTextResponse  # noqa: E402
+
+from rate_limiter import TokenBucket  # noqa: E402
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "instruments_sample.csv")
+
+
+class SimulatorConfig:
+    def __init__(self, latency_ms=30.0, jitter_ms=10.0, error_rate=0.0, order_rate=10.0,
+                 default_rate=10.0, positions_per_account=20, seed=1):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.order_rate = order_rate
+        self.default_rate = default_rate
+        self.positions_per_account = positions_per_account
+        self.seed = seed
+
+
+def load_instruments(path: str = SAMPLE):
+    with open(path) as f:
+        return list(csv.DictReader(f))
+
+
+def create_app(config: SimulatorConfig) -> FastAPI:
+    app = FastAPI(title="Kite simulator")
+    rng = random.Random(config.seed)
+    instruments = load_instruments()
+    with open(SAMPLE) as f:
+        instrument_csv = f.read()
+    order_ids = itertools.count(250000000000000)
+    books = {}
+    orders = defaultdict(list)
+    buckets = {}
+    stats = defaultdict(Counter)
+
+    def envelope(data, status_code=200):
+        return JSONResponse({"status": "success", "data": data}, status_code=status_code)
+
+    def error(error_type, message, status_code):
+        return JSONResponse({"status": "error", "error_type": error_type, "message": message},
+                            status_code=status_code)
+
+    def api_key_of(request: Request, form=None) -> str:
+        # "Authorization: token api_key:access_token"; the session call sends it in the form
+        auth = request.headers.get("authorization", "")
+        if auth.startswith("token ") and ":" in auth:
+            return auth[len("token "):].split(":", 1)[0]
+        return (form or {}).get("api_key", "")
+
+    async def gate(route: str, api_key: str, limit_class: str):
+        # Returns an error response, or None to go ahead
+        stats[route]["requests"] += 1
+        rate = config.order_rate if limit_class == "order" else config.default_rate
+        bucket = buckets.get((api_key, limit_class))
+        if bucket is None:
+            bucket = buckets[(api_key, limit_class)] = TokenBucket(rate, rate)
+        if rate > 0 and bucket.try_acquire() > 0:
+            stats[route]["throttled"] += 1
+            return error("NetworkException", "Too many requests", 429)
+        delay = max(0.0, rng.gauss(config.latency_ms, config.jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+        if rng.random() < config.error_rate:
+            stats[route]["failed"] += 1
+            return error("NetworkException", "Gateway timed out", 502)
+        return None
+
+    def book(api_key: str) -> list:
+        if api_key not in books:
+            picks = rng.sample(instruments, min(config.positions_per_account, len(instruments)))
+            positions = []
+            for instrument in picks:
+                lot = int(instrument["lot_size"])
+                quantity = rng.choice((-3, -2, -1, 1, 2, 3)) * lot
+                price = round(rng.uniform(20, 400), 2)
+                positions.append({
+                    "tradingsymbol": instrument["tradingsymbol"],
+                    "exchange": instrument["exchange"],
+                    "instrument_token": int(instrument["instrument_token"]),
+                    "product": "NRML",
+                    "quantity": quantity,
+                    "average_price": price,
+                    "last_price": price,
+                    "multiplier": 1,
+                    "buy_value": price * quantity if quantity > 0 else 0.0,
+                    "sell_value": -price * quantity if quantity < 0 else 0.0,
+                })
+            books[api_key] = positions
+        return books[api_key]
+
+    def tick(positions: list):
+        for pos in positions:
+            pos["last_price"] = round(max(0.05, pos["last_price"] * (1 + rng.gauss(0, 0.002))), 2)
+            pos["pnl"] = pos["sell_value"] - pos["buy_value"] + pos["quantity"] * pos["last_price"]
+
+    @app.post("/session/token")
+    async def session_token(request: Request):
+        form = dict(await request.form())
+        api_key = form.get("api_key", "")
+        failed = await gate("session.token", api_key, "default")
+        if failed:
+            return failed
+        return envelope({
+            "user_id": f"SIM{api_key[-4:]}",
+            "access_token": f"sim-{uuid.uuid4().hex}",
+            "public_token": uuid.uuid4().hex[:16],
+            "login_time": "2025-01-30 09:15:00",
+        })
+
+    @app.get("/user/profile")
+    async def profile(request: Request):
+        api_key = api_key_of(request)
+        failed = await gate("user.profile", api_key, "default")
+        if failed:
+            return failed
+        return envelope({"user_id": f"SIM{api_key[-4:]}", "user_name": "Simulated user", "broker": "ZERODHA"})
+
+    @app.get("/portfolio/positions")
+    async def positions(request: Request):
+        api_key = api_key_of(request)
+        failed = await gate("portfolio.positions", api_key, "default")
+        if failed:
+            return failed
+        net = book(api_key)
+        tick(net)
+        return envelope({"net": net, "day": []})
+
+    @app.get("/orders")
+    async def list_orders(request: Request):
+        api_key = api_key_of(request)
+        failed = await gate("orders", api_key, "default")
+        if failed:
+            return failed
+        return envelope(orders[api_key])
+
+    @app.post("/orders/{variety}")
+    async def place_order(variety: str, request: Request):
+        form = dict(await request.form())
+        api_key = api_key_of(request)
+        failed = await gate("order.place", api_key, "order")
+        if failed:
+            return failed
+        order_id = str(next(order_ids))
+        orders[api_key].append({
+            "order_id": order_id,
+            "variety": variety,
+            "status": "COMPLETE",
+            "tradingsymbol": form.get("tradingsymbol"),
+            "exchange": form.get("exchange"),
+            "transaction_type": form.get("transaction_type"),
+            "quantity": int(form.get("quantity", 0)),
+            "product": form.get("product"),
+            "order_type": form.get("order_type"),
+            "tag": form.get("tag"),
+            "tags": [form["tag"]] if form.get("tag") else [],
+        })
+        return envelope({"order_id": order_id})
+
+    @app.get("/instruments/{exchange}")
+    async def instrument_dump(exchange: str):
+        stats["instruments"]["requests"] += 1
+        header, *rows = instrument_csv.splitlines()
+        body = "\n".join([header] + [row for row in rows if row.endswith("," + exchange)]) + "\n"
+        return PlainTextResponse(body, media_type="text/csv")
+
+    @app.get("/_sim/stats")
+    async def sim_stats():
+        return {route: dict(counts) for route, counts in stats.items()}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="mean response latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="latency standard deviation")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with a 502")
+    parser.add_argument("--order-rate", type=float, default=10.0, help="orders per second per api key (0 = unlimited)")
+    parser.add_argument("--default-rate", type=float, default=10.0, help="other calls per second per api key")
+    parser.add_argument("--positions", type=int, default=20, help="open positions per account")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    config = SimulatorConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        order_rate=args.order_rate, default_rate=args.default_rate,
+        positions_per_account=args.positions, seed=args.seed
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
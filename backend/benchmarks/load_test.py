@@ -0,0 +1,412 @@
+"""End-to-end load test: the API against the local Kite simulator.
+
+Starts ``kite_simulator.py`` and the app under uvicorn (SQLite by default, or
+any ``--database-url`` such as a local Postgres; Redis must be reachable at
+``--redis-url``), onboards N users x M accounts through the public API, then
+runs the scenarios in turn:
+
+    positions  every user polls GET /api/positions for --duration seconds
+    orders     each user fires --burst concurrent /api/orders/place requests,
+               every one across all of that user's accounts
+    websocket  W clients hold /ws/positions open for --duration seconds,
+               timing connect-to-snapshot and counting delta frames
+               (--ws-format msgpack asks for the binary columnar frames)
+
+Throughput, latency percentiles and error counts go to stdout and, with
+``--out``, to a JSON report. ``--baseline`` compares the run against an
+earlier report and exits non-zero if any scenario regressed past
+``--tolerance``; ``--save-baseline`` writes the run as the new baseline.
+
+    cd backend && python benchmarks/load_test.py --users 10 --accounts 5 --ws-clients 50 \\
+        --save-baseline benchmarks/baselines/local.json
+    cd backend && python benchmarks/load_test.py --baseline benchmarks/baselines/local.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import msgpack
+import requests
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serialization import decode_columnar  # noqa: E402
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIMULATOR = os.path.join(BACKEND, "benchmarks", "kite_simulator.py")
+SAMPLE = os.path.join(BACKEND, "data", "instruments_sample.csv")
+
+# Contract from the bundled instrument sample
+ORDER = {
+    "index": "NIFTY", "expiry": "2025-01-30", "strike": "23500", "option_type": "CE",
+    "lots": 1, "transaction_type": "BUY", "product": "NRML", "order_type": "MARKET",
+}
+
+# (metric, direction): higher latency or lower throughput is a regression
+COMPARED = (("p50_ms", 1), ("p99_ms", 1), ("rps", -1))
+
+
+# ========== Processes ==========
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"{url} process exited with {process.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return
+        except OSError:
+            time.sleep(0.05)
+    sys.exit(f"{url} did not come up within {timeout}s")
+
+
+def start_simulator(args, port: int) -> subprocess.Popen:
+    process = subprocess.Popen([
+        sys.executable, SIMULATOR, "--port", str(port),
+        "--latency-ms", str(args.kite_latency_ms), "--jitter-ms", str(args.kite_jitter_ms),
+        "--error-rate", str(args.kite_error_rate), "--order-rate", str(args.kite_order_rate),
+        "--default-rate", str(args.kite_default_rate), "--positions", str(args.positions),
+    ], cwd=BACKEND)
+    wait_for(f"http://127.0.0.1:{port}/_sim/stats", process)
+    return process
+
+
+def start_app(args, port: int, kite_port: int, workdir: str) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(workdir, 'load.db')}",
+        "REDIS_URL": args.redis_url,
+        "KITE_API_ROOT": f"http://127.0.0.1:{kite_port}",
+        "INSTRUMENTS_SOURCE": SAMPLE,
+        "INSTRUMENTS_CACHE_DIR": os.path.join(workdir, "instruments"),
+        "MARKET_DATA_ENABLED": "False",
+        "POSITIONS_REFRESH_INTERVAL": str(args.refresh_interval),
+        # The simulator's limits are the ones under test
+        "RATE_LIMIT_ORDERS": str(args.kite_order_rate or 1000),
+        "RATE_LIMIT_DEFAULT": str(args.kite_default_rate or 1000),
+        "WS_FANOUT": "True" if args.workers > 1 else env.get("WS_FANOUT", "False"),
+    })
+    # Same schema path as a deploy
+    subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"], cwd=BACKEND, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    process = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+        "--workers", str(args.workers), "--log-level", "warning",
+    ], cwd=BACKEND, env=env)
+    wait_for(f"http://127.0.0.1:{port}/health", process)
+    return process
+
+
+# ========== Measurements ==========
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.errors = 0
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def observe(self, seconds: float, ok: bool):
+        with self._lock:
+            self.latencies.append(seconds * 1000)
+            if not ok:
+                self.errors += 1
+
+    def summary(self, **extra) -> dict:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        ordered = sorted(self.latencies)
+
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 2) if ordered else None
+
+        return {
+            "requests": len(ordered),
+            "errors": self.errors,
+            "error_rate": round(self.errors / len(ordered), 4) if ordered else 0.0,
+            "rps": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+            "p50_ms": pct(50), "p90_ms": pct(90), "p99_ms": pct(99), "max_ms": pct(100),
+            **extra,
+        }
+
+
+def timed(recorder: Recorder, fn, *args, **kwargs):
+    started = time.perf_counter()
+    try:
+        response = fn(*args, **kwargs)
+        ok = response.status_code < 400
+    except requests.RequestException:
+        response, ok = None, False
+    recorder.observe(time.perf_counter() - started, ok)
+    return response
+
+
+# ========== Setup ==========
+def onboard(base: str, users: int, accounts: int, run_id: str) -> list:
+    """Registers users, adds and logs in their accounts; returns (token, account_ids) per user."""
+
+    def one(u):
+        http = requests.Session()
+        email = f"load-{run_id}-{u}@example.com"
+        http.post(f"{base}/api/auth/register", json={"email": email, "password": "load-test"}).raise_for_status()
+        login = http.post(f"{base}/api/auth/login", json={"email": email, "password": "load-test"})
+        login.raise_for_status()
+        token = login.json()["access_token"]
+        http.headers["Authorization"] = f"Bearer {token}"
+        created = http.post(f"{base}/api/accounts/bulk", json={"accounts": [
+            {"nickname": f"acct{a}", "api_key": f"key{run_id}{u}x{a}", "api_secret": "secret"}
+            for a in range(accounts)
+        ]})
+        created.raise_for_status()
+        account_ids = [account["id"] for account in created.json()]
+        refreshed = http.post(f"{base}/api/accounts/set-tokens", json={"tokens": [
+            {"account_id": account_id, "request_token": "sim"} for account_id in account_ids
+        ]})
+        refreshed.raise_for_status()
+        readiness = refreshed.json()["readiness"]
+        if readiness["ready"] != len(account_ids):
+            raise RuntimeError(f"only {readiness['ready']}/{len(account_ids)} accounts logged in")
+        return token, account_ids
+
+    with ThreadPoolExecutor(max_workers=min(16, users)) as pool:
+        return list(pool.map(one, range(users)))
+
+
+# ========== Scenarios ==========
+def run_positions(base: str, sessions: list, duration: float) -> dict:
+    recorder = Recorder()
+    deadline = time.monotonic() + duration
+
+    def poll(token):
+        http = requests.Session()
+        http.headers["Authorization"] = f"Bearer {token}"
+        while time.monotonic() < deadline:
+            timed(recorder, http.get, f"{base}/api/positions")
+
+    with ThreadPoolExecutor(max_workers=len(sessions)) as pool:
+        list(pool.map(poll, [token for token, _ in sessions]))
+    recorder.finished = time.perf_counter()
+    return recorder.summary()
+
+
+def run_orders(base: str, sessions: list, burst: int) -> dict:
+    recorder = Recorder()
+    placed = failed = 0
+    lock = threading.Lock()
+
+    def place(job):
+        nonlocal placed, failed
+        token, account_ids = job
+        response = timed(
+            recorder, requests.post, f"{base}/api/orders/place",
+            json={**ORDER, "account_ids": account_ids},
+            headers={"Authorization": f"Bearer {token}", "Idempotency-Key": uuid.uuid4().hex},
+        )
+        if response is not None and response.status_code == 200:
+            orders = response.json()["orders"]
+            with lock:
+                placed += sum(1 for order in orders if order.get("success"))
+                failed += sum(1 for order in orders if not order.get("success"))
+
+    jobs = [session for session in sessions for _ in range(burst)]
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        list(pool.map(place, jobs))
+    recorder.finished = time.perf_counter()
+    return recorder.summary(account_orders_placed=placed, account_orders_failed=failed)
+
+
+def run_websocket(base: str, sessions: list, clients: int, duration: float, wire: str = "json") -> dict:
+    recorder = Recorder()
+    frames = {"snapshot": 0, "delta": 0}
+    frame_bytes = 0
+    dropped = 0
+    ws_base = base.replace("http://", "ws://")
+    subprotocols = ["zap.msgpack.v1"] if wire == "msgpack" else None
+
+    async def client(token):
+        nonlocal dropped, frame_bytes
+        started = time.perf_counter()
+        try:
+            async with websockets.connect(f"{ws_base}/ws/positions?token={token}", max_size=None,
+                                          subprotocols=subprotocols) as ws:
+                if subprotocols and ws.subprotocol not in subprotocols:
+                    raise RuntimeError(f"server did not accept {subprotocols[0]}")
+                known = None
+                first = True
+                end = time.monotonic() + duration
+                while time.monotonic() < end:
+                    try:
+                        message = await asyncio.wait_for(ws.recv(), max(0.01, end - time.monotonic()))
+                    except asyncio.TimeoutError:
+                        break
+                    frame_bytes += len(message)
+                    if isinstance(message, bytes):
+                        kind = msgpack.unpackb(message, raw=False, strict_map_key=False)["type"]
+                        known = decode_columnar(message, known)
+                    else:
+                        kind = json.loads(message).get("type", "other")
+                    frames[kind] = frames.get(kind, 0) + 1
+                    if first:
+                        recorder.observe(time.perf_counter() - started, True)
+                        first = False
+                if first:
+                    recorder.observe(time.perf_counter() - started, False)
+        except websockets.ConnectionClosed:
+            dropped += 1
+        except OSError:
+            recorder.observe(time.perf_counter() - started, False)
+
+    async def run_all():
+        tokens = [sessions[i % len(sessions)][0] for i in range(clients)]
+        await asyncio.gather(*(client(token) for token in tokens))
+
+    asyncio.run(run_all())
+    recorder.finished = time.perf_counter()
+    summary = recorder.summary(
+        clients=clients, dropped=dropped, deltas=frames["delta"],
+        deltas_per_client_s=round(frames["delta"] / (clients * duration), 2) if clients and duration else 0.0,
+        wire=wire, bytes_per_frame=round(frame_bytes / max(1, sum(frames.values())))
+    )
+    # Latency here is connect-to-snapshot; rps would only restate the client count
+    summary["rps"] = None
+    return summary
+
+
+# ========== Baselines ==========
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, current in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for metric, direction in COMPARED:
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if change * direction > tolerance:
+                regressions.append(f"{name}.{metric}: {old} -> {new} ({change:+.0%})")
+        if current.get("error_rate", 0) > previous.get("error_rate", 0) + 0.01:
+            regressions.append(f"{name}.error_rate: {previous.get('error_rate')} -> {current['error_rate']}")
+    return regressions
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND,
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--accounts", type=int, default=5, help="accounts per user")
+    parser.add_argument("--positions", type=int, default=20, help="open positions per account")
+    parser.add_argument("--ws-clients", type=int, default=50)
+    parser.add_argument("--ws-format", choices=("json", "msgpack"), default="json", help="WebSocket frame format")
+    parser.add_argument("--burst", type=int, default=3, help="concurrent order requests per user")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds per timed scenario")
+    parser.add_argument("--scenarios", default="positions,orders,websocket")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers (>1 turns on WS_FANOUT)")
+    parser.add_argument("--refresh-interval", type=float, default=1.0)
+    parser.add_argument("--database-url", default="", help="default: a fresh SQLite file")
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument("--kite-latency-ms", type=float, default=30.0)
+    parser.add_argument("--kite-jitter-ms", type=float, default=10.0)
+    parser.add_argument("--kite-error-rate", type=float, default=0.0)
+    parser.add_argument("--kite-order-rate", type=float, default=10.0)
+    parser.add_argument("--kite-default-rate", type=float, default=10.0)
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--save-baseline", help="write this run as a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    run_id = uuid.uuid4().hex[:8]
+    kite_port, app_port = free_port(), free_port()
+    base = f"http://127.0.0.1:{app_port}"
+
+    with tempfile.TemporaryDirectory(prefix="zap-load-") as workdir:
+        simulator = start_simulator(args, kite_port)
+        app = start_app(args, app_port, kite_port, workdir)
+        try:
+            started = time.perf_counter()
+            sessions = onboard(base, args.users, args.accounts, run_id)
+            print(f"onboarded {args.users} users x {args.accounts} accounts in {time.perf_counter() - started:.1f}s")
+            # Let the refresher take its first snapshots
+            time.sleep(args.refresh_interval * 2)
+
+            results = {}
+            if "positions" in scenarios:
+                results["positions"] = run_positions(base, sessions, args.duration)
+            if "orders" in scenarios:
+                results["orders"] = run_orders(base, sessions, args.burst)
+            if "websocket" in scenarios:
+                results["websocket"] = run_websocket(base, sessions, args.ws_clients, args.duration, args.ws_format)
+            kite_stats = requests.get(f"http://127.0.0.1:{kite_port}/_sim/stats").json()
+        finally:
+            app.terminate()
+            simulator.terminate()
+            app.wait()
+            simulator.wait()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "database": "postgres" if args.database_url.startswith("postgres") else "sqlite",
+            **{key: value for key, value in vars(args).items()
+               if key not in ("out", "baseline", "save_baseline", "database_url", "redis_url")},
+        },
+        "scenarios": results,
+        "kite": kite_stats,
+    }
+
+    print(f"{'scenario':<10} {'requests':>8} {'errors':>6} {'rps':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")
+    for name, row in results.items():
+        print(f"{name:<10} {row['requests']:>8} {row['errors']:>6} {str(row['rps']):>8} {str(row['p50_ms']):>8} "
+              f"{str(row['p90_ms']):>8} {str(row['p99_ms']):>8} {str(row['max_ms']):>8}")
+    if "websocket" in results:
+        row = results["websocket"]
+        print(f"websocket: {row['clients']} clients, {row['deltas']} deltas "
+              f"({row['deltas_per_client_s']}/client/s), {row['dropped']} dropped, "
+              f"{row['bytes_per_frame']} bytes/frame ({row['wire']})")
+    for path in filter(None, (args.out, args.save_baseline)):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("regressions against", args.baseline)
+            for line in regressions:
+                print("  " + line)
+            sys.exit(1)
+        print(f"no regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
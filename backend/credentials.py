@@ -0,0 +1,209 @@
+import asyncio
+import base64
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from sqlalchemy import and_, bindparam, update
+
+from metrics import CREDENTIAL_LOOKUPS, count_error
+from models import ZerodhaAccount
+
+logger = logging.getLogger(__name__)
+
+# Encrypted ZerodhaAccount columns the vault may rotate
+FIELDS = ("access_token", "api_secret_enc", "zerodha_user_id_enc", "zerodha_password_enc")
+
+
+def legacy_key(secret: str) -> bytes:
+    # The key credentials were first encrypted with, derived from JWT_SECRET
+    return base64.urlsafe_b64encode(secret.encode()[:32].ljust(32, b'0'))
+
+
+def parse_keys(value: str, fallback: str) -> List[bytes]:
+    """CREDENTIAL_KEYS (newest first) followed by the legacy key, without duplicates."""
+    keys = [key.strip().encode() for key in value.split(",") if key.strip()]
+    legacy = legacy_key(fallback)
+    if legacy not in keys:
+        keys.append(legacy)
+    return keys
+
+
+@dataclass
+class _Secret:
+    ciphertext: str
+    plaintext: bytearray
+    created_at: float
+
+    def wipe(self) -> None:
+        # Same-length slice assignment overwrites the buffer in place
+        self.plaintext[:] = bytes(len(self.plaintext))
+
+
+# ========== Credential Vault ==========
+class CredentialVault:
+    """Encrypts account credentials and keeps decrypted copies for reuse.
+
+    The first key encrypts, every key decrypts (``MultiFernet``), so a new key
+    goes live by putting it in front of CREDENTIAL_KEYS. Plaintexts are cached
+    per (account, column) for as long as the stored ciphertext is unchanged
+    and younger than ``ttl``, which makes it one HMAC check and AES decrypt per
+    token lifetime instead of one per request. The cache is an LRU of at most
+    ``max_size`` entries; entries are zeroed when evicted, replaced or
+    forgotten. Callers get a fresh ``str``, which Python cannot wipe.
+
+    Values still under an older key are re-encrypted with the newest one the
+    first time they are read, and a background task writes them back in
+    batches. The table moves to the new key as accounts are used, without a
+    re-encrypt pass at startup.
+    """
+
+    def __init__(
+        self,
+        keys: List[bytes],
+        session_factory: Optional[Callable] = None,
+        max_size: int = 1024,
+        ttl: float = 86400,
+        rotate_interval: float = 30,
+    ):
+        if not keys:
+            raise ValueError("CredentialVault needs at least one key")
+        fernets = [Fernet(key) for key in keys]
+        self._primary = fernets[0]
+        self._fernet = MultiFernet(fernets)
+        self.session_factory = session_factory
+        self.max_size = max_size
+        self.ttl = ttl
+        self.rotate_interval = rotate_interval
+        self._entries: "OrderedDict[Tuple[int, str], _Secret]" = OrderedDict()
+        self._rotations: Dict[Tuple[int, str], Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def encrypt(self, plaintext: str) -> str:
+        return self._primary.encrypt(plaintext.encode()).decode()
+
+    def _decrypt(self, ciphertext: str) -> Tuple[bytes, bool]:
+        # (plaintext, whether it was under an older key)
+        token = ciphertext.encode()
+        try:
+            return self._primary.decrypt(token), False
+        except InvalidToken:
+            return self._fernet.decrypt(token), True
+
+    def decrypt(self, ciphertext: str) -> str:
+        # Uncached, for values not tied to an account row
+        return self._decrypt(ciphertext)[0].decode()
+
+    def reveal(self, account_id: int, field: str, ciphertext: str) -> str:
+        """Plaintext of ``ciphertext``, the stored value of ``field`` for the account."""
+        key = (account_id, field)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.ciphertext == ciphertext and now - entry.created_at < self.ttl:
+                self._entries.move_to_end(key)
+                CREDENTIAL_LOOKUPS.labels("hit").inc()
+                return entry.plaintext.decode()
+
+        plaintext, stale_key = self._decrypt(ciphertext)
+        CREDENTIAL_LOOKUPS.labels("miss").inc()
+        entry = _Secret(ciphertext=ciphertext, plaintext=bytearray(plaintext), created_at=now)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                previous.wipe()
+            self._entries[key] = entry
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)[1].wipe()
+            if stale_key and field in FIELDS:
+                self._rotations[key] = (ciphertext, self._primary.encrypt(plaintext).decode())
+        return entry.plaintext.decode()
+
+    def forget(self, account_id: int) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == account_id]:
+                self._entries.pop(key).wipe()
+            for key in [key for key in self._rotations if key[0] == account_id]:
+                del self._rotations[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            for entry in self._entries.values():
+                entry.wipe()
+            self._entries.clear()
+
+    # ----- Lazy key rotation -----
+    def pending_rotations(self) -> int:
+        with self._lock:
+            return len(self._rotations)
+
+    def _write_rotations(self, rotations: Dict[Tuple[int, str], Tuple[str, str]]) -> int:
+        by_field: Dict[str, List[dict]] = {}
+        for (account_id, field), (old, new) in rotations.items():
+            by_field.setdefault(field, []).append({"b_id": account_id, "b_old": old, "b_new": new})
+
+        accounts = ZerodhaAccount.__table__
+        db = self.session_factory()
+        try:
+            for field, rows in by_field.items():
+                # Only rows that still hold the value we read, so a fresh login is never overwritten
+                statement = update(accounts).where(and_(
+                    accounts.c.id == bindparam("b_id"),
+                    accounts.c[field] == bindparam("b_old")
+                )).values({field: bindparam("b_new")})
+                db.execute(statement, rows)
+            db.commit()
+        finally:
+            db.close()
+        return len(rotations)
+
+    async def rotate_pending(self) -> int:
+        with self._lock:
+            rotations, self._rotations = self._rotations, {}
+        if not rotations:
+            return 0
+        try:
+            return await asyncio.to_thread(self._write_rotations, rotations)
+        except Exception:
+            # Put them back for the next cycle unless something newer was queued
+            with self._lock:
+                for key, value in rotations.items():
+                    self._rotations.setdefault(key, value)
+            raise
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.rotate_interval)
+            try:
+                rotated = await self.rotate_pending()
+                if rotated:
+                    logger.info("Re-encrypted %d credentials with the current key", rotated)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                count_error("credential_rotation", e)
+                logger.exception("Credential rotation failed")
+
+    def start(self) -> None:
+        if self._task is None and self.session_factory is not None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.session_factory is not None:
+            try:
+                await self.rotate_pending()
+            except Exception as e:
+                count_error("credential_rotation", e)
+        self.clear()
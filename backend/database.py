@@ -1,17 +1,131 @@
-from sqlalchemy import create_engine
+import asyncio
+import threading
+import time
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from config import settings
 
+# ========== Pool Instrumentation ==========
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def observe_wait(self, seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def checked_out(self):
+        with self._lock:
+            self.in_use += 1
+
+    def checked_in(self):
+        with self._lock:
+            self.in_use -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_use": self.in_use,
+                "checkouts": self.checkouts,
+                "wait_avg_ms": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3)
+            }
+
+pool_metrics = PoolMetrics()
+
+class InstrumentedQueuePool(QueuePool):
+    # Time spent waiting for a free connection (or opening a new one)
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_metrics.observe_wait(time.perf_counter() - started)
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_metrics.observe_wait(time.perf_counter() - started)
+
+def _pool_kwargs(url: str, poolclass) -> dict:
+    if url.startswith("sqlite"):
+        return {"connect_args": {"check_same_thread": False}}
+    return {
+        "poolclass": poolclass,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+    }
+
+def _track_in_use(sync_engine):
+    event.listen(sync_engine, "checkout", lambda *args: pool_metrics.checked_out())
+    event.listen(sync_engine, "checkin", lambda *args: pool_metrics.checked_in())
+
+def async_database_url(url: str) -> str:
+    # Same database, async driver
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    if url.startswith("postgresql://"):
+        return "postgresql+asyncpg://" + url[len("postgresql://"):]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
 # Create database engine
-engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
+engine = create_engine(
+    settings.DATABASE_URL,
+    pool_pre_ping=True,
+    **_pool_kwargs(settings.DATABASE_URL, InstrumentedQueuePool)
+)
+_track_in_use(engine)
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Optional async engine (asyncpg / aiosqlite) for the hot request paths
+async_engine = None
+AsyncSessionLocal = None
+if settings.DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    async_url = async_database_url(settings.DATABASE_URL)
+    async_engine = create_async_engine(
+        async_url,
+        pool_pre_ping=True,
+        **_pool_kwargs(async_url, InstrumentedAsyncQueuePool)
+    )
+    _track_in_use(async_engine.sync_engine)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Create Base class for models
 Base = declarative_base()
 
+def warm_database(connections: int = 1, create_all: bool = False):
+    """Open ``connections`` pooled connections up front, creating tables first if asked."""
+    if create_all:
+        Base.metadata.create_all(bind=engine)
+    opened = []
+    try:
+        for _ in range(max(1, connections)):
+            conn = engine.connect()
+            opened.append(conn)
+            conn.exec_driver_sql("SELECT 1")
+    finally:
+        for conn in opened:
+            conn.close()
+
 # Dependency to get database session
 def get_db():
     db = SessionLocal()
@@ -19,3 +133,23 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def _run_with_session(fn, *args):
+    db = SessionLocal(expire_on_commit=False)
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+async def run_db(fn, *args):
+    """Run ``fn(session, *args)`` without blocking the event loop.
+
+    With DB_ASYNC the function runs on the async engine through
+    ``AsyncSession.run_sync``; otherwise it runs in a worker thread on a
+    regular session. Either way ``fn`` is plain sync SQLAlchemy code and must
+    commit its own writes.
+    """
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as session:
+            return await session.run_sync(fn, *args)
+    return await asyncio.to_thread(_run_with_session, fn, *args)
@@ -0,0 +1,63 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, List, Optional
+from concurrent.futures import Executor
+
+
+# ========== Concurrent Fan-out ==========
+@dataclass
+class DispatchResult:
+    item: Any
+    value: Any = None
+    error: Optional[BaseException] = None
+    timed_out: bool = False
+    started_at: float = 0.0
+    finished_at: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and not self.timed_out
+
+    @property
+    def elapsed(self) -> float:
+        return self.finished_at - self.started_at
+
+
+async def fan_out(
+    items: Iterable[Any],
+    worker: Callable[[Any], Any],
+    max_concurrency: int = 20,
+    timeout: Optional[float] = None,
+    executor: Optional[Executor] = None,
+) -> List[DispatchResult]:
+    """Run ``worker`` once per item in parallel.
+
+    A plain function runs on ``executor`` threads; a coroutine function is
+    awaited directly (it does its own offloading). At most ``max_concurrency``
+    workers run at once and each one gets its own ``timeout``. Results come
+    back in the same order as ``items``; failures and timeouts are captured on
+    the result rather than raised.
+    """
+    loop = asyncio.get_running_loop()
+    is_async = asyncio.iscoroutinefunction(worker)
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run_one(item: Any) -> DispatchResult:
+        async with semaphore:
+            result = DispatchResult(item=item, started_at=time.perf_counter())
+            try:
+                if is_async:
+                    future = worker(item)
+                else:
+                    future = loop.run_in_executor(executor, worker, item)
+                result.value = await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                # A running thread cannot be cancelled, so the broker call may still land
+                result.timed_out = True
+            except Exception as e:
+                result.error = e
+            result.finished_at = time.perf_counter()
+            return result
+
+    return await asyncio.gather(*(run_one(item) for item in items))
@@ -0,0 +1,72 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+
+class ExecutorSaturated(RuntimeError):
+    pass
+
+
+# ========== Bounded Thread Pools ==========
+class BoundedExecutor(Executor):
+    """Thread pool with a hard cap on queued work and live load counters.
+
+    Blocking calls (broker HTTP, bcrypt) go through one of these instead of
+    running on the event loop. Once ``max_queue`` tasks are already waiting
+    for a worker, new submissions fail fast with ``ExecutorSaturated``.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._rejected = 0
+
+    def _track(self, fn: Callable, args, kwargs) -> Any:
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._completed += 1
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self._rejected += 1
+                raise ExecutorSaturated(f"{self.name} pool saturated ({self._queued} queued)")
+            self._queued += 1
+        try:
+            return self._pool.submit(self._track, fn, args, kwargs)
+        except Exception:
+            with self._lock:
+                self._queued -= 1
+            raise
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self, functools.partial(fn, *args, **kwargs))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "active": self._active,
+                "queued": self._queued,
+                "saturation": round(self._active / self.max_workers, 3),
+                "completed": self._completed,
+                "rejected": self._rejected
+            }
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        self._pool.shutdown(wait=wait, cancel_futures=cancel_futures)
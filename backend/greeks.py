@@ -0,0 +1,257 @@
+import time
+from dataclasses import dataclass
+from datetime import datetime, time as dt_time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from instruments import IST, UNDERLYING_TOKENS
+from user_cache import TTLCache
+
+SECONDS_PER_YEAR = 365 * 24 * 3600
+MARKET_CLOSE = dt_time(15, 30)
+GREEK_FIELDS = ("delta", "gamma", "theta", "vega")
+
+# Abramowitz & Stegun 26.2.17, |error| < 7.5e-8
+_P = 0.2316419
+_B = (0.319381530, -0.356563782, 1.781477937, -1.821255978, 1.330274429)
+_INV_SQRT_2PI = 1 / np.sqrt(2 * np.pi)
+
+
+# ========== Black-Scholes ==========
+def norm_pdf(x: np.ndarray) -> np.ndarray:
+    return _INV_SQRT_2PI * np.exp(-0.5 * x * x)
+
+
+def norm_cdf(x: np.ndarray) -> np.ndarray:
+    t = 1.0 / (1.0 + _P * np.abs(x))
+    poly = t * (_B[0] + t * (_B[1] + t * (_B[2] + t * (_B[3] + t * _B[4]))))
+    upper = 1.0 - norm_pdf(x) * poly
+    return np.where(x >= 0, upper, 1.0 - upper)
+
+
+def _d1_d2(spot, strike, t, rate, sigma):
+    vol_t = sigma * np.sqrt(t)
+    d1 = (np.log(spot / strike) + (rate + 0.5 * sigma * sigma) * t) / vol_t
+    return d1, d1 - vol_t
+
+
+def bs_price(spot, strike, t, rate, sigma, kind) -> np.ndarray:
+    """European price; ``kind`` is +1 for calls and -1 for puts."""
+    d1, d2 = _d1_d2(spot, strike, t, rate, sigma)
+    discount = np.exp(-rate * t)
+    return kind * (spot * norm_cdf(kind * d1) - strike * discount * norm_cdf(kind * d2))
+
+
+def bs_greeks(spot, strike, t, rate, sigma, kind) -> Dict[str, np.ndarray]:
+    """Per-unit delta, gamma, theta (per day) and vega (per 1 vol point)."""
+    d1, d2 = _d1_d2(spot, strike, t, rate, sigma)
+    pdf = norm_pdf(d1)
+    sqrt_t = np.sqrt(t)
+    discount = np.exp(-rate * t)
+    return {
+        "delta": np.where(kind > 0, norm_cdf(d1), norm_cdf(d1) - 1.0),
+        "gamma": pdf / (spot * sigma * sqrt_t),
+        "theta": (-spot * pdf * sigma / (2 * sqrt_t) - kind * rate * strike * discount * norm_cdf(kind * d2)) / 365,
+        "vega": spot * pdf * sqrt_t / 100,
+    }
+
+
+def implied_vol(price, spot, strike, t, rate, kind, tol: float = 1e-6, max_iter: int = 50,
+                low: float = 1e-4, high: float = 5.0) -> np.ndarray:
+    """Batched Newton solve for volatility, bracketed so it never diverges.
+
+    Every row keeps a [low, high] bracket that tightens with each price
+    evaluation; a Newton step that leaves the bracket (or has no vega to
+    work with) is replaced by bisection. Only unconverged rows are priced on
+    each pass. Prices outside the no-arbitrage bounds come back as NaN.
+    """
+    price, spot, strike, t, kind = (np.asarray(a, dtype=np.float64) for a in (price, spot, strike, t, kind))
+    n = len(price)
+    sigma = np.full(n, np.nan)
+    discount = np.exp(-rate * t)
+    forward_value = spot - strike * discount
+    intrinsic = np.maximum(kind * forward_value, 0.0)
+    upper_bound = np.where(kind > 0, spot, strike * discount)
+    solvable = (t > 0) & (spot > 0) & (strike > 0) & (price > intrinsic) & (price < upper_bound)
+
+    # In-the-money legs are solved as their out-of-the-money twin via put-call
+    # parity (same volatility): nearly all of an ITM price is intrinsic, which
+    # leaves too little time value to pin the volatility down
+    itm = kind * forward_value > 0
+    price = np.where(itm, price - kind * forward_value, price)
+    kind = np.where(itm, -kind, kind)
+
+    idx = np.flatnonzero(solvable)
+    # Brenner-Subrahmanyam start, kept inside the bracket
+    guess = np.sqrt(2 * np.pi / t[idx]) * price[idx] / spot[idx]
+    current = np.clip(guess, 0.05, 2.0)
+    lo = np.full(len(idx), low)
+    hi = np.full(len(idx), high)
+
+    for _ in range(max_iter):
+        if not len(idx):
+            break
+        s, k, tt, kd, target = spot[idx], strike[idx], t[idx], kind[idx], price[idx]
+        d1, d2 = _d1_d2(s, k, tt, rate, current)
+        diff = kd * (s * norm_cdf(kd * d1) - k * discount[idx] * norm_cdf(kd * d2)) - target
+        done = np.abs(diff) < tol * np.maximum(1.0, target)
+        sigma[idx[done]] = current[done]
+
+        hi = np.where(diff > 0, current, hi)
+        lo = np.where(diff < 0, current, lo)
+        vega = s * norm_pdf(d1) * np.sqrt(tt)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = current - diff / vega
+        bisect = ~np.isfinite(step) | (step <= lo) | (step >= hi)
+        current = np.where(bisect, 0.5 * (lo + hi), step)
+
+        keep = ~done
+        idx, current, lo, hi = idx[keep], current[keep], lo[keep], hi[keep]
+    if len(idx):
+        # Out of iterations: accept rows whose bracket has already closed in
+        sigma[idx] = np.where(hi - lo < 1e-4, current, np.nan)
+    return sigma
+
+
+def years_to_expiry(expiry: str, now: Optional[float] = None) -> float:
+    # Contracts expire at the 15:30 IST close of their expiry day
+    close = datetime.combine(datetime.fromisoformat(expiry).date(), MARKET_CLOSE, IST)
+    now = time.time() if now is None else now
+    return max(close.timestamp() - now, 60.0) / SECONDS_PER_YEAR
+
+
+@dataclass(frozen=True)
+class LegGreeks:
+    # Per unit of the option
+    iv: Optional[float]
+    delta: Optional[float]
+    gamma: Optional[float]
+    theta: Optional[float]
+    vega: Optional[float]
+
+
+NO_GREEKS = LegGreeks(None, None, None, None, None)
+
+
+def _clean(value: float) -> Optional[float]:
+    return None if value != value else float(value)
+
+
+# ========== Greeks Service ==========
+class GreeksService:
+    """IV and Greeks for every open option leg, solved in one batch per call.
+
+    Results are cached per (instrument, LTP bucket, spot bucket) for ``ttl``
+    seconds, so the same contract held across many accounts (or re-published
+    on every tick) is solved once. Spot comes from the index ticks in the LTP
+    book; legs without a spot or outside today's master get no Greeks.
+    """
+
+    def __init__(
+        self,
+        instruments,
+        ltp_book,
+        risk_free_rate: float = 0.065,
+        ltp_bucket: float = 0.05,
+        spot_bucket: float = 1.0,
+        ttl: float = 30.0,
+        max_size: int = 50000,
+        underlying_tokens: Dict[str, int] = UNDERLYING_TOKENS,
+    ):
+        self.instruments = instruments
+        self.ltp_book = ltp_book
+        self.risk_free_rate = risk_free_rate
+        self.ltp_bucket = ltp_bucket
+        self.spot_bucket = spot_bucket
+        self.underlying_tokens = underlying_tokens
+        self._cache = TTLCache(ttl, max_size)
+        self._contracts: Dict[int, Optional[Tuple[str, str, float, int]]] = {}
+        self._years: Dict[str, Tuple[float, float]] = {}
+
+    def _contract(self, token: int) -> Optional[Tuple[str, str, float, int]]:
+        # (underlying, expiry, strike, +1 call / -1 put), once per token
+        if token in self._contracts:
+            return self._contracts[token]
+        if not self.instruments.loaded:
+            return None
+        instrument = self.instruments.by_token(token)
+        contract = None
+        if instrument is not None and instrument.option_type in ("CE", "PE"):
+            contract = (instrument.name, instrument.expiry, instrument.strike,
+                        1 if instrument.option_type == "CE" else -1)
+        self._contracts[token] = contract
+        return contract
+
+    def _time_to_expiry(self, expiry: str, now: float) -> float:
+        # Recomputed at most once a second per expiry
+        cached = self._years.get(expiry)
+        if cached is None or now - cached[0] >= 1.0:
+            cached = (now, years_to_expiry(expiry, now))
+            self._years[expiry] = cached
+        return cached[1]
+
+    def _spot(self, name: str) -> Optional[float]:
+        token = self.underlying_tokens.get(name)
+        return self.ltp_book.get(token) if token is not None else None
+
+    def solve(self, legs: Iterable[Tuple[int, float]]) -> Dict[int, LegGreeks]:
+        """Greeks for (instrument_token, last_price) pairs, keyed by token."""
+        now = time.time()
+        results: Dict[int, LegGreeks] = {}
+        misses: List[tuple] = []
+        for token, ltp in legs:
+            if token in results:
+                continue
+            contract = self._contract(token) if token else None
+            spot = self._spot(contract[0]) if contract else None
+            if contract is None or spot is None or not ltp:
+                results[token] = NO_GREEKS
+                continue
+            key = (token, int(round(ltp / self.ltp_bucket)), int(round(spot / self.spot_bucket)))
+            cached = self._cache.get(key)
+            if cached is not None:
+                results[token] = cached
+            else:
+                results[token] = NO_GREEKS  # placeholder so repeats of this token are skipped
+                misses.append((key, token, ltp, spot, contract))
+
+        if misses:
+            price = np.array([m[2] for m in misses])
+            spot = np.array([m[3] for m in misses])
+            strike = np.array([m[4][2] for m in misses])
+            kind = np.array([m[4][3] for m in misses], dtype=np.float64)
+            t = np.array([self._time_to_expiry(m[4][1], now) for m in misses])
+            iv = implied_vol(price, spot, strike, t, self.risk_free_rate, kind)
+            greeks = bs_greeks(spot, strike, t, self.risk_free_rate, iv, kind)
+            for i, (key, token, *_rest) in enumerate(misses):
+                leg = LegGreeks(
+                    iv=_clean(iv[i]),
+                    **{name: _clean(greeks[name][i]) for name in GREEK_FIELDS}
+                )
+                self._cache.put(key, leg)
+                results[token] = leg
+        return results
+
+    def annotate(self, rows: Iterable[dict]) -> List[dict]:
+        """Adds ``iv`` and position-sized Greeks (per unit x quantity) to position rows."""
+        rows = list(rows)
+        solved = self.solve(
+            (row.get("instrument_token"), row.get("last_price")) for row in rows if row.get("quantity")
+        )
+        for row in rows:
+            leg = solved.get(row.get("instrument_token"), NO_GREEKS)
+            size = (row.get("quantity") or 0) * (row.get("multiplier") or 1)
+            row["iv"] = leg.iv
+            for name in GREEK_FIELDS:
+                value = getattr(leg, name)
+                row[name] = None if value is None else value * size
+        return rows
+
+    @staticmethod
+    def totals(rows: Iterable[dict]) -> dict:
+        total = dict.fromkeys(GREEK_FIELDS, 0.0)
+        for row in rows:
+            for name in GREEK_FIELDS:
+                total[name] += row.get(name) or 0.0
+        return total
@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+# Kite order tags: alphanumeric, at most 20 characters
+TAG_PREFIX = "zap"
+TAG_LENGTH = 20
+
+# Per-account states besides a stored result
+INFLIGHT = "inflight"
+UNKNOWN = "unknown"
+
+# Claim outcomes for accounts this request should place
+CLAIMED = "claimed"
+RECLAIMED = "reclaimed"  # an earlier attempt may have reached the broker; look up the tag first
+
+
+class IdempotencyKeyReused(Exception):
+    """The key was already used for a different order request."""
+
+
+def order_tag(user_id: int, key: str) -> str:
+    digest = hashlib.sha1(f"{user_id}:{key}".encode()).hexdigest()
+    return (TAG_PREFIX + digest)[:TAG_LENGTH]
+
+
+def request_tag(user_id: int, key: Optional[str] = None) -> str:
+    # Every placed leg carries a tag so an unknown outcome can be looked up in
+    # the order book; without an Idempotency-Key it is unique to the request
+    return order_tag(user_id, key or uuid.uuid4().hex)
+
+
+def request_fingerprint(payload: dict) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def outcome_unknown(exc: BaseException) -> bool:
+    # Failures after which the order may still have reached the exchange
+    return type(exc).__name__ in (
+        "NetworkException", "ConnectionError", "Timeout", "ReadTimeout", "TimeoutError"
+    )
+
+
+def broker_rejected(exc: BaseException) -> bool:
+    # The broker looked at the order and refused it; retrying the same request won't change that
+    return type(exc).__name__ in ("InputException", "OrderException")
+
+
+# Atomically checks the request fingerprint and claims every account that has
+# no result yet. An in-flight marker older than ARGV[4] ms (the worker died
+# mid-dispatch) is treated like an unknown outcome and handed over.
+_CLAIM_SCRIPT = """
+local fingerprint = redis.call('GET', KEYS[1])
+if fingerprint and fingerprint ~= ARGV[1] then
+    return {'conflict'}
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+local now = tonumber(ARGV[3])
+local marker = 'inflight:' .. ARGV[3]
+local out = {}
+for i = 2, #KEYS do
+    local current = redis.call('GET', KEYS[i])
+    local state = current
+    if not current then
+        state = 'claimed'
+    elseif current == 'unknown' then
+        state = 'reclaimed'
+    elseif string.sub(current, 1, 9) == 'inflight:' then
+        if now - tonumber(string.sub(current, 10)) > tonumber(ARGV[4]) then
+            state = 'reclaimed'
+        else
+            state = 'inflight'
+        end
+    end
+    if state == 'claimed' or state == 'reclaimed' then
+        redis.call('SET', KEYS[i], marker, 'PX', ARGV[2])
+    end
+    out[i - 1] = state
+end
+return out
+"""
+
+
+# ========== Order Idempotency ==========
+class OrderIdempotency:
+    """Idempotency-Key bookkeeping for order placement, shared through Redis.
+
+    Every (user, key, account) gets one slot: an in-flight marker while a
+    request is placing that account's order, then the per-account result,
+    kept for ``ttl`` seconds. A retry with the same key gets stored results
+    back, waits on slots another request is still working on, and only
+    places orders for accounts that were never attempted. Only outcomes
+    the broker decided (placed or rejected) are stored; timeouts and network
+    errors leave the slot ``unknown``, and the next attempt checks the
+    broker's order book for the request's tag before placing again. Failures
+    that never reached the broker (no session, risk block, saturation)
+    release the slot so a retry places the order.
+    """
+
+    key_prefix = "idem:order:"
+
+    def __init__(self, redis_client, ttl: float = 86400, stale_after: float = 60, poll_interval: float = 0.1):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.stale_after = stale_after
+        self.poll_interval = poll_interval
+        self._claim = redis_client.register_script(_CLAIM_SCRIPT)
+
+    def _base(self, user_id: int, key: str) -> str:
+        # Hash tag keeps one request's slots in the same cluster slot
+        return f"{self.key_prefix}{{{user_id}:{key}}}"
+
+    def _slot(self, user_id: int, key: str, account_id: int) -> str:
+        return f"{self._base(user_id, key)}:{account_id}"
+
+    def claim(self, user_id: int, key: str, fingerprint: str, account_ids: List[int]) -> Dict[int, object]:
+        """Per account: CLAIMED, RECLAIMED, INFLIGHT or the stored result dict.
+
+        Raises ``IdempotencyKeyReused`` if the key was used for another request.
+        """
+        keys = [f"{self._base(user_id, key)}:request"] + [self._slot(user_id, key, a) for a in account_ids]
+        now_ms = int(time.time() * 1000)
+        states = self._claim(
+            keys=keys,
+            args=[fingerprint, int(self.ttl * 1000), now_ms, int(self.stale_after * 1000)]
+        )
+        if states and states[0] == "conflict":
+            raise IdempotencyKeyReused("Idempotency-Key was already used for a different order")
+        return {account_id: self._decode(state) for account_id, state in zip(account_ids, states)}
+
+    @staticmethod
+    def _decode(state: str) -> object:
+        if state in (CLAIMED, RECLAIMED, INFLIGHT):
+            return state
+        return json.loads(state)
+
+    def complete(self, user_id: int, key: str, results: Dict[int, Optional[dict]],
+                 released: Iterable[int] = ()) -> None:
+        # A None result records an unknown outcome; released slots are dropped
+        pipe = self.redis.pipeline(transaction=False)
+        for account_id, result in results.items():
+            value = UNKNOWN if result is None else json.dumps(result, default=str)
+            pipe.set(self._slot(user_id, key, account_id), value, px=int(self.ttl * 1000))
+        for account_id in released:
+            pipe.delete(self._slot(user_id, key, account_id))
+        pipe.execute()
+
+    def states(self, user_id: int, key: str, account_ids: List[int]) -> Dict[int, object]:
+        # Per account: the stored result dict, INFLIGHT, UNKNOWN or None (no slot)
+        values = self.redis.mget([self._slot(user_id, key, a) for a in account_ids])
+        out = {}
+        for account_id, value in zip(account_ids, values):
+            if value is None or value == UNKNOWN:
+                out[account_id] = value
+            elif value.startswith(INFLIGHT):
+                out[account_id] = INFLIGHT
+            else:
+                out[account_id] = json.loads(value)
+        return out
+
+    async def wait(self, user_id: int, key: str, account_ids: List[int], timeout: float) -> Dict[int, object]:
+        """Polls slots held by another request until they settle or ``timeout`` passes."""
+        deadline = time.monotonic() + timeout
+        while True:
+            states = await asyncio.to_thread(self.states, user_id, key, account_ids)
+            if all(state != INFLIGHT for state in states.values()) or time.monotonic() >= deadline:
+                return states
+            await asyncio.sleep(self.poll_interval)
@@ -0,0 +1,299 @@
+import csv
+import io
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import requests
+
+logger = logging.getLogger(__name__)
+
+IST = timezone(timedelta(hours=5, minutes=30))
+KITE_API_ROOT = "https://api.kite.trade"
+KITE_INSTRUMENTS_URL = "{root}/instruments/{exchange}"
+OPTION_TYPES = ("CE", "PE")
+
+# Index instrument tokens, streamed alongside positions as the spot price of
+# each underlying
+UNDERLYING_TOKENS = {
+    "NIFTY": 256265,      # NSE:NIFTY 50
+    "BANKNIFTY": 260105,  # NSE:NIFTY BANK
+    "FINNIFTY": 257801,   # NSE:NIFTY FIN SERVICE
+    "MIDCPNIFTY": 288009,  # NSE:NIFTY MID SELECT
+    "SENSEX": 265,        # BSE:SENSEX
+}
+
+
+@dataclass(frozen=True)
+class Instrument:
+    instrument_token: int
+    tradingsymbol: str
+    name: str
+    exchange: str
+    expiry: str
+    strike: float
+    option_type: str
+    lot_size: int
+    tick_size: float
+
+
+# ========== Columnar Storage ==========
+class InstrumentColumns:
+    """Option contracts stored column by column.
+
+    A day's NFO/BFO dump is saved as a directory: one ``.npy`` file per
+    numeric column, memory-mapped read-only on load, and the string columns
+    in one JSON file. Nothing in it is executable, unlike a pickle, and it
+    loads without building one object per row.
+    """
+
+    NUMERIC = {"instrument_token": "q", "strike": "d", "lot_size": "l", "tick_size": "d"}
+    STRINGS = ("tradingsymbol", "name", "exchange", "expiry", "option_type")
+
+    def __init__(self):
+        self.instrument_token = array("q")
+        self.strike = array("d")
+        self.lot_size = array("l")
+        self.tick_size = array("d")
+        self.tradingsymbol: List[str] = []
+        self.name: List[str] = []
+        self.exchange: List[str] = []
+        self.expiry: List[str] = []
+        self.option_type: List[str] = []
+
+    def append(self, row: dict) -> None:
+        self.instrument_token.append(int(row["instrument_token"]))
+        self.strike.append(float(row["strike"] or 0))
+        self.lot_size.append(int(float(row["lot_size"] or 1)))
+        self.tick_size.append(float(row["tick_size"] or 0))
+        self.tradingsymbol.append(row["tradingsymbol"])
+        self.name.append(row["name"])
+        self.exchange.append(row["exchange"])
+        self.expiry.append(row["expiry"])
+        self.option_type.append(row["instrument_type"])
+
+    def row(self, i: int) -> Instrument:
+        return Instrument(
+            instrument_token=int(self.instrument_token[i]),
+            tradingsymbol=self.tradingsymbol[i],
+            name=self.name[i],
+            exchange=self.exchange[i],
+            expiry=self.expiry[i],
+            strike=float(self.strike[i]),
+            option_type=self.option_type[i],
+            lot_size=int(self.lot_size[i]),
+            tick_size=float(self.tick_size[i]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.instrument_token)
+
+    @classmethod
+    def from_csv(cls, text: str) -> "InstrumentColumns":
+        columns = cls()
+        for row in csv.DictReader(io.StringIO(text)):
+            if row.get("instrument_type") in OPTION_TYPES:
+                columns.append(row)
+        return columns
+
+    def dump(self, path: str) -> None:
+        # Written next to the target and renamed into place, so readers never see half a cache
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path, mode=0o700)
+        for name in self.NUMERIC:
+            np.save(os.path.join(tmp_path, f"{name}.npy"), np.asarray(getattr(self, name)), allow_pickle=False)
+        with open(os.path.join(tmp_path, "strings.json"), "w") as f:
+            json.dump({name: getattr(self, name) for name in self.STRINGS}, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "InstrumentColumns":
+        columns = cls()
+        for name in cls.NUMERIC:
+            values = np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r", allow_pickle=False)
+            setattr(columns, name, values)
+        with open(os.path.join(path, "strings.json")) as f:
+            strings = json.load(f)
+        for name in cls.STRINGS:
+            setattr(columns, name, strings[name])
+        if any(len(getattr(columns, name)) != len(columns) for name in (*cls.NUMERIC, *cls.STRINGS)):
+            raise ValueError(f"Instrument cache {path} has columns of different lengths")
+        return columns
+
+
+def strike_key(strike) -> int:
+    # Strikes compare in paise so "24000", 24000 and 24000.0 hit the same key
+    return int(round(float(strike) * 100))
+
+
+# ========== Instrument Master ==========
+class InstrumentMaster:
+    """Daily NFO/BFO option master with O(1) contract lookups.
+
+    Nothing is read at import time. The first lookup (or ``warm``) loads
+    today's cached file, downloading the dump from Kite if the cache is from
+    an earlier day. ``source`` may point at a local CSV instead, e.g. the
+    bundled sample for offline runs.
+    """
+
+    def __init__(self, cache_dir: str, exchanges: Iterable[str] = ("NFO", "BFO"), source: str = "", root: str = ""):
+        self.cache_dir = cache_dir
+        self.exchanges = tuple(exchanges)
+        self.source = source
+        self.root = root or KITE_API_ROOT
+        self._columns: Optional[InstrumentColumns] = None
+        self._index: Dict[Tuple[str, str, int, str], int] = {}
+        self._by_token: Dict[int, int] = {}
+        self._by_symbol: Dict[Tuple[str, str], int] = {}
+        self._by_name: Dict[str, List[int]] = {}
+        self._loaded_for: Optional[str] = None
+        self._retry_after = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._columns is not None and self._loaded_for == self._today()
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(IST).date().isoformat()
+
+    def _cache_path(self, day: str) -> str:
+        return os.path.join(self.cache_dir, f"instruments_{day}")
+
+    def _fetch_csv(self) -> str:
+        if self.source:
+            with open(self.source) as f:
+                return f.read()
+        parts = []
+        for exchange in self.exchanges:
+            response = requests.get(KITE_INSTRUMENTS_URL.format(root=self.root, exchange=exchange), timeout=30)
+            response.raise_for_status()
+            text = response.text
+            # Keep a single header row across exchanges
+            parts.append(text if not parts else text.split("\n", 1)[1])
+        return "".join(part if part.endswith("\n") else part + "\n" for part in parts)
+
+    def _read_or_fetch(self, day: str) -> InstrumentColumns:
+        path = self._cache_path(day)
+        if os.path.exists(path):
+            try:
+                return InstrumentColumns.load(path)
+            except (OSError, ValueError, KeyError):
+                # Unreadable or tampered with (pickled arrays are refused); fetch afresh
+                logger.warning("Discarding instrument cache %s", path, exc_info=True)
+        columns = InstrumentColumns.from_csv(self._fetch_csv())
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        columns.dump(path)
+        self._prune(keep=path)
+        return columns
+
+    def _prune(self, keep: str) -> None:
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith("instruments_") and path != keep:
+                try:
+                    if os.path.isdir(path):
+                        shutil.rmtree(path)
+                    else:
+                        os.remove(path)  # pickles from older releases
+                except OSError:
+                    pass
+
+    def load(self) -> None:
+        with self._lock:
+            day = self._today()
+            if self._columns is not None and (self._loaded_for == day or time.monotonic() < self._retry_after):
+                return
+            try:
+                columns = self._read_or_fetch(day)
+            except Exception:
+                if self._columns is None:
+                    raise
+                # Yesterday's contracts are better than none until the next retry
+                logger.exception("Instrument master refresh failed, keeping %s", self._loaded_for)
+                self._retry_after = time.monotonic() + 300
+                return
+
+            index = {}
+            by_token = {}
+            by_symbol = {}
+            by_name: Dict[str, List[int]] = {}
+            tokens, strikes = columns.instrument_token.tolist(), columns.strike.tolist()
+            for i in range(len(columns)):
+                key = (columns.name[i], columns.expiry[i], strike_key(strikes[i]), columns.option_type[i])
+                index[key] = i
+                by_token[tokens[i]] = i
+                by_symbol[(columns.exchange[i], columns.tradingsymbol[i])] = i
+                by_name.setdefault(columns.name[i], []).append(i)
+            self._columns, self._index, self._by_token = columns, index, by_token
+            self._by_symbol, self._by_name = by_symbol, by_name
+            self._loaded_for = day
+            logger.info("Loaded %d option contracts for %s", len(columns), day)
+
+    def warm(self) -> threading.Thread:
+        # Load in the background so startup never waits on the download
+        def run():
+            try:
+                self.load()
+            except Exception:
+                logger.exception("Instrument master warm-up failed")
+
+        thread = threading.Thread(target=run, name="instrument-master", daemon=True)
+        thread.start()
+        return thread
+
+    def resolve(self, name: str, expiry: str, strike, option_type: str) -> Optional[Instrument]:
+        if not self.loaded:
+            self.load()
+        i = self._index.get((name, expiry, strike_key(strike), option_type))
+        return self._columns.row(i) if i is not None else None
+
+    def by_token(self, instrument_token: int) -> Optional[Instrument]:
+        if not self.loaded:
+            self.load()
+        i = self._by_token.get(instrument_token)
+        return self._columns.row(i) if i is not None else None
+
+    def by_symbol(self, exchange: str, tradingsymbol: str) -> Optional[Instrument]:
+        if not self.loaded:
+            self.load()
+        i = self._by_symbol.get((exchange, tradingsymbol))
+        return self._columns.row(i) if i is not None else None
+
+    def contracts(
+        self,
+        name: str,
+        expiry: Optional[str] = None,
+        option_type: Optional[str] = None,
+        min_strike: Optional[float] = None,
+        max_strike: Optional[float] = None,
+    ) -> List[Instrument]:
+        """The underlying's contracts, optionally narrowed to one expiry, side and strike range."""
+        if not self.loaded:
+            self.load()
+        columns = self._columns
+        low = strike_key(min_strike) if min_strike is not None else None
+        high = strike_key(max_strike) if max_strike is not None else None
+        matches = []
+        for i in self._by_name.get(name, ()):
+            if expiry is not None and columns.expiry[i] != expiry:
+                continue
+            if option_type is not None and columns.option_type[i] != option_type:
+                continue
+            key = strike_key(float(columns.strike[i]))
+            if (low is not None and key < low) or (high is not None and key > high):
+                continue
+            matches.append(i)
+        matches.sort(key=lambda i: (columns.expiry[i], columns.strike[i], columns.option_type[i]))
+        return [columns.row(i) for i in matches]
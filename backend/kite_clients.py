@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
+
+from metrics import BROKER_FAILURES, BROKER_LATENCY, broker_method
+from models import ZerodhaAccount
+
+if TYPE_CHECKING:
+    from kiteconnect import KiteConnect
+
+    from credentials import CredentialVault
+
+
+@lru_cache(maxsize=None)
+def instrumented_client_class() -> type:
+    """KiteConnect subclass that times every API call, labelled by method and account.
+
+    Built on first use: importing ``kiteconnect`` pulls in the ticker and
+    Twisted, which is a large share of the app's cold start.
+    """
+    from kiteconnect import KiteConnect
+
+    class InstrumentedKiteConnect(KiteConnect):
+        def __init__(self, *args, account_label: str = "none", **kwargs):
+            super().__init__(*args, **kwargs)
+            self.account_label = account_label
+
+        def _request(self, route, *args, **kwargs):
+            method = broker_method(route)
+            started = time.perf_counter()
+            try:
+                return super()._request(route, *args, **kwargs)
+            except Exception as e:
+                BROKER_FAILURES.labels(method, type(e).__name__).inc()
+                raise
+            finally:
+                BROKER_LATENCY.labels(method, self.account_label).observe(time.perf_counter() - started)
+
+    return InstrumentedKiteConnect
+
+
+def new_kite_client(api_key: str, account_id: Optional[int] = None, root: str = "", **kwargs) -> "KiteConnect":
+    # ``root`` overrides the API base URL, e.g. for the local Kite simulator
+    if root:
+        kwargs["root"] = root
+    return instrumented_client_class()(
+        api_key=api_key,
+        account_label=str(account_id) if account_id is not None else "none",
+        **kwargs
+    )
+
+
+@dataclass
+class _ClientEntry:
+    client: "KiteConnect"
+    api_key: str
+    access_token_enc: Optional[str]
+    created_at: float
+
+
+# ========== KiteConnect Client Registry ==========
+class KiteClientRegistry:
+    """Process-wide KiteConnect clients keyed by account id.
+
+    Each client keeps its own pooled HTTP session and the access token from
+    the credential vault, so hot requests skip both the TLS handshake and
+    Fernet. An entry is rebuilt when the account's stored token or api key
+    changes, when it is older than ``ttl`` seconds, or after an explicit
+    ``invalidate``.
+    """
+
+    def __init__(
+        self,
+        credentials: "CredentialVault",
+        max_size: int = 256,
+        ttl: float = 3600,
+        pool_size: int = 10,
+        timeout: int = 7,
+        root: str = "",
+    ):
+        self.credentials = credentials
+        self.max_size = max_size
+        self.ttl = ttl
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.root = root
+        self._entries: "OrderedDict[int, _ClientEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, entry: _ClientEntry, account: ZerodhaAccount, now: float) -> bool:
+        return (
+            entry.api_key == account.api_key
+            and entry.access_token_enc == account.access_token
+            and now - entry.created_at < self.ttl
+        )
+
+    def _build(self, account: ZerodhaAccount) -> "KiteConnect":
+        kite = new_kite_client(
+            account.api_key,
+            account.id,
+            root=self.root,
+            timeout=self.timeout,
+            pool={"pool_connections": self.pool_size, "pool_maxsize": self.pool_size},
+        )
+        if account.access_token:
+            kite.set_access_token(self.credentials.reveal(account.id, "access_token", account.access_token))
+        return kite
+
+    def get(self, account: ZerodhaAccount) -> "KiteConnect":
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(account.id)
+            if entry is not None and self._is_fresh(entry, account, now):
+                self._entries.move_to_end(account.id)
+                return entry.client
+
+        # Build outside the lock so one slow decrypt doesn't block other accounts.
+        # Replaced and evicted clients are only dropped, not closed, since another
+        # thread may still be mid-request on them; their pools close on GC.
+        client = self._build(account)
+        with self._lock:
+            self._entries.pop(account.id, None)
+            self._entries[account.id] = _ClientEntry(
+                client=client,
+                api_key=account.api_key,
+                access_token_enc=account.access_token,
+                created_at=now,
+            )
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return client
+
+    def invalidate(self, account_id: int) -> None:
+        with self._lock:
+            self._entries.pop(account_id, None)
+
+    def close(self) -> None:
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            try:
+                entry.client.reqsession.close()
+            except Exception:
+                pass
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -1,32 +1,111 @@
-from fastapi import FastAPI, Depends, HTTPException, WebSocket, WebSocketDisconnect, status
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import insert, update
 from sqlalchemy.orm import Session
-from typing import List
-from datetime import datetime
+from typing import TYPE_CHECKING, List, Optional
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+import asyncio
+import time
 import redis
-import json
-from kiteconnect import KiteConnect
+import logging
 
 from config import settings
-from database import engine, get_db, Base
+from database import SessionLocal, run_db, pool_metrics, warm_database
 from models import User, ZerodhaAccount, Order, Position
 from schemas import (
     UserCreate, UserLogin, UserResponse, Token,
-    AccountCreate, AccountResponse, OrderPlaceRequest, PlaceOrderResponse,
-    PositionResponse, SetTokenRequest, APIResponse
+    AccountCreate, BulkAccountCreate, AccountResponse, OrderPlaceRequest, PlaceOrderResponse, BasketOrderRequest,
+    OrderResponse, OrderHistoryResponse,
+    PositionResponse, PnLHistoryResponse, PnLPoint, SetTokenRequest, APIResponse,
+    BulkSetTokenRequest, BulkSetTokenResponse, SessionResult, AccountReadiness, ReadinessResponse,
+    RiskResponse, RiskCheckResponse, GreeksResponse
 )
-from auth import create_access_token, verify_token, get_current_active_user, get_current_user
-from cryptography.fernet import Fernet
-import base64
+from auth import create_access_token, verify_token, get_current_active_user, get_current_user, user_cache
+from user_cache import AuthenticatedUser
+from dispatch import fan_out
+from serialization import FastJSONResponse, FrameEncoder, dumps_str, negotiate
+from credentials import CredentialVault, parse_keys
+from kite_clients import KiteClientRegistry, new_kite_client
+from positions_cache import PositionsSnapshotCache
+from position_stream import PositionStreamer, open_position_rows
+from ws_fanout import RedisFanout
+from position_store import PositionStore, PnLHistoryRecorder, as_utc
+from market_data import MarketDataService
+from instruments import Instrument, InstrumentMaster, UNDERLYING_TOKENS
+from risk import RiskEngine, price_moves
+from sessions import market_open, session_valid
+from greeks import GreeksService
+from reconciliation import OrderReconciler
+from order_history import order_history_page
+from idempotency import (
+    OrderIdempotency, IdempotencyKeyReused, CLAIMED, RECLAIMED, INFLIGHT,
+    request_tag, request_fingerprint, outcome_unknown, broker_rejected
+)
+from executors import BoundedExecutor, ExecutorSaturated
+from rate_limiter import BrokerScheduler, ORDER, QUOTE, DEFAULT, PRIORITY_ORDER, PRIORITY_SESSION
+from metrics import MetricsMiddleware, WS_CONNECTIONS, WS_DROPPED, WS_SEND_LATENCY, count_error, pool_stats, render_metrics
+
+if TYPE_CHECKING:
+    from kiteconnect import KiteConnect
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+# ========== Lifecycle ==========
+# Nothing at import time touches the network: the database and Redis are
+# warmed up concurrently once the server starts, each bounded by a timeout,
+# and a slow or missing dependency is logged rather than failing the boot
+startup_state = {"database": "pending", "redis": "pending"}
+
+async def warm_up(name: str, fn, *args):
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(asyncio.to_thread(fn, *args), settings.STARTUP_WARMUP_TIMEOUT)
+        startup_state[name] = "connected"
+        logger.info("%s warm-up took %.0f ms", name, (time.perf_counter() - started) * 1000)
+    except Exception as e:
+        startup_state[name] = "unavailable"
+        count_error("startup", e)
+        logger.warning("%s warm-up failed after %.0f ms: %r", name, (time.perf_counter() - started) * 1000, e)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema changes go through Alembic (alembic upgrade head); DB_CREATE_ALL
+    # is only a shortcut for throwaway local databases
+    await asyncio.gather(
+        warm_up("database", warm_database, settings.DB_WARM_CONNECTIONS, settings.DB_CREATE_ALL),
+        warm_up("redis", redis_client.ping)
+    )
+    instrument_master.warm()
+    positions_cache.start()
+    order_reconciler.start()
+    vault.start()
+    if settings.PNL_HISTORY_ENABLED:
+        pnl_history.start()
+    try:
+        yield
+    finally:
+        await positions_cache.stop()
+        await order_reconciler.stop()
+        await pnl_history.stop()
+        await vault.stop()
+        if ws_fanout is not None:
+            await ws_fanout.close()
+        market_data.close()
+        kite_clients.close()
+        broker_executor.shutdown(wait=False)
+        order_executor.shutdown(wait=False)
+        hash_executor.shutdown(wait=False)
 
 # Initialize FastAPI
 app = FastAPI(
     title=settings.APP_NAME,
     version=settings.APP_VERSION,
-    description="Multi-account Zerodha Trading Platform"
+    description="Multi-account Zerodha Trading Platform",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # CORS middleware
@@ -38,52 +117,374 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Redis connection
-redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+# Request latency per route, exposed on /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Thread pools for blocking broker I/O and CPU-bound password hashing
+broker_executor = BoundedExecutor("broker", settings.BROKER_POOL_SIZE, settings.BROKER_POOL_QUEUE)
+order_executor = BoundedExecutor("broker-order", settings.BROKER_ORDER_POOL_SIZE, settings.BROKER_ORDER_POOL_QUEUE)
+hash_executor = BoundedExecutor("hash", settings.HASH_POOL_SIZE, settings.HASH_POOL_QUEUE)
+# Every Kite call goes through the scheduler to stay under per-key rate limits
+broker = BrokerScheduler(
+    broker_executor,
+    limits={
+        ORDER: (settings.RATE_LIMIT_ORDERS, settings.RATE_LIMIT_ORDERS),
+        QUOTE: (settings.RATE_LIMIT_QUOTES, settings.RATE_LIMIT_QUOTES),
+        DEFAULT: (settings.RATE_LIMIT_DEFAULT, settings.RATE_LIMIT_DEFAULT)
+    },
+    max_retries=settings.BROKER_MAX_RETRIES,
+    order_executor=order_executor
+)
 
-# Encryption key for credentials
-ENCRYPTION_KEY = base64.urlsafe_b64encode(settings.JWT_SECRET.encode()[:32].ljust(32, b'0'))
-cipher_suite = Fernet(ENCRYPTION_KEY)
+pool_stats.add("broker_pool", broker_executor.stats)
+pool_stats.add("broker_order_pool", order_executor.stats)
+pool_stats.add("hash_pool", hash_executor.stats)
+pool_stats.add("db_pool", pool_metrics.stats)
+
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated_handler(request: Request, exc: ExecutorSaturated):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+# Redis connection (connects on first command)
+redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+if settings.USER_CACHE_REDIS:
+    user_cache.attach_redis(redis_client)
+
+# Account credentials: encryption, key rotation and decrypted copies
+vault = CredentialVault(
+    parse_keys(settings.CREDENTIAL_KEYS, settings.JWT_SECRET),
+    session_factory=SessionLocal,
+    max_size=settings.CREDENTIAL_CACHE_SIZE,
+    ttl=settings.CREDENTIAL_CACHE_TTL,
+    rotate_interval=settings.CREDENTIAL_ROTATE_INTERVAL
+)
 
 # WebSocket connection manager
 class ConnectionManager:
-    def __init__(self):
+    """Sockets attached to this worker, each with a bounded outbound queue.
+
+    A writer task per socket drains its queue, so a broadcast never waits on
+    the network. A client whose queue fills up or whose send times out is
+    dropped with 1013; it reconnects and starts again from a snapshot, which
+    is cheaper than buffering frames for it. Frames are encoded once per
+    broadcast for each wire format in use (JSON text or msgpack binary,
+    picked by subprotocol at connect time) and queued ready to send.
+    """
+
+    def __init__(self, send_timeout: float = 2.0, queue_size: int = 32, encoder: Optional[FrameEncoder] = None):
         self.active_connections: dict[int, List[WebSocket]] = {}
+        self.send_timeout = send_timeout
+        self.queue_size = queue_size
+        self.encoder = encoder
+        self._queues: dict[WebSocket, asyncio.Queue] = {}
+        self._writers: dict[WebSocket, asyncio.Task] = {}
+        self._wire: dict[WebSocket, str] = {}
 
     async def connect(self, websocket: WebSocket, user_id: int):
-        await websocket.accept()
+        subprotocol, wire = negotiate(websocket.scope.get("subprotocols", []))
+        await websocket.accept(subprotocol=subprotocol)
         if user_id not in self.active_connections:
             self.active_connections[user_id] = []
         self.active_connections[user_id].append(websocket)
+        self._wire[websocket] = wire
+        self._queues[websocket] = asyncio.Queue(self.queue_size)
+        self._writers[websocket] = asyncio.create_task(self._write(websocket, user_id))
+        WS_CONNECTIONS.inc()
 
     def disconnect(self, websocket: WebSocket, user_id: int):
         if user_id in self.active_connections:
-            self.active_connections[user_id].remove(websocket)
+            if websocket in self.active_connections[user_id]:
+                self.active_connections[user_id].remove(websocket)
+                WS_CONNECTIONS.dec()
             if not self.active_connections[user_id]:
                 del self.active_connections[user_id]
+        self._queues.pop(websocket, None)
+        self._wire.pop(websocket, None)
+        writer = self._writers.pop(websocket, None)
+        if writer is not None and writer is not asyncio.current_task():
+            writer.cancel()
+
+    def has_connections(self, user_id: int) -> bool:
+        return user_id in self.active_connections
+
+    def _encode(self, wire: str, user_id: int, message: dict):
+        if self.encoder is None:
+            return dumps_str(message)
+        return self.encoder.encode(wire, user_id, message)
+
+    async def _send(self, websocket: WebSocket, payload) -> bool:
+        started = time.perf_counter()
+        try:
+            if isinstance(payload, bytes):
+                await asyncio.wait_for(websocket.send_bytes(payload), self.send_timeout)
+            else:
+                await asyncio.wait_for(websocket.send_text(payload), self.send_timeout)
+            return True
+        except Exception as e:
+            count_error("ws_send", e)
+            return False
+        finally:
+            WS_SEND_LATENCY.observe(time.perf_counter() - started)
 
-    async def broadcast_to_user(self, user_id: int, message: dict):
-        if user_id in self.active_connections:
-            for connection in self.active_connections[user_id]:
-                try:
-                    await connection.send_json(message)
-                except:
-                    pass
+    async def _write(self, websocket: WebSocket, user_id: int):
+        queue = self._queues[websocket]
+        while True:
+            message = await queue.get()
+            if not await self._send(websocket, message):
+                await self._drop(websocket, user_id, "send_failed")
+                return
+
+    def _enqueue(self, websocket: WebSocket, user_id: int, payload) -> bool:
+        queue = self._queues.get(websocket)
+        if queue is None:
+            return False
+        try:
+            queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            spawn(self._drop(websocket, user_id, "queue_full"))
+            return False
+
+    def send(self, websocket: WebSocket, user_id: int, message: dict) -> bool:
+        # Queues a frame; False (and the socket is dropped) if the client is too far behind
+        wire = self._wire.get(websocket)
+        if wire is None:
+            return False
+        return self._enqueue(websocket, user_id, self._encode(wire, user_id, message))
 
-manager = ConnectionManager()
+    async def broadcast_to_user(self, user_id: int, message: dict):
+        payloads = {}
+        for connection in list(self.active_connections.get(user_id, [])):
+            wire = self._wire.get(connection)
+            if wire is None:
+                continue
+            if wire not in payloads:
+                payloads[wire] = self._encode(wire, user_id, message)
+            self._enqueue(connection, user_id, payloads[wire])
+
+    async def _drop(self, websocket: WebSocket, user_id: int, reason: str):
+        if websocket not in self._queues:
+            return
+        WS_DROPPED.labels(reason).inc()
+        self.disconnect(websocket, user_id)
+        await self._close(websocket)
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=1013), self.send_timeout)
+        except Exception as e:
+            count_error("ws_close", e)
+
+manager = ConnectionManager(send_timeout=settings.WS_SEND_TIMEOUT, queue_size=settings.WS_SEND_QUEUE)
+position_streamer = PositionStreamer(manager, window=settings.WS_COALESCE_WINDOW)
+manager.encoder = FrameEncoder(position_streamer.ids)
+# With several workers or replicas, position updates reach every worker's
+# sockets through Redis pub/sub instead of only the producing worker's
+ws_fanout = RedisFanout(
+    settings.REDIS_URL,
+    position_streamer,
+    window=settings.WS_COALESCE_WINDOW,
+    idle_ttl=settings.WS_FANOUT_IDLE_TTL
+) if settings.WS_FANOUT else None
 
 # ========== Utility Functions ==========
-def encrypt_data(data: str) -> str:
-    return cipher_suite.encrypt(data.encode()).decode()
+kite_clients = KiteClientRegistry(
+    credentials=vault,
+    max_size=settings.KITE_CLIENT_CACHE_SIZE,
+    ttl=settings.KITE_CLIENT_TTL,
+    pool_size=settings.KITE_HTTP_POOL_SIZE,
+    timeout=settings.KITE_HTTP_TIMEOUT,
+    root=settings.KITE_API_ROOT
+)
+
+def get_kite_instance(account: ZerodhaAccount) -> "KiteConnect":
+    # Cached per account with the access token already decrypted
+    return kite_clients.get(account)
+
+instrument_master = InstrumentMaster(
+    cache_dir=settings.INSTRUMENTS_CACHE_DIR,
+    exchanges=[exchange.strip() for exchange in settings.INSTRUMENT_EXCHANGES.split(",")],
+    source=settings.INSTRUMENTS_SOURCE,
+    root=settings.KITE_API_ROOT
+)
+
+position_store = PositionStore(SessionLocal) if settings.POSITIONS_PERSIST else None
+
+pnl_history = PnLHistoryRecorder(
+    redis_client,
+    session_factory=SessionLocal,
+    downsample_after=timedelta(days=settings.PNL_HISTORY_DOWNSAMPLE_DAYS),
+    retention=timedelta(days=settings.PNL_HISTORY_RETENTION_DAYS)
+)
+
+positions_cache = PositionsSnapshotCache(
+    redis_client,
+    session_factory=SessionLocal,
+    get_kite=get_kite_instance,
+    broker=broker,
+    interval=settings.POSITIONS_REFRESH_INTERVAL,
+    snapshot_ttl=settings.POSITIONS_SNAPSHOT_TTL,
+    max_concurrency=settings.POSITIONS_REFRESH_CONCURRENCY,
+    timeout=settings.KITE_HTTP_TIMEOUT,
+    store=position_store
+)
+
+order_keys = OrderIdempotency(
+    redis_client,
+    ttl=settings.ORDER_IDEMPOTENCY_TTL,
+    stale_after=max(settings.ORDER_IDEMPOTENCY_STALE, settings.ORDER_DISPATCH_TIMEOUT)
+)
+
+order_reconciler = OrderReconciler(
+    session_factory=SessionLocal,
+    credentials=vault,
+    get_kite=get_kite_instance,
+    broker=broker,
+    redis_client=redis_client,
+    flush_interval=settings.POSTBACK_FLUSH_INTERVAL,
+    max_buffer=settings.POSTBACK_MAX_BUFFER,
+    sync_interval=settings.ORDER_SYNC_INTERVAL,
+    timeout=settings.KITE_HTTP_TIMEOUT
+)
+
+POSITION_FIELDS = tuple(PositionResponse.model_fields)
+
+def position_rows(account_id: int, positions: list) -> dict:
+    # Open positions as served to clients, with Greeks on option legs
+    rows = open_position_rows(account_id, positions)
+    if settings.GREEKS_ENABLED:
+        greeks_service.annotate(rows.values())
+    return rows
+
+def publish_positions(user_id: int, account_id: int, positions: list):
+    if ws_fanout is not None:
+        if ws_fanout.wants(user_id):
+            ws_fanout.publish(user_id, account_id, position_rows(account_id, positions))
+        return
+    position_streamer.publish(user_id, account_id, position_rows(account_id, positions))
+
+market_data = MarketDataService(
+    publish=publish_positions,
+    replay_file=settings.TICKER_REPLAY_FILE,
+    extra_tokens=UNDERLYING_TOKENS.values()
+)
+
+greeks_service = GreeksService(
+    instrument_master,
+    market_data.book,
+    risk_free_rate=settings.GREEKS_RISK_FREE_RATE,
+    ltp_bucket=settings.GREEKS_LTP_BUCKET,
+    spot_bucket=settings.GREEKS_SPOT_BUCKET,
+    ttl=settings.GREEKS_CACHE_TTL
+)
+
+risk_engine = RiskEngine(
+    instrument_master,
+    market_data.book,
+    moves=price_moves(settings.RISK_GRID_PCT, settings.RISK_GRID_STEPS)
+)
+
+def ticker_account(accounts) -> Optional[ZerodhaAccount]:
+    # Lowest id with a live session, so every refresh picks the same account
+    now = datetime.now(timezone.utc)
+    valid = [a for a in accounts if session_valid(a.last_login, bool(a.access_token), now)]
+    return min(valid, key=lambda a: a.id, default=None)
+
+def stream_refreshed_positions(refreshed):
+    for account, snapshot in refreshed:
+        positions = snapshot.positions()
+        if settings.MARKET_DATA_ENABLED:
+            # Reprice against live ticks so a new snapshot never rolls back LTPs
+            positions = market_data.load_positions(account.user_id, account.id, positions)
+        publish_positions(account.user_id, account.id, positions)
+
+    if settings.MARKET_DATA_ENABLED:
+        account = ticker_account(account for account, _ in refreshed)
+        if account is None:
+            return
+        try:
+            market_data.ensure_streaming(account.api_key, get_kite_instance(account).access_token)
+        except Exception as e:
+            count_error("market_data", e)
+            logger.exception("Failed to start market data ticker")
+
+async def record_pnl_history(samples):
+    try:
+        await asyncio.to_thread(pnl_history.record, samples)
+    except Exception as e:
+        count_error("pnl_history", e)
+        logger.exception("Failed to record P&L history")
+
+def sample_refreshed_pnl(refreshed):
+    spawn(record_pnl_history([
+        (account.id, snapshot.ts, snapshot.total_pnl) for account, snapshot in refreshed
+    ]))
+
+positions_cache.add_listener(stream_refreshed_positions)
+if settings.PNL_HISTORY_ENABLED:
+    positions_cache.add_listener(sample_refreshed_pnl)
+
+# Fire-and-forget tasks, referenced until they finish
+background_tasks = set()
+
+def spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+# ========== Database Helpers ==========
+# Plain sync queries, executed through run_db off the event loop
+def load_user_accounts(db: Session, user_id: int, account_ids: List[int] = None) -> List[ZerodhaAccount]:
+    query = db.query(ZerodhaAccount).filter(ZerodhaAccount.user_id == user_id)
+    if account_ids is not None:
+        query = query.filter(ZerodhaAccount.id.in_(account_ids))
+    return query.all()
+
+def load_user_account_ids(db: Session, user_id: int, logged_in_only: bool = False) -> List[int]:
+    query = db.query(ZerodhaAccount.id).filter(ZerodhaAccount.user_id == user_id)
+    if logged_in_only:
+        query = query.filter(ZerodhaAccount.access_token.isnot(None))
+    return [account_id for (account_id,) in query.all()]
+
+def load_user_account(db: Session, user_id: int, account_id: int) -> Optional[ZerodhaAccount]:
+    return db.query(ZerodhaAccount).filter(
+        ZerodhaAccount.id == account_id,
+        ZerodhaAccount.user_id == user_id
+    ).first()
+
+def load_user_by_email(db: Session, email: str) -> User:
+    return db.query(User).filter(User.email == email).first()
+
+def save_user(db: Session, user: User) -> User:
+    db.add(user)
+    db.commit()
+    return user
+
+def delete_user_account(db: Session, user_id: int, account_id: int) -> bool:
+    # Through the ORM so the account's orders and positions cascade with it
+    account = load_user_account(db, user_id, account_id)
+    if account is None:
+        return False
+    db.delete(account)
+    db.commit()
+    return True
+
+def save_accounts(db: Session, accounts: List[ZerodhaAccount]) -> List[ZerodhaAccount]:
+    # All new accounts in one transaction
+    db.add_all(accounts)
+    db.commit()
+    return accounts
 
-def decrypt_data(data: str) -> str:
-    return cipher_suite.decrypt(data.encode()).decode()
+def save_sessions(db: Session, sessions: List[dict]):
+    # One executemany UPDATE keyed by account id, so the batch commits together
+    db.execute(update(ZerodhaAccount), sessions)
+    db.commit()
 
-def get_kite_instance(account: ZerodhaAccount) -> KiteConnect:
-    kite = KiteConnect(api_key=account.api_key)
-    if account.access_token:
-        kite.set_access_token(account.access_token)
-    return kite
+def save_orders(db: Session, order_rows: List[dict]):
+    # One multi-row INSERT for the whole batch
+    db.execute(insert(Order), order_rows)
+    db.commit()
 
 # ========== Root Endpoint ==========
 @app.get("/")
@@ -94,35 +495,47 @@ async def root():
         "status": "running"
     }
 
+@app.get("/metrics")
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "database": "connected"}
+    return {
+        "status": "healthy",
+        "database": startup_state["database"],
+        "redis": startup_state["redis"],
+        "db_pool": pool_metrics.stats(),
+        "pools": {
+            "broker": broker_executor.stats(),
+            "broker_order": order_executor.stats(),
+            "hash": hash_executor.stats()
+        }
+    }
 
 # ========== Authentication Endpoints ==========
 @app.post("/api/auth/register", response_model=UserResponse)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate):
     # Check if user exists
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+    existing_user = await run_db(load_user_by_email, user_data.email)
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
     # Create new user
-    hashed_password = User.get_password_hash(user_data.password)
+    hashed_password = await hash_executor.run(User.get_password_hash, user_data.password)
     new_user = User(
         email=user_data.email,
         full_name=user_data.full_name,
         hashed_password=hashed_password
     )
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    return new_user
+    return await run_db(save_user, new_user)
 
 @app.post("/api/auth/login", response_model=Token)
-async def login(login_data: UserLogin, db: Session = Depends(get_db)):
+async def login(login_data: UserLogin):
     # Find user
-    user = db.query(User).filter(User.email == login_data.email).first()
-    if not user or not user.verify_password(login_data.password):
+    user = await run_db(load_user_by_email, login_data.email)
+    if not user or not await hash_executor.run(user.verify_password, login_data.password):
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
     # Create access token
@@ -130,39 +543,30 @@ async def login(login_data: UserLogin, db: Session = Depends(get_db)):
     return Token(access_token=access_token, user=user)
 
 @app.get("/api/auth/me", response_model=UserResponse)
-async def get_me(current_user: User = Depends(get_current_active_user)):
+async def get_me(current_user: AuthenticatedUser = Depends(get_current_active_user)):
     return current_user
 
 # ========== Account Endpoints ==========
 @app.get("/api/accounts", response_model=List[AccountResponse])
-async def get_accounts(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
-):
-    accounts = db.query(ZerodhaAccount).filter(
-        ZerodhaAccount.user_id == current_user.id
-    ).all()
+async def get_accounts(current_user: AuthenticatedUser = Depends(get_current_active_user)):
+    accounts = await run_db(load_user_accounts, current_user.id)
 
-    # Calculate total P&L for each account
+    # Total P&L for each account comes from the background snapshot
+    snapshots = positions_cache.read(account.id for account in accounts)
     result = []
     for account in accounts:
-        total_pnl = 0.0
-        if account.access_token:
-            try:
-                kite = get_kite_instance(account)
-                positions = kite.positions()
-                if 'net' in positions:
-                    total_pnl = sum(pos.get('pnl', 0) for pos in positions['net'])
-            except:
-                pass
-
+        snapshot = snapshots.get(account.id)
+        total_pnl = market_data.account_total(account.id)
+        if total_pnl is None:
+            total_pnl = snapshot.total_pnl if snapshot else 0.0
         result.append(AccountResponse(
             id=account.id,
             nickname=account.nickname,
             api_key=account.api_key,
             is_active=account.is_active,
             last_login=account.last_login,
-            total_pnl=total_pnl
+            total_pnl=total_pnl,
+            snapshot_age=snapshot.age if snapshot else None
         ))
 
     return result
@@ -170,21 +574,18 @@ async def get_accounts(
 @app.post("/api/accounts", response_model=AccountResponse)
 async def create_account(
     account_data: AccountCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: AuthenticatedUser = Depends(get_current_active_user)
 ):
     # Create new account
     new_account = ZerodhaAccount(
         user_id=current_user.id,
         nickname=account_data.nickname,
         api_key=account_data.api_key,
-        api_secret_enc=encrypt_data(account_data.api_secret),
-        zerodha_user_id_enc=encrypt_data(account_data.zerodha_user_id) if account_data.zerodha_user_id else None,
-        zerodha_password_enc=encrypt_data(account_data.zerodha_password) if account_data.zerodha_password else None
+        api_secret_enc=vault.encrypt(account_data.api_secret),
+        zerodha_user_id_enc=vault.encrypt(account_data.zerodha_user_id) if account_data.zerodha_user_id else None,
+        zerodha_password_enc=vault.encrypt(account_data.zerodha_password) if account_data.zerodha_password else None
     )
-    db.add(new_account)
-    db.commit()
-    db.refresh(new_account)
+    new_account, = await run_db(save_accounts, [new_account])
 
     return AccountResponse(
         id=new_account.id,
@@ -195,40 +596,63 @@ async def create_account(
         total_pnl=0.0
     )
 
+@app.post("/api/accounts/bulk", response_model=List[AccountResponse])
+async def create_accounts(
+    payload: BulkAccountCreate,
+    current_user: AuthenticatedUser = Depends(get_current_active_user)
+):
+    accounts = [
+        ZerodhaAccount(
+            user_id=current_user.id,
+            nickname=account_data.nickname,
+            api_key=account_data.api_key,
+            api_secret_enc=vault.encrypt(account_data.api_secret),
+            zerodha_user_id_enc=vault.encrypt(account_data.zerodha_user_id) if account_data.zerodha_user_id else None,
+            zerodha_password_enc=vault.encrypt(account_data.zerodha_password) if account_data.zerodha_password else None
+        )
+        for account_data in payload.accounts
+    ]
+    accounts = await run_db(save_accounts, accounts)
+
+    return [
+        AccountResponse(
+            id=account.id,
+            nickname=account.nickname,
+            api_key=account.api_key,
+            is_active=True,
+            last_login=None,
+            total_pnl=0.0
+        )
+        for account in accounts
+    ]
+
 @app.delete("/api/accounts/{account_id}")
 async def delete_account(
     account_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: AuthenticatedUser = Depends(get_current_active_user)
 ):
-    account = db.query(ZerodhaAccount).filter(
-        ZerodhaAccount.id == account_id,
-        ZerodhaAccount.user_id == current_user.id
-    ).first()
-
-    if not account:
+    if not await run_db(delete_user_account, current_user.id, account_id):
         raise HTTPException(status_code=404, detail="Account not found")
 
-    db.delete(account)
-    db.commit()
+    kite_clients.invalidate(account_id)
+    vault.forget(account_id)
+    if position_store is not None:
+        position_store.forget(account_id)
+    risk_engine.forget(account_id)
     return {"success": True, "message": "Account deleted"}
 
 # ========== Zerodha OAuth Endpoints ==========
 @app.post("/api/accounts/{account_id}/request-token")
 async def request_token(
     account_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: AuthenticatedUser = Depends(get_current_active_user)
 ):
-    account = db.query(ZerodhaAccount).filter(
-        ZerodhaAccount.id == account_id,
-        ZerodhaAccount.user_id == current_user.id
-    ).first()
+    account = await run_db(load_user_account, current_user.id, account_id)
 
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
 
-    kite = KiteConnect(api_key=account.api_key)
+    kite = new_kite_client(account.api_key, account.id, root=settings.KITE_API_ROOT)
     login_url = kite.login_url()
 
     return {"login_url": login_url}
@@ -236,129 +660,461 @@ async def request_token(
 @app.post("/api/accounts/set-token", response_model=APIResponse)
 async def set_token(
     token_data: SetTokenRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: AuthenticatedUser = Depends(get_current_active_user)
 ):
-    account = db.query(ZerodhaAccount).filter(
-        ZerodhaAccount.id == token_data.account_id,
-        ZerodhaAccount.user_id == current_user.id
-    ).first()
+    account = await run_db(load_user_account, current_user.id, token_data.account_id)
 
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
 
     try:
-        kite = KiteConnect(api_key=account.api_key)
-        # Decrypt API secret
-        api_secret = decrypt_data(account.api_secret_enc)
-        data = kite.generate_session(token_data.request_token, api_secret=api_secret)
+        kite = new_kite_client(account.api_key, account.id, root=settings.KITE_API_ROOT)
+        api_secret = vault.reveal(account.id, "api_secret_enc", account.api_secret_enc)
+        data = await broker.call(
+            account.api_key, DEFAULT, kite.generate_session,
+            token_data.request_token, api_secret=api_secret, priority=PRIORITY_SESSION
+        )
 
         # Store access token
-        account.access_token = encrypt_data(data["access_token"])
+        account.access_token = vault.encrypt(data["access_token"])
         account.request_token = token_data.request_token
         account.public_token = data.get("public_token")
-        account.last_login = datetime.now()
-
-        db.commit()
+        account.last_login = datetime.now(timezone.utc)
+
+        await run_db(save_sessions, [{
+            "id": account.id,
+            "access_token": account.access_token,
+            "request_token": account.request_token,
+            "public_token": account.public_token,
+            "last_login": account.last_login
+        }])
+        kite_clients.invalidate(account.id)
+        positions_cache.refresh_soon(account)
 
         return APIResponse(success=True, message="Access token set successfully", data={"access_token": data["access_token"]})
 
+    except ExecutorSaturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to set access token: {str(e)}")
 
-# ========== Order Endpoints ==========
-@app.post("/api/orders/place", response_model=PlaceOrderResponse)
-async def place_order(
-    order_data: OrderPlaceRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+# ========== Daily Session Refresh ==========
+def account_readiness(accounts: List[ZerodhaAccount], failures: dict = None, now: datetime = None) -> ReadinessResponse:
+    # Which accounts hold a token that is still good for today's session
+    now = datetime.now(timezone.utc) if now is None else now
+    failures = failures or {}
+    opens = market_open(now)
+    rows = []
+    for account in accounts:
+        ready = session_valid(account.last_login, bool(account.access_token), now)
+        message = None
+        if not account.access_token:
+            message = "Not logged in"
+        elif not ready:
+            message = "Session expired, log in again"
+        elif account.id in failures:
+            ready = False
+            message = failures[account.id]
+        rows.append(AccountReadiness(
+            account_id=account.id,
+            nickname=account.nickname,
+            ready=ready,
+            last_login=account.last_login,
+            message=message
+        ))
+    return ReadinessResponse(
+        market_open=opens,
+        seconds_to_open=max(0.0, (opens - now).total_seconds()),
+        ready=sum(row.ready for row in rows),
+        total=len(rows),
+        accounts=rows
+    )
+
+async def exchange_request_token(item: tuple):
+    account, request_token = item
+    kite = new_kite_client(account.api_key, account.id, root=settings.KITE_API_ROOT)
+    api_secret = vault.reveal(account.id, "api_secret_enc", account.api_secret_enc)
+    return await broker.call(
+        account.api_key, DEFAULT, kite.generate_session,
+        request_token, api_secret=api_secret, priority=PRIORITY_SESSION
+    )
+
+@app.post("/api/accounts/set-tokens", response_model=BulkSetTokenResponse)
+async def set_tokens(
+    payload: BulkSetTokenRequest,
+    current_user: AuthenticatedUser = Depends(get_current_active_user)
 ):
-    results = []
-    INDEX_LOT_SIZES = {"NIFTY": 65, "BANKNIFTY": 35, "SENSEX": 20}
+    # Last token wins if an account is listed twice
+    tokens = {item.account_id: item.request_token for item in payload.tokens}
+    accounts = await run_db(load_user_accounts, current_user.id)
+    by_id = {account.id: account for account in accounts}
+    results = {
+        account_id: SessionResult(account_id=account_id, success=False, message="Account not found")
+        for account_id in tokens if account_id not in by_id
+    }
 
-    # Get accounts
-    accounts = db.query(ZerodhaAccount).filter(
-        ZerodhaAccount.id.in_(order_data.account_ids),
-        ZerodhaAccount.user_id == current_user.id
-    ).all()
+    # Exchange every request token in parallel; the broker scheduler keeps
+    # each api key under Kite's rate limit
+    exchanged = await fan_out(
+        [(by_id[account_id], token) for account_id, token in tokens.items() if account_id in by_id],
+        exchange_request_token,
+        max_concurrency=settings.SESSION_REFRESH_CONCURRENCY,
+        timeout=settings.SESSION_REFRESH_TIMEOUT
+    )
 
-    if not accounts:
-        raise HTTPException(status_code=404, detail="No valid accounts found")
+    now = datetime.now(timezone.utc)
+    sessions = []
+    logged_in = []
+    for outcome in exchanged:
+        account, request_token = outcome.item
+        elapsed = round(outcome.elapsed, 3)
+        if outcome.ok:
+            data = outcome.value
+            sessions.append({
+                "id": account.id,
+                "access_token": vault.encrypt(data["access_token"]),
+                "request_token": request_token,
+                "public_token": data.get("public_token"),
+                "last_login": now
+            })
+            logged_in.append((account, elapsed))
+            continue
+        count_error("session_refresh", outcome.error or asyncio.TimeoutError())
+        if outcome.timed_out:
+            message = f"Timed out after {settings.SESSION_REFRESH_TIMEOUT}s, log in again for a new request token"
+        else:
+            message = f"Failed to set access token: {outcome.error}"
+        results[account.id] = SessionResult(account_id=account.id, success=False, message=message, elapsed=elapsed)
+
+    if sessions:
+        await run_db(save_sessions, sessions)
+        for (account, elapsed), session in zip(logged_in, sessions):
+            account.access_token = session["access_token"]
+            account.request_token = session["request_token"]
+            account.public_token = session["public_token"]
+            account.last_login = now
+            kite_clients.invalidate(account.id)
+            results[account.id] = SessionResult(
+                account_id=account.id, success=True, message="Access token set successfully", elapsed=elapsed
+            )
+        positions_cache.refresh_soon(*(account for account, _ in logged_in))
 
-    # Calculate quantity
-    lot_size = INDEX_LOT_SIZES.get(order_data.index, 1)
-    quantity = order_data.lots * lot_size
+    return BulkSetTokenResponse(
+        results=[results[account_id] for account_id in tokens],
+        readiness=account_readiness(accounts, now=now)
+    )
 
-    # Generate trading symbol
-    # You'll need to implement instrument lookup or use the existing helper
-    tradingsymbol = f"{order_data.index}{order_data.expiry.replace('-', '')}{order_data.strike}{order_data.option_type}"
+@app.get("/api/accounts/readiness", response_model=ReadinessResponse)
+async def get_readiness(
+    verify: bool = False,
+    current_user: AuthenticatedUser = Depends(get_current_active_user)
+):
+    accounts = await run_db(load_user_accounts, current_user.id)
+    failures = {}
+    if verify:
+        # Ask Kite whether each live-looking token is really accepted
+        async def check(account: ZerodhaAccount):
+            kite = kite_clients.get(account)
+            return await broker.call(account.api_key, DEFAULT, kite.profile, priority=PRIORITY_SESSION)
+
+        now = datetime.now(timezone.utc)
+        checked = await fan_out(
+            [a for a in accounts if session_valid(a.last_login, bool(a.access_token), now)],
+            check,
+            max_concurrency=settings.SESSION_REFRESH_CONCURRENCY,
+            timeout=settings.SESSION_REFRESH_TIMEOUT
+        )
+        for outcome in checked:
+            if outcome.timed_out:
+                failures[outcome.item.id] = "Kite did not answer in time"
+            elif outcome.error is not None:
+                failures[outcome.item.id] = f"Token rejected: {outcome.error}"
+    return account_readiness(accounts, failures)
+
+# ========== Order Helpers ==========
+@dataclass
+class OrderLeg:
+    tradingsymbol: str
+    exchange: str
+    transaction_type: str
+    quantity: int
+    product: str
+    order_type: str
+    price: Optional[float]
+    amo: bool
+    instrument: Optional[Instrument] = None
+    tag: Optional[str] = None  # Kite order tag, looked up when an outcome is unknown
+
+async def resolve_order_leg(
+    index: str, expiry: str, strike: str, option_type: str, lots: int,
+    transaction_type: str, product: str, order_type: str, price: Optional[float], amo: bool
+) -> OrderLeg:
+    # Resolve the contract from the instrument master
+    try:
+        if not instrument_master.loaded:
+            await asyncio.to_thread(instrument_master.load)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Instrument master unavailable: {str(e)}")
 
-    for account in accounts:
-        try:
-            if not account.access_token:
-                results.append({
-                    "account": account.nickname,
-                    "success": False,
-                    "message": "Account not logged in"
-                })
-                continue
+    try:
+        instrument = instrument_master.resolve(index, expiry, strike, option_type)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid strike: {strike}")
+
+    if instrument is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"No {index} {expiry} {strike} {option_type} contract found"
+        )
+
+    if price and instrument.tick_size:
+        price = round(round(price / instrument.tick_size) * instrument.tick_size, 2)
+
+    return OrderLeg(
+        tradingsymbol=instrument.tradingsymbol,
+        exchange=instrument.exchange,
+        transaction_type=transaction_type,
+        quantity=lots * instrument.lot_size,
+        product=product,
+        order_type=order_type,
+        price=price,
+        amo=amo,
+        instrument=instrument
+    )
 
-            kite = get_kite_instance(account)
+async def pre_trade_check(accounts: List[ZerodhaAccount], leg: OrderLeg):
+    # Exposure of every target account with this leg added, from the cached
+    # snapshots. Only the Redis read leaves the loop; unchanged books reuse
+    # their layout, so the check itself stays in the low milliseconds
+    account_ids = [account.id for account in accounts]
+    raw = await asyncio.to_thread(positions_cache.read_raw, account_ids)
+    portfolio = risk_engine.portfolio(raw, account_ids)
+    return risk_engine.check(
+        portfolio, leg.instrument, leg.transaction_type, leg.quantity,
+        price=leg.price if leg.order_type == "LIMIT" else None,
+        max_loss=settings.RISK_MAX_LOSS,
+        max_notional=settings.RISK_MAX_NOTIONAL
+    )
 
-            # Decrypt access token
-            access_token = decrypt_data(account.access_token)
-            kite.set_access_token(access_token)
+async def submit_leg(account: ZerodhaAccount, leg: OrderLeg):
+    if not account.access_token:
+        return {
+            "account": account.nickname,
+            "account_id": account.id,
+            "success": False,
+            "message": "Account not logged in"
+        }, None
+
+    kite = get_kite_instance(account)
+
+    # Place order
+    variety = kite.VARIETY_AMO if leg.amo else kite.VARIETY_REGULAR
+
+    order_params = {
+        "exchange": leg.exchange,
+        "tradingsymbol": leg.tradingsymbol,
+        "transaction_type": leg.transaction_type,
+        "quantity": leg.quantity,
+        "product": leg.product,
+        "order_type": leg.order_type,
+        "validity": kite.VALIDITY_DAY
+    }
 
-            # Place order
-            exchange = "BFO" if order_data.index == "SENSEX" else "NFO"
-            variety = kite.VARIETY_AMO if order_data.amo else kite.VARIETY_REGULAR
+    if leg.order_type == "LIMIT" and leg.price:
+        order_params["price"] = leg.price
+    if leg.tag:
+        order_params["tag"] = leg.tag
 
-            order_params = {
-                "exchange": exchange,
-                "tradingsymbol": tradingsymbol,
-                "transaction_type": order_data.transaction_type,
-                "quantity": quantity,
-                "product": order_data.product,
-                "order_type": order_data.order_type,
-                "validity": kite.VALIDITY_DAY
-            }
+    order_id = await broker.call(
+        account.api_key, ORDER, kite.place_order,
+        variety=variety, priority=PRIORITY_ORDER, **order_params
+    )
 
-            if order_data.order_type == "LIMIT" and order_data.price:
-                order_params["price"] = order_data.price
-
-            order_id = kite.place_order(variety=variety, **order_params)
-
-            # Save order to database
-            new_order = Order(
-                account_id=account.id,
-                order_id=str(order_id),
-                tradingsymbol=tradingsymbol,
-                exchange=exchange,
-                transaction_type=order_data.transaction_type,
-                quantity=quantity,
-                product=order_data.product,
-                order_type=order_data.order_type,
-                price=order_data.price,
-                status="pending",
-                variety="amo" if order_data.amo else "regular",
-                kite_order_id=str(order_id)
-            )
-            db.add(new_order)
-            db.commit()
+    return {
+        "account": account.nickname,
+        "account_id": account.id,
+        "success": True,
+        "order_id": str(order_id),
+        "message": "Order placed successfully"
+    }, leg_order_row(account, leg, order_id)
+
+def leg_order_row(account: ZerodhaAccount, leg: OrderLeg, order_id) -> dict:
+    return {
+        "account_id": account.id,
+        "order_id": str(order_id),
+        "tradingsymbol": leg.tradingsymbol,
+        "exchange": leg.exchange,
+        "transaction_type": leg.transaction_type,
+        "quantity": leg.quantity,
+        "product": leg.product,
+        "order_type": leg.order_type,
+        "price": leg.price,
+        "status": "pending",
+        "variety": "amo" if leg.amo else "regular",
+        "kite_order_id": str(order_id),
+        "tag": leg.tag
+    }
 
-            results.append({
+async def find_tagged_order(account: ZerodhaAccount, leg: OrderLeg):
+    # The leg's order in the account's order book, if it reached Kite
+    if not (account.access_token and leg.tag):
+        return None
+    kite = get_kite_instance(account)
+    orders = await broker.call(account.api_key, DEFAULT, kite.orders, priority=PRIORITY_ORDER)
+    for order in orders or []:
+        tags = order.get("tags") or [order.get("tag")]
+        if (leg.tag in tags and order.get("tradingsymbol") == leg.tradingsymbol
+                and order.get("transaction_type") == leg.transaction_type):
+            return {
                 "account": account.nickname,
+                "account_id": account.id,
                 "success": True,
-                "order_id": str(order_id),
-                "message": "Order placed successfully"
+                "order_id": str(order["order_id"]),
+                "message": "Order placed by an earlier attempt",
+                "recovered": True
+            }, leg_order_row(account, leg, order["order_id"])
+    return None
+
+async def recover_leg(account: ZerodhaAccount, leg: OrderLeg):
+    # An earlier attempt timed out; if its tagged order reached Kite, adopt it
+    # instead of placing a second one
+    found = await find_tagged_order(account, leg)
+    if found is not None:
+        return found
+    return await submit_leg(account, leg)
+
+async def dispatch_leg(accounts: List[ZerodhaAccount], leg: OrderLeg, recover: frozenset = frozenset()):
+    async def submit(account: ZerodhaAccount):
+        if account.id in recover:
+            return await recover_leg(account, leg)
+        return await submit_leg(account, leg)
+
+    # Send one leg to all accounts in parallel
+    dispatched = await fan_out(
+        accounts,
+        submit,
+        max_concurrency=settings.ORDER_DISPATCH_CONCURRENCY,
+        timeout=settings.ORDER_DISPATCH_TIMEOUT
+    )
+
+    results = []
+    order_rows = []
+    unknown = []
+    for outcome in dispatched:
+        if outcome.timed_out:
+            count_error("order_dispatch", asyncio.TimeoutError())
+            results.append({
+                "account": outcome.item.nickname,
+                "account_id": outcome.item.id,
+                "success": False,
+                "message": f"Timed out after {settings.ORDER_DISPATCH_TIMEOUT}s, check order book for status",
+                "outcome_unknown": True,
+                "tag": leg.tag
             })
+            unknown.append(outcome.item)
+        elif outcome.error is not None:
+            result = {
+                "account": outcome.item.nickname,
+                "account_id": outcome.item.id,
+                "success": False,
+                "message": str(outcome.error)
+            }
+            if outcome_unknown(outcome.error):
+                result["outcome_unknown"] = True
+                result["tag"] = leg.tag
+                unknown.append(outcome.item)
+            elif broker_rejected(outcome.error):
+                result["rejected"] = True
+            results.append(result)
+        else:
+            result, order_row = outcome.value
+            results.append(result)
+            if order_row is not None:
+                order_rows.append(order_row)
+
+    if unknown and leg.tag:
+        # One look in the order book for the tag; whatever is found is adopted,
+        # the rest stays unknown for the client (or an idempotent retry) to settle
+        async def lookup(account: ZerodhaAccount):
+            return await find_tagged_order(account, leg)
+
+        found = await fan_out(
+            unknown,
+            lookup,
+            max_concurrency=settings.ORDER_DISPATCH_CONCURRENCY,
+            timeout=settings.ORDER_DISPATCH_TIMEOUT
+        )
+        adopted = {outcome.item.id: outcome.value for outcome in found if outcome.ok and outcome.value}
+        results = [adopted[r["account_id"]][0] if r["account_id"] in adopted else r for r in results]
+        order_rows.extend(order_row for _, order_row in adopted.values())
+    return results, order_rows
+
+async def persist_orders(order_rows: List[dict]):
+    # Save all orders to database in one write
+    if not order_rows:
+        return
+    try:
+        await run_db(save_orders, order_rows)
+    except Exception as e:
+        count_error("order_persist", e)
+        logger.exception("Failed to persist %d placed orders", len(order_rows))
 
+# ========== Order Endpoints ==========
+@app.post("/api/orders/place", response_model=PlaceOrderResponse)
+async def place_order(
+    order_data: OrderPlaceRequest,
+    current_user: AuthenticatedUser = Depends(get_current_active_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", min_length=1, max_length=64)
+):
+    # Get accounts
+    accounts = await run_db(load_user_accounts, current_user.id, order_data.account_ids)
+
+    if not accounts:
+        raise HTTPException(status_code=404, detail="No valid accounts found")
+
+    leg = await resolve_order_leg(
+        order_data.index, order_data.expiry, order_data.strike, order_data.option_type,
+        order_data.lots, order_data.transaction_type, order_data.product,
+        order_data.order_type, order_data.price, order_data.amo
+    )
+
+    # A retry with the same Idempotency-Key gets the stored per-account results
+    # back and only places orders for accounts that were never attempted
+    replayed = []
+    recover = frozenset()
+    leg.tag = request_tag(current_user.id, idempotency_key)
+    if idempotency_key:
+        claims = await claim_idempotency_key(current_user.id, idempotency_key, order_data, accounts)
+        replayed = await replay_claimed(current_user.id, idempotency_key, accounts, claims)
+        recover = frozenset(account_id for account_id, state in claims.items() if state == RECLAIMED)
+        accounts = [account for account in accounts if claims[account.id] in (CLAIMED, RECLAIMED)]
+
+    blocked = []
+    if settings.RISK_CHECK_ENABLED and accounts:
+        try:
+            checks = {check.account_id: check for check in await pre_trade_check(accounts, leg)}
         except Exception as e:
-            results.append({
+            # Fail open: the broker's own margin checks still apply
+            count_error("risk_check", e)
+            logger.exception("Pre-trade risk check failed")
+            checks = {}
+        blocked = [
+            {
                 "account": account.nickname,
+                "account_id": account.id,
                 "success": False,
-                "message": str(e)
-            })
+                "message": f"Blocked by risk check: {checks[account.id].reason}"
+            }
+            for account in accounts
+            if account.id in checks and not checks[account.id].allowed
+        ]
+        accounts = [account for account in accounts if account.id not in checks or checks[account.id].allowed]
+
+    results, order_rows = await dispatch_leg(accounts, leg, recover) if accounts else ([], [])
+    if idempotency_key:
+        await store_idempotent_results(current_user.id, idempotency_key, blocked + results)
+    results = replayed + blocked + results
+    await persist_orders(order_rows)
 
     success_count = sum(1 for r in results if r.get("success"))
     total_count = len(results)
@@ -369,44 +1125,407 @@ async def place_order(
         orders=results
     )
 
+async def claim_idempotency_key(user_id: int, key: str, order_data: OrderPlaceRequest,
+                                accounts: List[ZerodhaAccount]) -> dict:
+    fingerprint = request_fingerprint({**order_data.model_dump(), "account_ids": sorted(order_data.account_ids)})
+    try:
+        return await asyncio.to_thread(
+            order_keys.claim, user_id, key, fingerprint, [account.id for account in accounts]
+        )
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except redis.RedisError as e:
+        # Without the store a retry could double the orders; refuse instead
+        count_error("idempotency", e)
+        raise HTTPException(status_code=503, detail="Idempotency store unavailable, retry shortly")
+
+async def replay_claimed(user_id: int, key: str, accounts: List[ZerodhaAccount], claims: dict) -> List[dict]:
+    # Stored results as-is; accounts another request is still placing are
+    # waited on for up to the dispatch timeout
+    nicknames = {account.id: account.nickname for account in accounts}
+    stored = {account_id: state for account_id, state in claims.items() if isinstance(state, dict)}
+    pending = [account_id for account_id, state in claims.items() if state == INFLIGHT]
+    if pending:
+        stored.update(await order_keys.wait(user_id, key, pending, settings.ORDER_DISPATCH_TIMEOUT))
+
+    replayed = []
+    for account_id, state in stored.items():
+        if isinstance(state, dict):
+            replayed.append({**state, "replayed": True})
+        elif state is None:
+            # The other request released the slot without reaching the broker
+            replayed.append({
+                "account": nicknames[account_id],
+                "account_id": account_id,
+                "success": False,
+                "message": "An earlier request with this Idempotency-Key did not place this order, retry"
+            })
+        else:
+            replayed.append({
+                "account": nicknames[account_id],
+                "account_id": account_id,
+                "success": False,
+                "message": "An earlier request with this Idempotency-Key is still placing this order"
+                if state == INFLIGHT else
+                "Outcome of an earlier attempt is unknown, retry with the same Idempotency-Key",
+                "outcome_unknown": True
+            })
+    return replayed
+
+async def store_idempotent_results(user_id: int, key: str, results: List[dict]):
+    # Only what the broker decided is final; failures that never reached it
+    # (no session, risk block, saturation) release the slot for a retry
+    final = {}
+    released = []
+    for result in results:
+        if result.get("outcome_unknown"):
+            final[result["account_id"]] = None
+        elif result.get("success") or result.get("rejected"):
+            final[result["account_id"]] = result
+        else:
+            released.append(result["account_id"])
+    try:
+        await asyncio.to_thread(order_keys.complete, user_id, key, final, released)
+    except Exception as e:
+        # Slots stay in flight and are reclaimed (tag lookup first) once stale
+        count_error("idempotency", e)
+        logger.exception("Failed to store idempotent order results")
+
+@app.post("/api/orders/basket")
+async def place_basket(
+    basket: BasketOrderRequest,
+    current_user: AuthenticatedUser = Depends(get_current_active_user)
+):
+    accounts = await run_db(load_user_accounts, current_user.id, basket.account_ids)
+
+    if not accounts:
+        raise HTTPException(status_code=404, detail="No valid accounts found")
+
+    # Validate and resolve every leg before anything is sent
+    legs = [
+        await resolve_order_leg(
+            leg.index, leg.expiry, leg.strike, leg.option_type, leg.lots,
+            leg.transaction_type, basket.product, leg.order_type, leg.price, basket.amo
+        )
+        for leg in basket.legs
+    ]
+    for leg in legs:
+        leg.tag = request_tag(current_user.id)
+
+    # Hedge (BUY) legs go first so short legs get the margin benefit and no
+    # account is left naked short if its hedge fails
+    sequence = sorted(range(len(legs)), key=lambda i: legs[i].transaction_type != "BUY")
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def run_basket():
+        order_rows = []
+        hedge_failed = set()
+        placed = 0
+        try:
+            for step, leg_index in enumerate(sequence):
+                leg = legs[leg_index]
+                eligible = [
+                    account for account in accounts
+                    if leg.transaction_type == "BUY" or account.id not in hedge_failed
+                ]
+                results, leg_rows = await dispatch_leg(eligible, leg)
+                if leg.transaction_type == "BUY":
+                    hedge_failed.update(r["account_id"] for r in results if not r["success"])
+                else:
+                    results.extend({
+                        "account": account.nickname,
+                        "account_id": account.id,
+                        "success": False,
+                        "message": "Skipped: hedge leg failed for this account"
+                    } for account in accounts if account not in eligible)
+                order_rows.extend(leg_rows)
+                placed += len(leg_rows)
+                await events.put({
+                    "event": "leg",
+                    "step": step + 1,
+                    "leg": leg_index,
+                    "tradingsymbol": leg.tradingsymbol,
+                    "transaction_type": leg.transaction_type,
+                    "placed": len(leg_rows),
+                    "total": len(accounts),
+                    "orders": results
+                })
+
+            await persist_orders(order_rows)
+            await events.put({
+                "event": "done",
+                "success": placed > 0,
+                "message": f"Orders placed: {placed}/{len(legs) * len(accounts)}"
+            })
+        except Exception as e:
+            logger.exception("Basket dispatch failed")
+            await persist_orders(order_rows)
+            await events.put({"event": "error", "message": str(e)})
+        finally:
+            await events.put(None)
+
+    # Dispatch runs independently of the response, so a client that drops
+    # mid-stream can't stop legs half-way or lose the order rows
+    spawn(run_basket())
+
+    async def stream():
+        yield dumps_str({
+            "event": "accepted",
+            "legs": [
+                {"leg": i, "tradingsymbol": legs[i].tradingsymbol, "quantity": legs[i].quantity,
+                 "transaction_type": legs[i].transaction_type}
+                for i in sequence
+            ],
+            "accounts": len(accounts)
+        }) + "\n"
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            yield dumps_str(event) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.get("/api/orders", response_model=OrderHistoryResponse)
+async def get_order_history(
+    account_id: Optional[int] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    current_user: AuthenticatedUser = Depends(get_current_active_user)
+):
+    account_ids = await run_db(load_user_account_ids, current_user.id)
+    if account_id is not None:
+        if account_id not in account_ids:
+            raise HTTPException(status_code=404, detail="Account not found")
+        account_ids = [account_id]
+    if not account_ids:
+        return OrderHistoryResponse(orders=[])
+
+    try:
+        orders, next_cursor = await run_db(order_history_page, account_ids, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return OrderHistoryResponse(
+        orders=[OrderResponse.model_validate(order) for order in orders],
+        next_cursor=next_cursor
+    )
+
+@app.post("/api/postback")
+async def order_postback(request: Request):
+    # Kite order postback; checksums are verified when the batch is applied
+    try:
+        payload = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid postback payload")
+    if not isinstance(payload, dict) or not payload.get("order_id") or not payload.get("checksum"):
+        raise HTTPException(status_code=400, detail="Invalid postback payload")
+
+    order_reconciler.submit_postback(payload)
+    return {"success": True}
+
+# ========== Risk Endpoints ==========
+@app.get("/api/risk", response_model=RiskResponse)
+async def get_risk(current_user: AuthenticatedUser = Depends(get_current_active_user)):
+    account_ids = await run_db(load_user_account_ids, current_user.id, True)
+    raw = await asyncio.to_thread(positions_cache.read_raw, account_ids)
+    portfolio = risk_engine.portfolio(raw, account_ids)
+    grid = risk_engine.scenarios(portfolio)
+    pnl = portfolio.per_account(portfolio.pnl)
+    notional = risk_engine.notional(portfolio)
+    return RiskResponse(
+        moves=risk_engine.moves.tolist(),
+        exposure=risk_engine.exposure(portfolio),
+        accounts=[
+            {
+                "account_id": account_id,
+                "pnl": float(pnl[i]),
+                "notional": float(notional[i]),
+                "worst_case": float(grid[i].min()),
+                "scenarios": grid[i].tolist(),
+            }
+            for i, account_id in enumerate(portfolio.account_ids)
+        ],
+        scenarios=grid.sum(axis=0).tolist(),
+        missing_spot=portfolio.missing_spot
+    )
+
+@app.post("/api/risk/check", response_model=List[RiskCheckResponse])
+async def check_order_risk(
+    order_data: OrderPlaceRequest,
+    current_user: AuthenticatedUser = Depends(get_current_active_user)
+):
+    # Dry run of the pre-trade check place_order applies
+    accounts = await run_db(load_user_accounts, current_user.id, order_data.account_ids)
+    if not accounts:
+        raise HTTPException(status_code=404, detail="No valid accounts found")
+
+    leg = await resolve_order_leg(
+        order_data.index, order_data.expiry, order_data.strike, order_data.option_type,
+        order_data.lots, order_data.transaction_type, order_data.product,
+        order_data.order_type, order_data.price, order_data.amo
+    )
+    return [RiskCheckResponse(**vars(check)) for check in await pre_trade_check(accounts, leg)]
+
 # ========== Position Endpoints ==========
+def stream_events(events, fmt: str) -> StreamingResponse:
+    # NDJSON lines, or Server-Sent Events named after each event's type
+    async def encode():
+        async for event in events:
+            if fmt == "sse":
+                yield f"event: {event['event']}\ndata: {dumps_str(event)}\n\n"
+            else:
+                yield dumps_str(event) + "\n"
+
+    if fmt == "sse":
+        return StreamingResponse(encode(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    return StreamingResponse(encode(), media_type="application/x-ndjson")
+
+async def position_events(user_id: int, live: bool):
+    """One event per account as soon as its positions are known, then a summary.
+
+    Accounts with a snapshot are sent straight away; the rest (or every
+    account, with ``live``) are fetched from Kite concurrently and sent in
+    the order they finish. Failures are reported with the last snapshot, if
+    there is one, instead of being left out.
+    """
+    started = time.perf_counter()
+    accounts = await run_db(load_user_accounts, user_id)
+    snapshots = positions_cache.read(account.id for account in accounts if account.access_token)
+    statuses = {}
+
+    def account_event(account: ZerodhaAccount, status_: str, snapshot=None, source: str = None, message: str = None) -> dict:
+        statuses[account.id] = status_
+        event = {
+            "event": "account",
+            "account_id": account.id,
+            "nickname": account.nickname,
+            "status": status_,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+        if message:
+            event["message"] = message
+        if snapshot is not None:
+            event["source"] = source
+            event["snapshot_age"] = round(snapshot.age, 3)
+            event["total_pnl"] = snapshot.total_pnl
+            event["positions"] = list(position_rows(account.id, snapshot.positions()).values())
+        return event
+
+    semaphore = asyncio.Semaphore(settings.POSITIONS_REFRESH_CONCURRENCY)
+
+    async def fetch(account: ZerodhaAccount) -> dict:
+        async with semaphore:
+            try:
+                snapshot = await positions_cache.refresh_account(account)
+                return account_event(account, "ok", snapshot, "kite")
+            except asyncio.TimeoutError as e:
+                count_error("positions_stream", e)
+                return account_event(account, "timeout", snapshots.get(account.id), "snapshot",
+                                     f"Kite did not answer within {settings.KITE_HTTP_TIMEOUT}s")
+            except Exception as e:
+                count_error("positions_stream", e)
+                return account_event(account, "error", snapshots.get(account.id), "snapshot", str(e))
+
+    pending = []
+    for account in accounts:
+        if not account.access_token:
+            yield account_event(account, "not_logged_in", message="Not logged in")
+        elif account.id in snapshots and not live:
+            yield account_event(account, "ok", snapshots[account.id], "snapshot")
+        else:
+            pending.append(account)
+
+    tasks = [asyncio.create_task(fetch(account)) for account in pending]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        # The client went away; stop fetching for it
+        for task in tasks:
+            task.cancel()
+
+    yield {
+        "event": "done",
+        "accounts": len(accounts),
+        "ok": sum(1 for status_ in statuses.values() if status_ == "ok"),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
+
 @app.get("/api/positions", response_model=List[PositionResponse])
 async def get_positions(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    stream: Optional[str] = Query(None, pattern="^(ndjson|sse)$"),
+    live: bool = False,
+    current_user: AuthenticatedUser = Depends(get_current_active_user)
 ):
+    # ?stream=ndjson|sse sends each account as it is ready, with its own status
+    if stream is not None:
+        return stream_events(position_events(current_user.id, live), stream)
+
     # Get user's accounts
-    accounts = db.query(ZerodhaAccount).filter(
-        ZerodhaAccount.user_id == current_user.id,
-        ZerodhaAccount.access_token.isnot(None)
-    ).all()
+    account_ids = await run_db(load_user_account_ids, current_user.id, True)
 
+    # Served from the background snapshot, never from Kite directly
+    snapshots = positions_cache.read(account_ids)
     all_positions = []
 
-    for account in accounts:
-        try:
-            kite = get_kite_instance(account)
-            access_token = decrypt_data(account.access_token)
-            kite.set_access_token(access_token)
-
-            positions = kite.positions()
-            if 'net' in positions:
-                for pos in positions['net']:
-                    if abs(pos.get('quantity', 0)) > 0:
-                        all_positions.append({
-                            "account_id": account.id,
-                            "tradingsymbol": pos.get('tradingsymbol'),
-                            "exchange": pos.get('exchange'),
-                            "quantity": pos.get('quantity'),
-                            "product": pos.get('product'),
-                            "pnl": pos.get('pnl', 0),
-                            "avg_price": pos.get('average_price'),
-                            "last_price": pos.get('last_price')
-                        })
-        except Exception as e:
-            pass  # Skip failed accounts
+    # Rows are built here already in PositionResponse's shape, so they skip
+    # per-row model validation and go straight to orjson
+    for account_id, snapshot in snapshots.items():
+        for row in position_rows(account_id, snapshot.positions()).values():
+            all_positions.append({field: row.get(field) for field in POSITION_FIELDS})
+
+    headers = {}
+    if snapshots:
+        headers["X-Snapshot-Age"] = f"{max(s.age for s in snapshots.values()):.3f}"
+
+    return FastJSONResponse(all_positions, headers=headers)
 
-    return all_positions
+@app.get("/api/pnl/history", response_model=List[PnLHistoryResponse])
+async def get_pnl_history(
+    account_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    current_user: AuthenticatedUser = Depends(get_current_active_user)
+):
+    # Intraday curves come from the history table, never from Kite
+    account_ids = await run_db(load_user_account_ids, current_user.id)
+    if account_id is not None:
+        if account_id not in account_ids:
+            raise HTTPException(status_code=404, detail="Account not found")
+        account_ids = [account_id]
+    if since is None:
+        # Start of the current trading day (IST)
+        ist = timezone(timedelta(hours=5, minutes=30))
+        since = datetime.now(ist).replace(hour=0, minute=0, second=0, microsecond=0)
+    elif since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+
+    rows = await run_db(pnl_history.history, account_ids, since)
+    series = {account_id: [] for account_id in account_ids}
+    for row in rows:
+        series[row.account_id].append(PnLPoint(
+            ts=as_utc(row.bucket_start), resolution=row.resolution,
+            open=row.open_pnl, high=row.high_pnl, low=row.low_pnl, close=row.close_pnl
+        ))
+    for account_id, bucket in pnl_history.open_buckets(account_ids).items():
+        if bucket["bucket_start"] >= since:
+            series[account_id].append(PnLPoint(
+                ts=bucket["bucket_start"], resolution=bucket["resolution"],
+                open=bucket["open_pnl"], high=bucket["high_pnl"], low=bucket["low_pnl"], close=bucket["close_pnl"]
+            ))
+
+    return [PnLHistoryResponse(account_id=account_id, points=points) for account_id, points in series.items()]
+
+@app.get("/api/greeks", response_model=GreeksResponse)
+async def get_greeks(current_user: AuthenticatedUser = Depends(get_current_active_user)):
+    # Portfolio Greeks per account and in total, from the same rows /api/positions serves
+    account_ids = await run_db(load_user_account_ids, current_user.id, True)
+    snapshots = positions_cache.read(account_ids)
+    accounts = []
+    for account_id, snapshot in snapshots.items():
+        rows = open_position_rows(account_id, snapshot.positions()).values()
+        accounts.append({"account_id": account_id, **greeks_service.totals(greeks_service.annotate(rows))})
+    return GreeksResponse(accounts=accounts, total=greeks_service.totals(accounts))
 
 # ========== WebSocket for Real-time Updates ==========
 @app.websocket("/ws/positions")
@@ -417,17 +1536,34 @@ async def positions_websocket(websocket: WebSocket, token: str):
         await websocket.close(code=1008)
         return
 
-    user_id = payload.get("sub")
+    user_id = int(payload.get("sub"))
     await manager.connect(websocket, user_id)
+    if ws_fanout is not None:
+        await ws_fanout.subscribe(user_id)
+
+    # Start the client from the latest snapshots, then stream deltas
+    account_ids = await run_db(load_user_account_ids, user_id)
+    snapshots = positions_cache.read(account_ids)
+    position_streamer.seed(user_id, {
+        account_id: position_rows(account_id, snapshot.positions())
+        for account_id, snapshot in snapshots.items()
+    })
 
     try:
+        # Through the socket's queue, so it is ordered with any deltas already queued
+        manager.send(websocket, user_id, position_streamer.snapshot_frame(user_id))
         while True:
-            # Get latest positions
-            # This is a simplified version - you'd want to optimize this
+            # Keep the socket open; updates are pushed by the streamer
             await websocket.receive_text()
 
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket, user_id)
+        if not manager.has_connections(user_id):
+            position_streamer.forget(user_id)
+            if ws_fanout is not None:
+                await ws_fanout.unsubscribe(user_id)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,339 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from array import array
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+# ========== LTP Book ==========
+class LTPBook:
+    """Last traded price per instrument token.
+
+    Prices live in flat ``array('d')`` columns; a dict maps each instrument
+    token to its slot, so lookups and updates never allocate.
+    """
+
+    def __init__(self):
+        self._slots: Dict[int, int] = {}
+        self._prices = array("d")
+        self._updated_at = array("d")
+
+    def slot(self, token: int) -> int:
+        slot = self._slots.get(token)
+        if slot is None:
+            slot = len(self._prices)
+            self._slots[token] = slot
+            self._prices.append(float("nan"))
+            self._updated_at.append(0.0)
+        return slot
+
+    def update(self, token: int, price: float, ts: Optional[float] = None) -> None:
+        slot = self.slot(token)
+        self._prices[slot] = price
+        self._updated_at[slot] = ts if ts is not None else time.time()
+
+    def get(self, token: int) -> Optional[float]:
+        slot = self._slots.get(token)
+        if slot is None:
+            return None
+        price = self._prices[slot]
+        return None if price != price else price  # NaN means no tick yet
+
+    @property
+    def prices(self) -> array:
+        # Indexed by ``slot``; lets vectorized readers gather many prices at once
+        return self._prices
+
+    def age(self, token: int) -> Optional[float]:
+        slot = self._slots.get(token)
+        if slot is None or not self._updated_at[slot]:
+            return None
+        return time.time() - self._updated_at[slot]
+
+    def __contains__(self, token: int) -> bool:
+        return self.get(token) is not None
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+
+# ========== Incremental P&L ==========
+def position_pnl(pos: dict, last_price: float) -> float:
+    # Same formula Kite uses for net positions
+    return (
+        (pos.get("sell_value") or 0) - (pos.get("buy_value") or 0)
+        + (pos.get("quantity") or 0) * last_price * (pos.get("multiplier") or 1)
+    )
+
+
+class LivePnL:
+    """Keeps each account's positions repriced against the LTP book.
+
+    A tick only touches the positions holding that instrument, and account
+    totals are adjusted by the difference instead of being re-summed.
+    """
+
+    def __init__(self, book: LTPBook):
+        self.book = book
+        self._positions: Dict[int, List[dict]] = {}
+        self._owners: Dict[int, int] = {}
+        self._by_token: Dict[int, List[tuple]] = {}
+        self._totals: Dict[int, float] = {}
+
+    def load(self, user_id: int, account_id: int, positions: Iterable[dict]) -> List[dict]:
+        self._drop_index(account_id)
+        positions = [dict(pos) for pos in positions]
+        total = 0.0
+        for pos in positions:
+            token = pos.get("instrument_token")
+            if token is not None:
+                price = self.book.get(token)
+                if price is not None:
+                    pos["last_price"] = price
+                    pos["pnl"] = position_pnl(pos, price)
+                self._by_token.setdefault(token, []).append((account_id, pos))
+            total += pos.get("pnl") or 0
+        self._positions[account_id] = positions
+        self._owners[account_id] = user_id
+        self._totals[account_id] = total
+        return positions
+
+    def _drop_index(self, account_id: int) -> None:
+        for pos in self._positions.get(account_id, []):
+            holders = self._by_token.get(pos.get("instrument_token"))
+            if holders:
+                holders[:] = [(acc, p) for acc, p in holders if acc != account_id]
+                if not holders:
+                    del self._by_token[pos.get("instrument_token")]
+
+    def remove(self, account_id: int) -> None:
+        self._drop_index(account_id)
+        self._positions.pop(account_id, None)
+        self._owners.pop(account_id, None)
+        self._totals.pop(account_id, None)
+
+    def apply_ticks(self, ticks: Iterable[dict]) -> Set[int]:
+        touched = set()
+        for tick in ticks:
+            token = tick.get("instrument_token")
+            price = tick.get("last_price")
+            if token is None or price is None:
+                continue
+            self.book.update(token, price)
+            for account_id, pos in self._by_token.get(token, ()):
+                pnl = position_pnl(pos, price)
+                self._totals[account_id] += pnl - (pos.get("pnl") or 0)
+                pos["pnl"] = pnl
+                pos["last_price"] = price
+                touched.add(account_id)
+        return touched
+
+    def tokens(self) -> Set[int]:
+        return {
+            token for token, holders in self._by_token.items()
+            if any(pos.get("quantity") for _, pos in holders)
+        }
+
+    def positions(self, account_id: int) -> List[dict]:
+        return self._positions.get(account_id, [])
+
+    def owner(self, account_id: int) -> Optional[int]:
+        return self._owners.get(account_id)
+
+    def account_total(self, account_id: int) -> Optional[float]:
+        return self._totals.get(account_id)
+
+
+# ========== Local Tick Replay ==========
+class ReplayTicker:
+    """Stand-in for ``KiteTicker`` that replays ticks from an NDJSON file.
+
+    Each line is ``{"t": seconds_from_start, "ticks": [{"instrument_token": ..,
+    "last_price": ..}, ...]}``. Only the callbacks and methods used by
+    ``MarketDataService`` are implemented.
+    """
+
+    MODE_LTP = "ltp"
+
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = True):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.on_ticks: Optional[Callable] = None
+        self.on_connect: Optional[Callable] = None
+        self.on_close: Optional[Callable] = None
+        self.on_error: Optional[Callable] = None
+        self.subscribed: Set[int] = set()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _frames(self) -> List[dict]:
+        with open(self.path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _run(self) -> None:
+        frames = self._frames()
+        if self.on_connect:
+            self.on_connect(self, None)
+        while not self._stop.is_set():
+            started = time.monotonic()
+            for frame in frames:
+                delay = frame.get("t", 0) / self.speed - (time.monotonic() - started)
+                if delay > 0 and self._stop.wait(delay):
+                    break
+                ticks = [t for t in frame.get("ticks", []) if t.get("instrument_token") in self.subscribed]
+                if ticks and self.on_ticks:
+                    self.on_ticks(self, ticks)
+            if not self.loop:
+                break
+        if self.on_close:
+            self.on_close(self, 1000, "replay finished")
+
+    def connect(self, threaded: bool = True) -> None:
+        self._thread = threading.Thread(target=self._run, name="replay-ticker", daemon=True)
+        self._thread.start()
+
+    def subscribe(self, tokens: List[int]) -> None:
+        self.subscribed.update(tokens)
+
+    def unsubscribe(self, tokens: List[int]) -> None:
+        self.subscribed.difference_update(tokens)
+
+    def set_mode(self, mode: str, tokens: List[int]) -> None:
+        pass
+
+    def is_connected(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def close(self, code=None, reason=None) -> None:
+        self._stop.set()
+
+
+# ========== Market Data Service ==========
+def is_auth_error(reason) -> bool:
+    # KiteTicker reports a rejected access token as a 403 on the handshake
+    text = str(reason)
+    return "403" in text or "Forbidden" in text or "TokenException" in text
+
+
+class MarketDataService:
+    """Feeds KiteTicker LTPs into ``LivePnL`` and publishes repriced positions.
+
+    Ticker callbacks arrive on the ticker's own thread and are handed to the
+    event loop, so all book and P&L state is only touched from the loop.
+    """
+
+    def __init__(
+        self,
+        publish: Callable[[int, int, List[dict]], None],
+        ticker_factory: Optional[Callable[[str, str], object]] = None,
+        replay_file: str = "",
+        extra_tokens: Iterable[int] = (),
+    ):
+        self.book = LTPBook()
+        self.live = LivePnL(self.book)
+        self.publish = publish
+        self.replay_file = replay_file
+        self.extra_tokens = set(extra_tokens)  # always streamed, e.g. index spot prices
+        self.ticker_factory = ticker_factory or self._default_ticker
+        self._ticker = None
+        self._subscribed: Set[int] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _default_ticker(self, api_key: str, access_token: str):
+        if self.replay_file:
+            return ReplayTicker(self.replay_file)
+        from kiteconnect import KiteTicker
+        return KiteTicker(api_key, access_token)
+
+    # ----- Positions -----
+    def load_positions(self, user_id: int, account_id: int, positions: Iterable[dict]) -> List[dict]:
+        return self.live.load(user_id, account_id, positions)
+
+    def ensure_streaming(self, api_key: str, access_token: str) -> None:
+        # Start the ticker with the given account's session (again after it
+        # closed), then keep the subscription in step with the open positions
+        if self._ticker is None:
+            self._loop = asyncio.get_running_loop()
+            self._ticker = self.ticker_factory(api_key, access_token)
+            self._ticker.on_ticks = self._on_ticks
+            self._ticker.on_connect = self._on_connect
+            self._ticker.on_close = self._on_close
+            self._ticker.on_error = self._on_error
+            self._ticker.connect(threaded=True)
+        else:
+            self._sync_subscriptions()
+
+    def _sync_subscriptions(self) -> None:
+        if self._ticker is None or not self._ticker.is_connected():
+            return
+        wanted = self.live.tokens() | self.extra_tokens
+        added = list(wanted - self._subscribed)
+        removed = list(self._subscribed - wanted)
+        if added:
+            self._ticker.subscribe(added)
+            self._ticker.set_mode(self._ticker.MODE_LTP, added)
+        if removed:
+            self._ticker.unsubscribe(removed)
+        self._subscribed = wanted
+
+    def account_total(self, account_id: int) -> Optional[float]:
+        return self.live.account_total(account_id)
+
+    # ----- Ticker callbacks (ticker thread) -----
+    def _on_connect(self, ws, response) -> None:
+        self._call_soon(self._resubscribe)
+
+    def _on_ticks(self, ws, ticks) -> None:
+        self._call_soon(self._apply_ticks, ticks)
+
+    def _on_close(self, ws, code, reason) -> None:
+        logger.info("Ticker closed: %s %s", code, reason)
+        self._call_soon(self._drop_ticker, ws)
+
+    def _on_error(self, ws, code, reason) -> None:
+        logger.warning("Ticker error: %s %s", code, reason)
+        if is_auth_error(reason):
+            # The token is dead; retrying with it would never succeed
+            self._call_soon(self._drop_ticker, ws)
+
+    def _call_soon(self, callback, *args) -> None:
+        try:
+            self._loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            pass  # loop already closed at shutdown
+
+    # ----- Event loop -----
+    def _resubscribe(self) -> None:
+        # A (re)connected ticker starts with no subscriptions
+        self._subscribed = set()
+        self._sync_subscriptions()
+
+    def _drop_ticker(self, ticker) -> None:
+        # The next ensure_streaming starts a fresh ticker, with whichever
+        # account holds a valid session by then
+        if ticker is not self._ticker:
+            return
+        try:
+            ticker.close()
+        except Exception:
+            pass
+        self._ticker = None
+        self._subscribed = set()
+
+    def _apply_ticks(self, ticks) -> None:
+        for account_id in self.live.apply_ticks(ticks):
+            self.publish(self.live.owner(account_id), account_id, self.live.positions(account_id))
+
+    def close(self) -> None:
+        if self._ticker is not None:
+            try:
+                self._ticker.close()
+            except Exception:
+                pass
+            self._ticker = None
+            self._subscribed = set()
@@ -0,0 +1,138 @@
+import time
+from typing import Callable, Dict
+
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+# Broker calls sit in the 10ms-2s range; keep the low buckets fine-grained
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+
+# KiteConnect route names -> the method names we call
+BROKER_METHODS = {
+    "order.place": "place_order",
+    "order.modify": "modify_order",
+    "order.cancel": "cancel_order",
+    "orders": "orders",
+    "portfolio.positions": "positions",
+    "portfolio.holdings": "holdings",
+    "api.token": "generate_session",
+    "market.quote.ltp": "ltp",
+    "market.quote": "quote",
+    "user.margins": "margins",
+}
+
+# ========== Metrics ==========
+HTTP_LATENCY = Histogram(
+    "zap_http_request_duration_seconds", "API request latency",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+BROKER_LATENCY = Histogram(
+    "zap_broker_call_duration_seconds", "Kite API call latency",
+    ["method", "account"], buckets=LATENCY_BUCKETS
+)
+BROKER_FAILURES = Counter(
+    "zap_broker_call_failures_total", "Failed Kite API calls",
+    ["method", "error"]
+)
+BROKER_QUEUE_WAIT = Histogram(
+    "zap_broker_queue_wait_seconds", "Time spent waiting for a rate-limit token",
+    ["endpoint_class"], buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+BROKER_RETRIES = Counter(
+    "zap_broker_retries_total", "Kite API calls retried after a rate-limit or transient error",
+    ["endpoint_class", "error"]
+)
+ERRORS = Counter(
+    "zap_errors_total", "Handled errors by component and type",
+    ["component", "error"]
+)
+RISK_CHECK_LATENCY = Histogram(
+    "zap_risk_check_duration_seconds", "Pre-trade risk check compute time",
+    buckets=(0.0005, 0.001, 0.002, 0.003, 0.005, 0.0075, 0.01, 0.025, 0.05)
+)
+WS_CONNECTIONS = Gauge("zap_ws_connections", "Open WebSocket connections")
+WS_DROPPED = Counter(
+    "zap_ws_dropped_connections_total", "WebSocket clients dropped for falling behind",
+    ["reason"]
+)
+WS_FANOUT_MESSAGES = Counter(
+    "zap_ws_fanout_messages_total", "Position messages relayed over Redis pub/sub",
+    ["direction"]
+)
+CREDENTIAL_LOOKUPS = Counter(
+    "zap_credential_lookups_total", "Credential vault reads, by cache hit or decrypt",
+    ["result"]
+)
+WS_SEND_LATENCY = Histogram(
+    "zap_ws_send_duration_seconds", "WebSocket frame send latency",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0)
+)
+
+
+def broker_method(route: str) -> str:
+    return BROKER_METHODS.get(route, route)
+
+
+def count_error(component: str, exc: BaseException) -> None:
+    ERRORS.labels(component, type(exc).__name__).inc()
+
+
+# ========== Pool Stats ==========
+class StatsCollector:
+    """Exposes ``stats()`` dicts (thread pools, DB pool) as gauges.
+
+    The sources are only read when /metrics is scraped, so they add nothing
+    to the request path.
+    """
+
+    def __init__(self):
+        self._sources: Dict[str, Callable[[], dict]] = {}
+
+    def add(self, name: str, stats: Callable[[], dict]) -> None:
+        self._sources[name] = stats
+
+    def collect(self):
+        for name, stats in self._sources.items():
+            for key, value in stats().items():
+                gauge = GaugeMetricFamily(f"zap_{name}_{key}", f"{name} {key}")
+                gauge.add_metric([], value)
+                yield gauge
+
+
+pool_stats = StatsCollector()
+REGISTRY.register(pool_stats)
+
+
+def render_metrics() -> tuple:
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+# ========== Endpoint Timing ==========
+class MetricsMiddleware:
+    """Plain ASGI middleware that times every HTTP request by route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_LATENCY.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status_code[0])
+            ).observe(time.perf_counter() - started)
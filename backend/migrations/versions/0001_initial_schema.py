@@ -0,0 +1,99 @@
+"""Initial schema
+
+The tables as ``Base.metadata.create_all`` used to create them. Databases
+that were set up that way already have them and are left untouched.
+
+Revision ID: 0001
+Revises:
+Create Date: 2025-01-20
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "users" not in existing:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("email", sa.String(), nullable=False),
+            sa.Column("hashed_password", sa.String(), nullable=False),
+            sa.Column("full_name", sa.String()),
+            sa.Column("is_active", sa.Boolean()),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True)),
+        )
+        op.create_index("ix_users_id", "users", ["id"])
+        op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    if "zerodha_accounts" not in existing:
+        op.create_table(
+            "zerodha_accounts",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("nickname", sa.String(), nullable=False),
+            sa.Column("api_key", sa.String(), nullable=False),
+            sa.Column("api_secret_enc", sa.String(), nullable=False),
+            sa.Column("zerodha_user_id_enc", sa.String()),
+            sa.Column("zerodha_password_enc", sa.String()),
+            sa.Column("request_token", sa.String()),
+            sa.Column("access_token", sa.String()),
+            sa.Column("public_token", sa.String()),
+            sa.Column("last_login", sa.DateTime(timezone=True)),
+            sa.Column("is_active", sa.Boolean()),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True)),
+        )
+        op.create_index("ix_zerodha_accounts_id", "zerodha_accounts", ["id"])
+
+    if "orders" not in existing:
+        op.create_table(
+            "orders",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("account_id", sa.Integer(), sa.ForeignKey("zerodha_accounts.id"), nullable=False),
+            sa.Column("order_id", sa.String()),
+            sa.Column("tradingsymbol", sa.String(), nullable=False),
+            sa.Column("exchange", sa.String(), nullable=False),
+            sa.Column("transaction_type", sa.String(), nullable=False),
+            sa.Column("quantity", sa.Integer(), nullable=False),
+            sa.Column("product", sa.String(), nullable=False),
+            sa.Column("order_type", sa.String(), nullable=False),
+            sa.Column("price", sa.Float()),
+            sa.Column("status", sa.String(), nullable=False),
+            sa.Column("variety", sa.String()),
+            sa.Column("kite_order_id", sa.String()),
+            sa.Column("error_message", sa.Text()),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("updated_at", sa.DateTime(timezone=True)),
+        )
+        op.create_index("ix_orders_id", "orders", ["id"])
+
+    if "positions" not in existing:
+        op.create_table(
+            "positions",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("account_id", sa.Integer(), sa.ForeignKey("zerodha_accounts.id"), nullable=False),
+            sa.Column("tradingsymbol", sa.String(), nullable=False),
+            sa.Column("exchange", sa.String(), nullable=False),
+            sa.Column("quantity", sa.Integer(), nullable=False),
+            sa.Column("product", sa.String(), nullable=False),
+            sa.Column("pnl", sa.Float()),
+            sa.Column("avg_price", sa.Float()),
+            sa.Column("last_price", sa.Float()),
+            sa.Column("updated_at", sa.DateTime(timezone=True)),
+        )
+        op.create_index("ix_positions_id", "positions", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_table("positions")
+    op.drop_table("orders")
+    op.drop_table("zerodha_accounts")
+    op.drop_table("users")
@@ -0,0 +1,41 @@
+"""P&L history table
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2025-01-27
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table("pnl_history"):
+        return
+    op.create_table(
+        "pnl_history",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column(
+            "account_id", sa.Integer(),
+            sa.ForeignKey("zerodha_accounts.id", ondelete="CASCADE"), nullable=False
+        ),
+        sa.Column("bucket_start", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("resolution", sa.Integer(), nullable=False),
+        sa.Column("open_pnl", sa.Float(), nullable=False),
+        sa.Column("high_pnl", sa.Float(), nullable=False),
+        sa.Column("low_pnl", sa.Float(), nullable=False),
+        sa.Column("close_pnl", sa.Float(), nullable=False),
+    )
+    op.create_index("ix_pnl_history_id", "pnl_history", ["id"])
+    op.create_index(
+        "ix_pnl_history_account_resolution_bucket", "pnl_history",
+        ["account_id", "resolution", "bucket_start"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("pnl_history")
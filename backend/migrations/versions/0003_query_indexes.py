@@ -0,0 +1,52 @@
+"""Indexes for order history, reconciliation and account lookups
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2025-02-03
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+LOGGED_IN = sa.text("access_token IS NOT NULL")
+OPEN_ORDERS = sa.text("status IN ('pending', 'open')")
+
+# (name, table, columns, options)
+INDEXES = [
+    ("ix_orders_account_created", "orders", ["account_id", "created_at", "id"], {}),
+    ("ix_orders_order_id", "orders", ["order_id"], {}),
+    ("ix_orders_open_account", "orders", ["account_id"],
+     {"postgresql_where": OPEN_ORDERS, "sqlite_where": OPEN_ORDERS}),
+    ("ix_zerodha_accounts_user_id", "zerodha_accounts", ["user_id"], {}),
+    ("ix_zerodha_accounts_logged_in", "zerodha_accounts", ["user_id"],
+     {"postgresql_where": LOGGED_IN, "sqlite_where": LOGGED_IN}),
+    ("ux_positions_account_instrument", "positions", ["account_id", "exchange", "tradingsymbol", "product"],
+     {"unique": True}),
+]
+
+
+def _existing(table: str) -> set:
+    return {index["name"] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade() -> None:
+    # Build on Postgres without blocking order inserts for the duration
+    concurrently = op.get_bind().dialect.name == "postgresql"
+    for name, table, columns, options in INDEXES:
+        if name in _existing(table):
+            continue
+        if concurrently:
+            with op.get_context().autocommit_block():
+                op.create_index(name, table, columns, postgresql_concurrently=True, **options)
+        else:
+            op.create_index(name, table, columns, **options)
+
+
+def downgrade() -> None:
+    for name, table, _, _ in reversed(INDEXES):
+        if name in _existing(table):
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,25 @@
+"""Kite order tag on orders
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2025-02-03
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("orders")}
+    if "tag" not in columns:
+        # Nullable with no default: a metadata-only change, no table rewrite
+        op.add_column("orders", sa.Column("tag", sa.String(20), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("orders") as batch:
+        batch.drop_column("tag")
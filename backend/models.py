@@ -1,10 +1,18 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Float, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Float, Boolean, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from datetime import datetime, timezone
+from functools import lru_cache
 from database import Base
-from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+@lru_cache(maxsize=None)
+def password_context():
+    # passlib (and its bcrypt backend) is imported on the first login, not at startup
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 class User(Base):
     __tablename__ = "users"
@@ -21,11 +29,11 @@ class User(Base):
     accounts = relationship("ZerodhaAccount", back_populates="user", cascade="all, delete-orphan")
 
     def verify_password(self, password: str) -> bool:
-        return pwd_context.verify(password, self.hashed_password)
+        return password_context().verify(password, self.hashed_password)
 
     @staticmethod
     def get_password_hash(password: str) -> str:
-        return pwd_context.hash(password)
+        return password_context().hash(password)
 
 class ZerodhaAccount(Base):
     __tablename__ = "zerodha_accounts"
@@ -48,6 +56,18 @@ class ZerodhaAccount(Base):
     # Relationships
     user = relationship("User", back_populates="accounts")
     orders = relationship("Order", back_populates="account", cascade="all, delete-orphan")
+    positions = relationship("Position", cascade="all, delete-orphan")
+    pnl_history = relationship("PnLHistory", cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (
+        Index("ix_zerodha_accounts_user_id", "user_id"),
+        # Logged-in accounts only: the refresher, order sync and positions reads
+        Index(
+            "ix_zerodha_accounts_logged_in", "user_id",
+            postgresql_where=text("access_token IS NOT NULL"),
+            sqlite_where=text("access_token IS NOT NULL")
+        ),
+    )
 
 class Order(Base):
     __tablename__ = "orders"
@@ -62,16 +82,31 @@ class Order(Base):
     product = Column(String, nullable=False)  # MIS/NRML/CNC
     order_type = Column(String, nullable=False)  # MARKET/LIMIT
     price = Column(Float)
-    status = Column(String, nullable=False)  # pending, completed, rejected, cancelled
+    status = Column(String, nullable=False)  # pending, open, completed, rejected, cancelled
     variety = Column(String)  # regular/amo/bo/co/oco
     kite_order_id = Column(String)
+    tag = Column(String(20))  # Kite order tag, derived from the request's Idempotency-Key
     error_message = Column(Text)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Set in Python as well, so every backend stores it with the same precision the
+    # order history cursor is bound with (SQLite's CURRENT_TIMESTAMP drops the microseconds)
+    created_at = Column(DateTime(timezone=True), default=utcnow, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     # Relationships
     account = relationship("ZerodhaAccount", back_populates="orders")
 
+    __table_args__ = (
+        # Order history pages walk (created_at, id) backwards within an account
+        Index("ix_orders_account_created", "account_id", "created_at", "id"),
+        Index("ix_orders_order_id", "order_id"),
+        # Reconciliation only ever looks for orders that are still open
+        Index(
+            "ix_orders_open_account", "account_id",
+            postgresql_where=text("status IN ('pending', 'open')"),
+            sqlite_where=text("status IN ('pending', 'open')")
+        ),
+    )
+
 class Position(Base):
     __tablename__ = "positions"
 
@@ -85,3 +120,23 @@ class Position(Base):
     avg_price = Column(Float)
     last_price = Column(Float)
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ux_positions_account_instrument", "account_id", "exchange", "tradingsymbol", "product", unique=True),
+    )
+
+class PnLHistory(Base):
+    __tablename__ = "pnl_history"
+
+    id = Column(Integer, primary_key=True, index=True)
+    account_id = Column(Integer, ForeignKey("zerodha_accounts.id", ondelete="CASCADE"), nullable=False)
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+    resolution = Column(Integer, nullable=False)  # bucket length in seconds (60, 900)
+    open_pnl = Column(Float, nullable=False)
+    high_pnl = Column(Float, nullable=False)
+    low_pnl = Column(Float, nullable=False)
+    close_pnl = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index("ix_pnl_history_account_resolution_bucket", "account_id", "resolution", "bucket_start"),
+    )
@@ -0,0 +1,45 @@
+import base64
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import tuple_
+
+from models import Order
+
+MAX_PAGE_SIZE = 200
+
+
+# ========== Keyset Pagination ==========
+# A cursor is the (created_at, id) of the last order on the previous page.
+# Each page seeks straight to it on ix_orders_account_created, so page 1000
+# costs the same as page 1, unlike OFFSET which scans every skipped row.
+def encode_cursor(order: Order) -> str:
+    raw = f"{order.created_at.isoformat()}|{order.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, order_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(order_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def order_history_page(
+    db,
+    account_ids: List[int],
+    limit: int = 50,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Order], Optional[str]]:
+    """Newest-first orders for ``account_ids`` and the cursor of the next page."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = db.query(Order).filter(Order.account_id.in_(account_ids))
+    if cursor:
+        created_at, order_id = decode_cursor(cursor)
+        query = query.filter(tuple_(Order.created_at, Order.id) < tuple_(created_at, order_id))
+    orders = query.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit + 1).all()
+
+    next_cursor = encode_cursor(orders[limit - 1]) if len(orders) > limit else None
+    return orders[:limit], next_cursor
@@ -0,0 +1,336 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, insert
+from sqlalchemy.dialects import postgresql, sqlite
+
+from metrics import count_error
+from models import PnLHistory, Position
+from positions_cache import POSITION_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Position columns that come from the broker and are compared before writing
+STORED_FIELDS = ("quantity", "pnl", "avg_price", "last_price")
+
+
+def stored_key(pos: dict) -> tuple:
+    return pos.get("exchange"), pos.get("tradingsymbol"), pos.get("product")
+
+
+def stored_values(pos: dict) -> tuple:
+    return pos.get("quantity") or 0, pos.get("pnl") or 0.0, pos.get("average_price"), pos.get("last_price")
+
+
+def utc_datetime(ts: float) -> datetime:
+    return datetime.fromtimestamp(ts, timezone.utc)
+
+
+def as_utc(value: datetime) -> datetime:
+    # SQLite hands back naive datetimes for timezone-aware columns
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def upsert_positions(dialect: str):
+    """Executemany INSERT .. ON CONFLICT DO UPDATE on the position's instrument key.
+
+    Returns (id, account_id, exchange, tradingsymbol, product) per written row.
+    """
+    table = Position.__table__
+    statement = (postgresql if dialect == "postgresql" else sqlite).insert(table)
+    return statement.on_conflict_do_update(
+        index_elements=[table.c.account_id, table.c.exchange, table.c.tradingsymbol, table.c.product],
+        set_={name: statement.excluded[name] for name in STORED_FIELDS + ("updated_at",)}
+    ).returning(table.c.id, table.c.account_id, table.c.exchange, table.c.tradingsymbol, table.c.product)
+
+
+# ========== Position Store ==========
+class PositionStore:
+    """Mirrors broker positions into the positions table.
+
+    The last written values are kept per account, so a refresh only upserts
+    rows that are new or changed, in one executemany INSERT .. ON CONFLICT
+    DO UPDATE, and issues a DELETE for rows the broker stopped reporting. An account is reloaded
+    from the table once its entry is older than ``max_age``, since another
+    worker may have been the refresher in between.
+    """
+
+    def __init__(self, session_factory: Callable, max_age: float = 30.0):
+        self.session_factory = session_factory
+        self.max_age = max_age
+        self._written: Dict[int, Tuple[float, Dict[tuple, tuple]]] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, db, account_ids: List[int]) -> Dict[int, Dict[tuple, tuple]]:
+        written = {account_id: {} for account_id in account_ids}
+        rows = db.query(
+            Position.id, Position.account_id, Position.exchange, Position.tradingsymbol, Position.product,
+            Position.quantity, Position.pnl, Position.avg_price, Position.last_price
+        ).filter(Position.account_id.in_(account_ids))
+        for row in rows:
+            written[row.account_id][(row.exchange, row.tradingsymbol, row.product)] = (
+                row.id, (row.quantity, row.pnl, row.avg_price, row.last_price)
+            )
+        return written
+
+    def sync(self, snapshots: list) -> dict:
+        """Writes the changed rows and fills in each snapshot row's ``id``."""
+        id_index = POSITION_FIELDS.index("id")
+        now = time.monotonic()
+        updated_at = datetime.now(timezone.utc)
+        stats = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+
+        with self._lock:
+            db = self.session_factory()
+            try:
+                stale = [
+                    snapshot.account_id for snapshot in snapshots
+                    if now - self._written.get(snapshot.account_id, (float("-inf"), None))[0] > self.max_age
+                ]
+                if stale:
+                    for account_id, written in self._load(db, stale).items():
+                        self._written[account_id] = (now, written)
+
+                upserts: Dict[tuple, dict] = {}
+                targets: Dict[tuple, list] = {}
+                removed = []
+                current: Dict[int, Dict[tuple, tuple]] = {}
+                for snapshot in snapshots:
+                    _, written = self._written[snapshot.account_id]
+                    seen = current.setdefault(snapshot.account_id, {})
+                    for row, pos in zip(snapshot.rows, snapshot.positions()):
+                        key = stored_key(pos)
+                        values = stored_values(pos)
+                        entry = written.get(key)
+                        if entry is not None and entry[1] == values:
+                            row[id_index] = entry[0]
+                            seen[key] = entry
+                            stats["unchanged"] += 1
+                            continue
+                        stats["inserted" if entry is None else "updated"] += 1
+                        upserts[(snapshot.account_id,) + key] = {
+                            "account_id": snapshot.account_id, "exchange": key[0], "tradingsymbol": key[1],
+                            "product": key[2], "updated_at": updated_at, **dict(zip(STORED_FIELDS, values))
+                        }
+                        targets.setdefault((snapshot.account_id,) + key, []).append(row)
+                        seen[key] = (None if entry is None else entry[0], values)
+                    removed.extend(entry[0] for key, entry in written.items() if key not in seen)
+
+                if removed:
+                    db.execute(delete(Position).where(Position.id.in_(removed)))
+                if upserts:
+                    # Rows another worker already inserted are updated in place
+                    # rather than failing the unique index
+                    result = db.execute(upsert_positions(db.get_bind().dialect.name), list(upserts.values()))
+                    for position_id, account_id, exchange, tradingsymbol, product in result:
+                        key = (exchange, tradingsymbol, product)
+                        for row in targets[(account_id,) + key]:
+                            row[id_index] = position_id
+                        current[account_id][key] = (position_id, current[account_id][key][1])
+                if upserts or removed:
+                    db.commit()
+            except Exception:
+                db.rollback()
+                for snapshot in snapshots:
+                    self._written.pop(snapshot.account_id, None)
+                raise
+            finally:
+                db.close()
+
+            for account_id, written in current.items():
+                self._written[account_id] = (now, written)
+
+        stats["deleted"] = len(removed)
+        return stats
+
+    def forget(self, account_id: int) -> None:
+        with self._lock:
+            self._written.pop(account_id, None)
+
+
+# ========== P&L History ==========
+# Folds one sample into the account's open bucket and hands back the previous
+# bucket once a new one starts, so exactly one caller ever inserts it
+_BUCKET_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+local bucket = tonumber(ARGV[1])
+local pnl = tonumber(ARGV[2])
+if current then
+    local open = cjson.decode(current)
+    if open[1] == bucket then
+        open[3] = math.max(open[3], pnl)
+        open[4] = math.min(open[4], pnl)
+        open[5] = pnl
+        redis.call('SET', KEYS[1], cjson.encode(open), 'EX', ARGV[3])
+        return false
+    elseif open[1] > bucket then
+        return false
+    end
+end
+redis.call('SET', KEYS[1], cjson.encode({bucket, pnl, pnl, pnl, pnl}), 'EX', ARGV[3])
+return current or false
+"""
+
+
+class PnLHistoryRecorder:
+    """Append-only intraday P&L curve per account.
+
+    Each refresh folds the account's total P&L into open/high/low/close for
+    the current minute, held in Redis so every worker shares one open bucket.
+    A bucket is inserted once the next minute's first sample arrives; rows
+    are never updated. ``compact`` rolls minute rows older than
+    ``downsample_after`` into 15-minute rows and drops rows past ``retention``.
+    """
+
+    key_prefix = "pnl:bucket:"
+    lock_key = "pnl:compact:lock"
+    resolution = 60
+    coarse_resolution = 900
+
+    def __init__(
+        self,
+        redis_client,
+        session_factory: Callable,
+        downsample_after: timedelta = timedelta(days=7),
+        retention: timedelta = timedelta(days=180),
+        compact_interval: float = 3600.0,
+    ):
+        self.redis = redis_client
+        self.session_factory = session_factory
+        self.downsample_after = downsample_after
+        self.retention = retention
+        self.compact_interval = compact_interval
+        self._bucket = redis_client.register_script(_BUCKET_SCRIPT)
+        self._task: Optional[asyncio.Task] = None
+
+    def _key(self, account_id: int) -> str:
+        return f"{self.key_prefix}{account_id}"
+
+    @staticmethod
+    def _row(account_id: int, resolution: int, bucket: list) -> dict:
+        start, open_pnl, high_pnl, low_pnl, close_pnl = bucket
+        return {
+            "account_id": account_id,
+            "bucket_start": utc_datetime(start),
+            "resolution": resolution,
+            "open_pnl": open_pnl,
+            "high_pnl": high_pnl,
+            "low_pnl": low_pnl,
+            "close_pnl": close_pnl,
+        }
+
+    # ----- Recording (worker thread) -----
+    def record(self, samples: Iterable[Tuple[int, float, float]]) -> int:
+        """Takes (account_id, ts, pnl) samples; returns how many rows were appended."""
+        samples = list(samples)
+        if not samples:
+            return 0
+        pipe = self.redis.pipeline(transaction=False)
+        for account_id, ts, pnl in samples:
+            bucket = int(ts // self.resolution) * self.resolution
+            self._bucket(keys=[self._key(account_id)], args=[bucket, pnl, 86400], client=pipe)
+        closed = [
+            self._row(account_id, self.resolution, json.loads(raw))
+            for (account_id, _, _), raw in zip(samples, pipe.execute())
+            if raw
+        ]
+        if closed:
+            db = self.session_factory()
+            try:
+                db.execute(insert(PnLHistory), closed)
+                db.commit()
+            finally:
+                db.close()
+        return len(closed)
+
+    def open_buckets(self, account_ids: Iterable[int]) -> Dict[int, dict]:
+        # The minute still in progress, so curves reach up to the latest sample
+        account_ids = list(account_ids)
+        if not account_ids:
+            return {}
+        raw_values = self.redis.mget([self._key(account_id) for account_id in account_ids])
+        return {
+            account_id: self._row(account_id, self.resolution, json.loads(raw))
+            for account_id, raw in zip(account_ids, raw_values)
+            if raw
+        }
+
+    # ----- Reads -----
+    def history(self, db, account_ids: List[int], since: datetime) -> List[PnLHistory]:
+        return db.query(PnLHistory).filter(
+            PnLHistory.account_id.in_(account_ids),
+            PnLHistory.bucket_start >= since
+        ).order_by(PnLHistory.account_id, PnLHistory.bucket_start).all()
+
+    # ----- Downsampling and retention -----
+    def compact(self, now: Optional[datetime] = None) -> dict:
+        now = now or datetime.now(timezone.utc)
+        cutoff_ts = (now - self.downsample_after).timestamp()
+        cutoff = utc_datetime(cutoff_ts - cutoff_ts % self.coarse_resolution)
+
+        db = self.session_factory()
+        try:
+            fine = db.query(PnLHistory).filter(
+                PnLHistory.resolution == self.resolution,
+                PnLHistory.bucket_start < cutoff
+            ).order_by(PnLHistory.account_id, PnLHistory.bucket_start).all()
+
+            coarse: Dict[tuple, list] = {}
+            for row in fine:
+                ts = as_utc(row.bucket_start).timestamp()
+                key = (row.account_id, int(ts // self.coarse_resolution) * self.coarse_resolution)
+                bucket = coarse.get(key)
+                if bucket is None:
+                    coarse[key] = [key[1], row.open_pnl, row.high_pnl, row.low_pnl, row.close_pnl]
+                else:
+                    bucket[2] = max(bucket[2], row.high_pnl)
+                    bucket[3] = min(bucket[3], row.low_pnl)
+                    bucket[4] = row.close_pnl
+
+            if coarse:
+                db.execute(insert(PnLHistory), [
+                    self._row(account_id, self.coarse_resolution, bucket)
+                    for (account_id, _), bucket in coarse.items()
+                ])
+                db.execute(delete(PnLHistory).where(PnLHistory.id.in_([row.id for row in fine])))
+            expired = db.execute(
+                delete(PnLHistory).where(PnLHistory.bucket_start < now - self.retention)
+            ).rowcount
+            db.commit()
+            return {"downsampled": len(fine), "coarse_rows": len(coarse), "expired": expired}
+        finally:
+            db.close()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                acquired = await asyncio.to_thread(
+                    self.redis.set, self.lock_key, "1", nx=True, px=int(self.compact_interval * 1000)
+                )
+                if acquired:
+                    stats = await asyncio.to_thread(self.compact)
+                    logger.info("P&L history compacted: %s", stats)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                count_error("pnl_compact", e)
+                logger.exception("P&L history compaction failed")
+            await asyncio.sleep(self.compact_interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,147 @@
+import asyncio
+from typing import Dict, Iterable, Optional
+
+
+def position_key(account_id: int, pos: dict) -> str:
+    return f"{account_id}:{pos.get('exchange')}:{pos.get('tradingsymbol')}:{pos.get('product')}"
+
+
+def open_position_rows(account_id: int, positions: Iterable[dict]) -> Dict[str, dict]:
+    # Kite-shaped position dicts -> open positions keyed for diffing
+    rows = {}
+    for pos in positions:
+        if abs(pos.get("quantity") or 0) > 0:
+            rows[position_key(account_id, pos)] = {
+                "id": pos.get("id"),
+                "account_id": account_id,
+                "tradingsymbol": pos.get("tradingsymbol"),
+                "exchange": pos.get("exchange"),
+                "quantity": pos.get("quantity"),
+                "product": pos.get("product"),
+                "pnl": pos.get("pnl") or 0,
+                "avg_price": pos.get("average_price"),
+                "last_price": pos.get("last_price"),
+                "instrument_token": pos.get("instrument_token"),
+            }
+    return rows
+
+
+def diff_rows(previous: Dict[str, dict], current: Dict[str, dict]) -> tuple:
+    changed = {}
+    for key, row in current.items():
+        old = previous.get(key)
+        if old is None:
+            changed[key] = row
+        else:
+            fields = {name: value for name, value in row.items() if old.get(name) != value}
+            if fields:
+                changed[key] = fields
+    removed = [key for key in previous if key not in current]
+    return changed, removed
+
+
+# ========== Position Streamer ==========
+class PositionStreamer:
+    """Pushes position changes to every socket of a user as delta frames.
+
+    Updates published within ``window`` seconds are coalesced into one frame
+    that carries only the fields that changed since the previous frame; rows
+    listed in ``added`` are sent whole. Each open position also gets a small
+    integer id per user for the columnar msgpack frames.
+    """
+
+    def __init__(self, manager, window: float = 0.1):
+        self.manager = manager
+        self.window = window
+        self._current: Dict[int, Dict[int, Dict[str, dict]]] = {}
+        self._sent: Dict[int, Dict[str, dict]] = {}
+        self._seq: Dict[int, int] = {}
+        self._ids: Dict[int, Dict[str, int]] = {}
+        self._next_id: Dict[int, int] = {}
+        self._flush_tasks: Dict[int, asyncio.Task] = {}
+
+    def _flatten(self, user_id: int) -> Dict[str, dict]:
+        merged = {}
+        for rows in self._current.get(user_id, {}).values():
+            merged.update(rows)
+        return merged
+
+    def seed(self, user_id: int, rows_by_account: Dict[int, Dict[str, dict]]) -> None:
+        # Only accounts not yet streamed are filled in, so a second socket
+        # connecting never rolls back newer state
+        current = self._current.setdefault(user_id, {})
+        for account_id, rows in rows_by_account.items():
+            current.setdefault(account_id, rows)
+        if user_id not in self._sent:
+            self._sent[user_id] = self._flatten(user_id)
+            self._seq[user_id] = 0
+            self._assign_ids(user_id, self._sent[user_id])
+
+    def _assign_ids(self, user_id: int, keys: Iterable[str]) -> None:
+        ids = self._ids.setdefault(user_id, {})
+        next_id = self._next_id.get(user_id, 0)
+        for key in keys:
+            if key not in ids:
+                ids[key] = next_id
+                next_id += 1
+        self._next_id[user_id] = next_id
+
+    def ids(self, user_id: int) -> Dict[str, int]:
+        # Position key -> id for the rows in the frames sent so far
+        return self._ids.get(user_id, {})
+
+    def snapshot_frame(self, user_id: int) -> dict:
+        return {
+            "type": "snapshot",
+            "seq": self._seq.get(user_id, 0),
+            "positions": dict(self._sent.get(user_id, {}))
+        }
+
+    def publish(self, user_id: int, account_id: int, rows: Dict[str, dict]) -> None:
+        if not self.manager.has_connections(user_id):
+            return
+        self._current.setdefault(user_id, {})[account_id] = rows
+        if user_id not in self._flush_tasks:
+            self._flush_tasks[user_id] = asyncio.create_task(self._flush_later(user_id))
+
+    async def _flush_later(self, user_id: int) -> None:
+        try:
+            await asyncio.sleep(self.window)
+            await self.flush(user_id)
+        finally:
+            self._flush_tasks.pop(user_id, None)
+
+    async def flush(self, user_id: int) -> Optional[dict]:
+        current = self._flatten(user_id)
+        previous = self._sent.get(user_id, {})
+        changed, removed = diff_rows(previous, current)
+        if not changed and not removed:
+            return None
+        added = [key for key in changed if key not in previous]
+        self._assign_ids(user_id, added)
+        self._sent[user_id] = current
+        self._seq[user_id] = self._seq.get(user_id, 0) + 1
+        frame = {
+            "type": "delta",
+            "seq": self._seq[user_id],
+            "changed": changed,
+            "added": added,
+            "removed": removed
+        }
+        await self.manager.broadcast_to_user(user_id, frame)
+        # Ids of removed rows are never handed out again
+        ids = self._ids.get(user_id, {})
+        for key in removed:
+            ids.pop(key, None)
+        return frame
+
+    def forget(self, user_id: int) -> None:
+        # Called once the user's last socket is gone
+        self._current.pop(user_id, None)
+        self._sent.pop(user_id, None)
+        self._seq.pop(user_id, None)
+        self._ids.pop(user_id, None)
+        self._next_id.pop(user_id, None)
+        task = self._flush_tasks.pop(user_id, None)
+        if task is not None:
+            task.cancel()
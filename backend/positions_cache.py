@@ -0,0 +1,228 @@
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+from dispatch import fan_out
+from metrics import count_error
+from rate_limiter import BrokerScheduler, DEFAULT, PRIORITY_REFRESH
+from models import ZerodhaAccount
+
+logger = logging.getLogger(__name__)
+
+# Column order of each row in a stored snapshot
+POSITION_FIELDS = (
+    "tradingsymbol", "exchange", "quantity", "product", "pnl", "average_price", "last_price",
+    "instrument_token", "buy_value", "sell_value", "multiplier", "id"
+)
+
+
+@dataclass
+class PositionsSnapshot:
+    account_id: int
+    ts: float
+    rows: List[list] = field(default_factory=list)
+
+    @property
+    def age(self) -> float:
+        return max(0.0, time.time() - self.ts)
+
+    @property
+    def total_pnl(self) -> float:
+        pnl_index = POSITION_FIELDS.index("pnl")
+        return sum(row[pnl_index] or 0 for row in self.rows)
+
+    def positions(self) -> List[dict]:
+        return [dict(zip(POSITION_FIELDS, row)) for row in self.rows]
+
+    def dumps(self) -> str:
+        return json.dumps({"ts": self.ts, "rows": self.rows}, separators=(",", ":"))
+
+    @staticmethod
+    def rows_text(raw: str) -> str:
+        # The serialized rows without the timestamp that precedes them
+        return raw[max(raw.find('"rows":'), 0):]
+
+    @staticmethod
+    def has_rows(raw: str, rows_text: str) -> bool:
+        # Whether ``raw`` holds exactly these rows, whatever its ts; compared in place
+        return len(raw) - raw.find('"rows":') == len(rows_text) and raw.endswith(rows_text)
+
+    @classmethod
+    def loads(cls, account_id: int, raw: str) -> "PositionsSnapshot":
+        data = json.loads(raw)
+        return cls(account_id=account_id, ts=data["ts"], rows=data["rows"])
+
+    @classmethod
+    def from_kite(cls, account_id: int, positions: dict) -> "PositionsSnapshot":
+        rows = [[pos.get(name) for name in POSITION_FIELDS] for pos in positions.get("net", [])]
+        return cls(account_id=account_id, ts=time.time(), rows=rows)
+
+
+# ========== Positions Snapshot Cache ==========
+class PositionsSnapshotCache:
+    """Polls ``kite.positions()`` once per logged-in account and keeps the latest
+    result in Redis, so API reads never touch the broker.
+
+    When several workers run, a short Redis lock makes sure only one of them
+    polls the broker per interval.
+    """
+
+    key_prefix = "positions:"
+    lock_key = "positions:refresher:lock"
+
+    def __init__(
+        self,
+        redis_client,
+        session_factory: Callable,
+        get_kite: Callable[[ZerodhaAccount], object],
+        broker: BrokerScheduler,
+        interval: float = 2.0,
+        snapshot_ttl: int = 60,
+        max_concurrency: int = 10,
+        timeout: float = 10.0,
+        store=None,
+    ):
+        self.redis = redis_client
+        self.session_factory = session_factory
+        self.get_kite = get_kite
+        self.broker = broker
+        self.interval = interval
+        self.snapshot_ttl = snapshot_ttl
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.store = store  # PositionStore; fills in row ids before the snapshot is cached
+        self._task: Optional[asyncio.Task] = None
+        self._pending: set = set()
+        self._listeners: List[Callable] = []
+
+    def _key(self, account_id: int) -> str:
+        return f"{self.key_prefix}{account_id}"
+
+    # ----- Reads -----
+    def read_raw(self, account_ids: Iterable[int]) -> Dict[int, str]:
+        # Serialized snapshots, for callers that keep their own parsed copy
+        account_ids = list(account_ids)
+        if not account_ids:
+            return {}
+        raw_values = self.redis.mget([self._key(account_id) for account_id in account_ids])
+        return {account_id: raw for account_id, raw in zip(account_ids, raw_values) if raw}
+
+    def read(self, account_ids: Iterable[int]) -> Dict[int, PositionsSnapshot]:
+        return {
+            account_id: PositionsSnapshot.loads(account_id, raw)
+            for account_id, raw in self.read_raw(account_ids).items()
+        }
+
+    # ----- Refresh -----
+    def _load_accounts(self) -> List[ZerodhaAccount]:
+        db = self.session_factory()
+        try:
+            return db.query(ZerodhaAccount).filter(
+                ZerodhaAccount.is_active.is_(True),
+                ZerodhaAccount.access_token.isnot(None)
+            ).all()
+        finally:
+            db.close()
+
+    async def _fetch(self, account: ZerodhaAccount) -> PositionsSnapshot:
+        kite = self.get_kite(account)
+        positions = await self.broker.call(account.api_key, DEFAULT, kite.positions, priority=PRIORITY_REFRESH)
+        return PositionsSnapshot.from_kite(account.id, positions)
+
+    def _write(self, snapshots: List[PositionsSnapshot]) -> None:
+        pipe = self.redis.pipeline(transaction=False)
+        for snapshot in snapshots:
+            pipe.set(self._key(snapshot.account_id), snapshot.dumps(), ex=self.snapshot_ttl)
+        pipe.execute()
+
+    def add_listener(self, callback: Callable[[List[tuple]], None]) -> None:
+        # Called on the event loop with [(account, snapshot), ...] after each write
+        self._listeners.append(callback)
+
+    async def refresh(self, accounts: List[ZerodhaAccount]) -> List[PositionsSnapshot]:
+        results = await fan_out(
+            accounts,
+            self._fetch,
+            max_concurrency=self.max_concurrency,
+            timeout=self.timeout
+        )
+        refreshed = []
+        for result in results:
+            if result.ok:
+                refreshed.append((result.item, result.value))
+            else:
+                # Keep serving the previous snapshot; its age shows it is stale
+                count_error("positions_refresh", result.error or asyncio.TimeoutError())
+                logger.warning(
+                    "Positions refresh failed for account %s: %s",
+                    result.item.id, "timeout" if result.timed_out else result.error
+                )
+        await self._publish(refreshed)
+        return [snapshot for _, snapshot in refreshed]
+
+    async def refresh_account(self, account: ZerodhaAccount) -> PositionsSnapshot:
+        """Fetch one account now and store it like a regular cycle; failures raise."""
+        snapshot = await asyncio.wait_for(self._fetch(account), self.timeout)
+        await self._publish([(account, snapshot)])
+        return snapshot
+
+    async def _publish(self, refreshed: List[tuple]) -> None:
+        snapshots = [snapshot for _, snapshot in refreshed]
+        if snapshots:
+            if self.store is not None:
+                try:
+                    await asyncio.to_thread(self.store.sync, snapshots)
+                except Exception as e:
+                    # The snapshot is still worth serving, just without row ids
+                    count_error("positions_store", e)
+                    logger.exception("Failed to persist positions")
+            await asyncio.to_thread(self._write, snapshots)
+            for listener in self._listeners:
+                try:
+                    listener(refreshed)
+                except Exception:
+                    logger.exception("Positions listener failed")
+
+    async def refresh_all(self) -> List[PositionsSnapshot]:
+        acquired = await asyncio.to_thread(
+            self.redis.set, self.lock_key, "1", nx=True, px=max(1, int(self.interval * 1000))
+        )
+        if not acquired:
+            return []
+        accounts = await asyncio.to_thread(self._load_accounts)
+        return await self.refresh(accounts)
+
+    def refresh_soon(self, *accounts: ZerodhaAccount) -> None:
+        # Out-of-cycle refresh, e.g. right after accounts log in
+        if not accounts:
+            return
+        task = asyncio.create_task(self.refresh(list(accounts)))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh_all()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                count_error("positions_refresh", e)
+                logger.exception("Positions refresh cycle failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
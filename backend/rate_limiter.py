@@ -0,0 +1,165 @@
+import asyncio
+import functools
+import heapq
+import itertools
+import logging
+import random
+import time
+from concurrent.futures import Executor
+from typing import Callable, Dict, Optional, Tuple
+
+from metrics import BROKER_QUEUE_WAIT, BROKER_RETRIES
+
+logger = logging.getLogger(__name__)
+
+# Lower value runs first
+PRIORITY_ORDER = 0
+PRIORITY_SESSION = 5
+PRIORITY_REFRESH = 10
+
+# Endpoint classes with their own Kite limits
+ORDER = "order"
+QUOTE = "quote"
+DEFAULT = "default"
+
+
+# ========== Token Bucket ==========
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self) -> float:
+        # Takes a token and returns 0, or returns how long until one is free
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def drain(self) -> None:
+        # After a 429 the broker's window is clearly full; start from empty
+        self._refill(time.monotonic())
+        self.tokens = min(self.tokens, 0.0)
+
+
+class _Lane:
+    """Waiters for one bucket, released in priority order as tokens free up."""
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.waiters: list = []
+        self.counter = itertools.count()
+        self.drainer: Optional[asyncio.Task] = None
+
+    async def acquire(self, priority: int) -> None:
+        if not self.waiters and self.bucket.try_acquire() == 0:
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.counter), future))
+        if self.drainer is None or self.drainer.done():
+            self.drainer = asyncio.create_task(self._drain())
+        await future
+
+    async def _drain(self) -> None:
+        while self.waiters:
+            if self.waiters[0][2].done():
+                # Waiter gave up (cancelled or timed out)
+                heapq.heappop(self.waiters)
+                continue
+            wait = self.bucket.try_acquire()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    return getattr(exc, "code", None) == 429 or "too many requests" in str(exc).lower()
+
+
+def is_retryable(exc: BaseException, endpoint_class: str) -> bool:
+    if is_rate_limited(exc):
+        return True
+    if endpoint_class == ORDER:
+        # Anything else may mean the order reached the exchange; never resend
+        return False
+    return type(exc).__name__ in ("NetworkException", "ConnectionError", "Timeout", "ReadTimeout")
+
+
+# ========== Broker Scheduler ==========
+class BrokerScheduler:
+    """Front door for every KiteConnect call.
+
+    Each (api key, endpoint class) pair has its own token bucket sized to
+    Kite's limits, and waiting calls are released by priority. Calls at
+    ``PRIORITY_ORDER`` then run on ``order_executor`` when one is given, so
+    an order never queues behind (or is refused because of) refreshes
+    filling the shared pool. Rate-limited and transient failures are
+    retried with full-jitter exponential backoff.
+    """
+
+    def __init__(
+        self,
+        executor: Optional[Executor],
+        limits: Dict[str, Tuple[float, float]],
+        max_retries: int = 3,
+        backoff_base: float = 0.2,
+        order_executor: Optional[Executor] = None,
+    ):
+        self.executor = executor
+        self.order_executor = order_executor
+        self.limits = limits
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._lanes: Dict[Tuple[str, str], _Lane] = {}
+
+    def _lane(self, key: str, endpoint_class: str) -> _Lane:
+        lane = self._lanes.get((key, endpoint_class))
+        if lane is None:
+            rate, burst = self.limits.get(endpoint_class, self.limits[DEFAULT])
+            lane = _Lane(TokenBucket(rate, burst))
+            self._lanes[(key, endpoint_class)] = lane
+        return lane
+
+    async def call(
+        self,
+        key: str,
+        endpoint_class: str,
+        fn: Callable,
+        *args,
+        priority: int = PRIORITY_REFRESH,
+        **kwargs
+    ):
+        lane = self._lane(key, endpoint_class)
+        executor = self.executor
+        if priority <= PRIORITY_ORDER and self.order_executor is not None:
+            executor = self.order_executor
+        loop = asyncio.get_running_loop()
+        call = functools.partial(fn, *args, **kwargs)
+        attempt = 0
+        while True:
+            queued_at = time.perf_counter()
+            await lane.acquire(priority)
+            BROKER_QUEUE_WAIT.labels(endpoint_class).observe(time.perf_counter() - queued_at)
+            try:
+                return await loop.run_in_executor(executor, call)
+            except Exception as e:
+                if is_rate_limited(e):
+                    lane.bucket.drain()
+                if attempt >= self.max_retries or not is_retryable(e, endpoint_class):
+                    raise
+                attempt += 1
+                BROKER_RETRIES.labels(endpoint_class, type(e).__name__).inc()
+                delay = random.uniform(0, self.backoff_base * (2 ** attempt))
+                logger.info("Retrying %s call in %.2fs after %s", endpoint_class, delay, e)
+                await asyncio.sleep(delay)
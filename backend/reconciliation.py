@@ -0,0 +1,252 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+from typing import Callable, Dict, List, Optional, Set
+
+from sqlalchemy import update
+
+from credentials import CredentialVault
+from dispatch import fan_out
+from metrics import count_error
+from models import Order, ZerodhaAccount
+from rate_limiter import BrokerScheduler, DEFAULT, PRIORITY_REFRESH
+
+logger = logging.getLogger(__name__)
+
+# Kite order status -> Order.status
+KITE_STATUSES = {
+    "COMPLETE": "completed",
+    "REJECTED": "rejected",
+    "CANCELLED": "cancelled",
+    "OPEN": "open",
+    "TRIGGER PENDING": "open",
+}
+FINAL_STATUSES = {"completed", "rejected", "cancelled"}
+OPEN_STATUSES = ("pending", "open")
+
+
+def local_status(kite_status: Optional[str]) -> str:
+    return KITE_STATUSES.get((kite_status or "").upper(), "pending")
+
+
+def postback_checksum(order_id: str, order_timestamp: str, api_secret: str) -> str:
+    return hashlib.sha256(f"{order_id}{order_timestamp}{api_secret}".encode()).hexdigest()
+
+
+def verify_postback(payload: dict, api_secret: str) -> bool:
+    expected = postback_checksum(
+        str(payload.get("order_id", "")), str(payload.get("order_timestamp", "")), api_secret
+    )
+    return hmac.compare_digest(expected, str(payload.get("checksum", "")))
+
+
+def fold_updates(updates: List[dict]) -> Dict[str, dict]:
+    # Several updates for one order in a burst: a final status wins over an
+    # open one, otherwise the last one seen wins
+    latest: Dict[str, dict] = {}
+    for update_ in updates:
+        order_id = str(update_.get("order_id"))
+        current = latest.get(order_id)
+        if (
+            current is None
+            or local_status(update_.get("status")) in FINAL_STATUSES
+            or local_status(current.get("status")) not in FINAL_STATUSES
+        ):
+            latest[order_id] = update_
+    return latest
+
+
+# ========== Order Reconciler ==========
+class OrderReconciler:
+    """Keeps Order.status in step with Kite.
+
+    Postbacks are buffered for ``flush_interval`` seconds (or until
+    ``max_buffer`` are waiting), checksum-verified one by one against the
+    order's account, folded and applied with one executemany UPDATE per
+    burst. A forged payload is dropped before folding, so it can never
+    shadow a genuine update for the same order. A slower fallback job
+    calls ``kite.orders()`` once per account that still has open orders and
+    applies the differences the same way.
+    """
+
+    lock_key = "orders:reconcile:lock"
+
+    def __init__(
+        self,
+        session_factory: Callable,
+        credentials: CredentialVault,
+        get_kite: Callable,
+        broker: BrokerScheduler,
+        redis_client=None,
+        flush_interval: float = 0.2,
+        max_buffer: int = 1000,
+        sync_interval: float = 30.0,
+        max_concurrency: int = 10,
+        timeout: float = 10.0,
+    ):
+        self.session_factory = session_factory
+        self.credentials = credentials
+        self.get_kite = get_kite
+        self.broker = broker
+        self.redis = redis_client
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.sync_interval = sync_interval
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._buffer: List[dict] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flushing: Set[asyncio.Task] = set()
+        self._apply_lock = asyncio.Lock()  # batches land in the order they were taken
+        self._sync_task: Optional[asyncio.Task] = None
+
+    # ----- Applying updates (worker thread) -----
+    def _apply(self, updates: List[dict], verify: bool) -> dict:
+        stats = {"received": len(updates), "applied": 0, "rejected": 0, "unknown": 0}
+        order_ids = {str(update_.get("order_id")) for update_ in updates}
+        if not order_ids:
+            return stats
+
+        db = self.session_factory()
+        try:
+            rows = db.query(Order.id, Order.order_id, Order.status, Order.error_message,
+                            ZerodhaAccount.id, ZerodhaAccount.api_secret_enc).join(
+                ZerodhaAccount, Order.account_id == ZerodhaAccount.id
+            ).filter(Order.order_id.in_(list(order_ids))).all()
+            orders = {row[1]: row for row in rows}
+            stats["unknown"] = len(order_ids - orders.keys())
+
+            if verify:
+                # Each payload against its own order's account, before folding
+                secrets: Dict[int, str] = {}
+                verified = []
+                for update_ in updates:
+                    row = orders.get(str(update_.get("order_id")))
+                    if row is None:
+                        continue
+                    account_id, api_secret_enc = row[4], row[5]
+                    if account_id not in secrets:
+                        secrets[account_id] = self.credentials.reveal(account_id, "api_secret_enc", api_secret_enc)
+                    if verify_postback(update_, secrets[account_id]):
+                        verified.append(update_)
+                    else:
+                        stats["rejected"] += 1
+                updates = verified
+
+            changes = []
+            for order_id, update_ in fold_updates(updates).items():
+                row = orders.get(order_id)
+                if row is None:
+                    continue
+                pk, _, status, error_message = row[:4]
+                new_status = local_status(update_.get("status"))
+                new_error = update_.get("status_message") if new_status == "rejected" else error_message
+                if status in FINAL_STATUSES or (new_status == status and new_error == error_message):
+                    continue
+                changes.append({"id": pk, "status": new_status, "error_message": new_error})
+
+            if changes:
+                db.execute(update(Order), changes)
+                db.commit()
+            stats["applied"] = len(changes)
+            return stats
+        finally:
+            db.close()
+
+    # ----- Postbacks -----
+    def submit_postback(self, payload: dict) -> None:
+        self._buffer.append(payload)
+        if len(self._buffer) >= self.max_buffer:
+            # A full buffer is applied now instead of growing until the timer fires
+            batch, self._buffer = self._buffer, []
+            task = asyncio.create_task(self._flush(batch))
+            self._flushing.add(task)
+            task.add_done_callback(self._flushing.discard)
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        batch, self._buffer = self._buffer, []
+        if batch:
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[dict]) -> None:
+        try:
+            async with self._apply_lock:
+                stats = await asyncio.to_thread(self._apply, batch, True)
+            if stats["rejected"]:
+                logger.warning("Dropped %d postbacks with bad checksums", stats["rejected"])
+        except Exception as e:
+            count_error("postback_apply", e)
+            logger.exception("Failed to apply %d postbacks", len(batch))
+
+    # ----- Fallback sync -----
+    def _accounts_with_open_orders(self) -> List[ZerodhaAccount]:
+        db = self.session_factory()
+        try:
+            return db.query(ZerodhaAccount).filter(
+                ZerodhaAccount.access_token.isnot(None),
+                ZerodhaAccount.id.in_(
+                    db.query(Order.account_id).filter(Order.status.in_(OPEN_STATUSES))
+                )
+            ).all()
+        finally:
+            db.close()
+
+    async def _fetch_orders(self, account: ZerodhaAccount) -> List[dict]:
+        kite = self.get_kite(account)
+        return await self.broker.call(account.api_key, DEFAULT, kite.orders, priority=PRIORITY_REFRESH)
+
+    async def sync(self) -> dict:
+        accounts = await asyncio.to_thread(self._accounts_with_open_orders)
+        results = await fan_out(
+            accounts,
+            self._fetch_orders,
+            max_concurrency=self.max_concurrency,
+            timeout=self.timeout
+        )
+        kite_orders = []
+        for result in results:
+            if result.ok:
+                kite_orders.extend(result.value or [])
+            else:
+                count_error("order_sync", result.error or asyncio.TimeoutError())
+        return await asyncio.to_thread(self._apply, kite_orders, False)
+
+    async def _run_sync(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                if self.redis is not None:
+                    acquired = await asyncio.to_thread(
+                        self.redis.set, self.lock_key, "1", nx=True, px=int(self.sync_interval * 1000)
+                    )
+                    if not acquired:
+                        continue
+                await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                count_error("order_sync", e)
+                logger.exception("Order sync failed")
+
+    def start(self) -> None:
+        if self._sync_task is None:
+            self._sync_task = asyncio.create_task(self._run_sync())
+
+    async def stop(self) -> None:
+        for task in (self._sync_task, self._flush_task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._sync_task = None
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+        if self._buffer:
+            batch, self._buffer = self._buffer, []
+            await asyncio.to_thread(self._apply, batch, True)
@@ -38,6 +38,9 @@ class AccountBase(BaseModel):
 class AccountCreate(AccountBase):
     pass
 
+class BulkAccountCreate(BaseModel):
+    accounts: list[AccountCreate] = Field(..., min_items=1, max_items=200)
+
 class AccountUpdate(BaseModel):
     nickname: Optional[str] = None
     api_key: Optional[str] = None
@@ -50,6 +53,7 @@ class AccountResponse(BaseModel):
     is_active: bool
     last_login: Optional[datetime]
     total_pnl: float = 0.0
+    snapshot_age: Optional[float] = None  # seconds since P&L was fetched from Kite
 
     class Config:
         from_attributes = True
@@ -68,6 +72,22 @@ class OrderPlaceRequest(BaseModel):
     price: Optional[float] = None
     amo: bool = False
 
+class BasketLeg(BaseModel):
+    index: str = Field(..., pattern="^(NIFTY|BANKNIFTY|SENSEX)$")
+    expiry: str
+    strike: str
+    option_type: str = Field(..., pattern="^(CE|PE)$")
+    lots: int = Field(..., ge=1, le=100)
+    transaction_type: str = Field(..., pattern="^(BUY|SELL)$")
+    order_type: str = Field(..., pattern="^(MARKET|LIMIT)$")
+    price: Optional[float] = None
+
+class BasketOrderRequest(BaseModel):
+    account_ids: list[int] = Field(..., min_items=1)
+    legs: list[BasketLeg] = Field(..., min_items=1, max_items=10)
+    product: str = Field(..., pattern="^(MIS|NRML|CNC)$")
+    amo: bool = False
+
 class OrderResponse(BaseModel):
     id: int
     account_id: int
@@ -83,6 +103,10 @@ class OrderResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class OrderHistoryResponse(BaseModel):
+    orders: list[OrderResponse]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for the next page
+
 class PlaceOrderResponse(BaseModel):
     success: bool
     message: str
@@ -90,7 +114,7 @@ class PlaceOrderResponse(BaseModel):
 
 # ========== Position Schemas ==========
 class PositionResponse(BaseModel):
-    id: int
+    id: Optional[int] = None  # None until the position store has written the row
     account_id: int
     tradingsymbol: str
     quantity: int
@@ -98,15 +122,106 @@ class PositionResponse(BaseModel):
     pnl: float
     avg_price: Optional[float]
     last_price: Optional[float]
+    # Option legs only; Greeks are for the whole position (per unit x quantity)
+    iv: Optional[float] = None
+    delta: Optional[float] = None
+    gamma: Optional[float] = None
+    theta: Optional[float] = None
+    vega: Optional[float] = None
 
     class Config:
         from_attributes = True
 
+class PnLPoint(BaseModel):
+    ts: datetime
+    resolution: int  # seconds
+    open: float
+    high: float
+    low: float
+    close: float
+
+class PnLHistoryResponse(BaseModel):
+    account_id: int
+    points: list[PnLPoint]
+
+class GreeksTotals(BaseModel):
+    delta: float
+    gamma: float
+    theta: float
+    vega: float
+
+class AccountGreeks(GreeksTotals):
+    account_id: int
+
+class GreeksResponse(BaseModel):
+    accounts: list[AccountGreeks]
+    total: GreeksTotals
+
+# ========== Risk Schemas ==========
+class ExposureRow(BaseModel):
+    underlying: str
+    expiry: Optional[str] = None
+    strike: Optional[float] = None
+    option_type: Optional[str] = None
+    net_quantity: int
+    notional: float
+    pnl: float
+
+class AccountRisk(BaseModel):
+    account_id: int
+    pnl: float
+    notional: float
+    worst_case: float
+    scenarios: list[float]  # P&L at each of RiskResponse.moves
+
+class RiskResponse(BaseModel):
+    moves: list[float]  # underlying moves as fractions, e.g. -0.05 .. 0.05
+    exposure: list[ExposureRow]
+    accounts: list[AccountRisk]
+    scenarios: list[float]  # all accounts together
+    missing_spot: list[str]  # underlyings whose options were held flat
+
+class RiskCheckResponse(BaseModel):
+    account_id: int
+    allowed: bool
+    reason: Optional[str] = None
+    worst_before: float
+    worst_after: float
+    notional_before: float
+    notional_after: float
+
 # ========== Token Schema ==========
 class SetTokenRequest(BaseModel):
     account_id: int
     request_token: str
 
+class BulkSetTokenRequest(BaseModel):
+    tokens: list[SetTokenRequest] = Field(..., min_items=1, max_items=200)
+
+class AccountReadiness(BaseModel):
+    account_id: int
+    nickname: str
+    ready: bool
+    last_login: Optional[datetime]
+    message: Optional[str] = None
+
+class ReadinessResponse(BaseModel):
+    market_open: datetime
+    seconds_to_open: float  # 0 once the market has opened
+    ready: int
+    total: int
+    accounts: list[AccountReadiness]
+
+class SessionResult(BaseModel):
+    account_id: int
+    success: bool
+    message: str
+    elapsed: Optional[float] = None  # seconds spent on the token exchange
+
+class BulkSetTokenResponse(BaseModel):
+    results: list[SessionResult]
+    readiness: ReadinessResponse
+
 # ========== Common Response Schema ==========
 class APIResponse(BaseModel):
     success: bool
@@ -0,0 +1,137 @@
+"""Fast JSON for REST responses and the WebSocket frame formats.
+
+REST responses and JSON frames are rendered with orjson. WebSocket clients
+may instead ask for ``zap.msgpack.v1`` as a subprotocol at connect time and
+get binary msgpack frames in a columnar layout:
+
+    {"type": "snapshot" | "delta", "seq": 12,
+     "ids": [7, 8], "keys": ["3:NFO:NIFTY24JAN23500CE:NRML", ...],
+     "groups": [{"rows": [7, 8, 2],
+                 "cols": {"last_price": [101.5, 88.0, 12.35], "pnl": [-450.0, 1200.0, 35.5]}},
+                ...],
+     "removed": [4]}
+
+Every position key gets a small integer id per user. ``ids``/``keys`` name
+the rows that first appear in the frame; after that a row is only referred
+to by id. Rows that carry the same set of fields form a group: its row ids
+are listed once, followed by one value array per field. A snapshot is
+usually one group; a delta where only LTP and P&L moved is one group with
+two arrays and no key strings. ``removed`` lists ids that are gone; ids are
+never reused.
+"""
+from typing import Callable, Dict, List, Optional
+
+import orjson
+from fastapi.responses import JSONResponse
+
+try:
+    import msgpack
+except ImportError:  # optional; without it only JSON frames are offered
+    msgpack = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+SUBPROTOCOLS = {"zap.json.v1": JSON, "zap.msgpack.v1": MSGPACK}
+
+_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def dumps(obj) -> bytes:
+    return orjson.dumps(obj, option=_OPTIONS)
+
+
+def dumps_str(obj) -> str:
+    return orjson.dumps(obj, option=_OPTIONS).decode()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson; the app's default response class."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def negotiate(offered: list) -> tuple:
+    """(subprotocol to accept or None, frame format) for the client's offer."""
+    for name in offered:
+        wire = SUBPROTOCOLS.get(name)
+        if wire == MSGPACK and msgpack is None:
+            continue
+        if wire is not None:
+            return name, wire
+    return None, JSON
+
+
+# ========== Columnar Frames ==========
+def row_groups(rows: Dict[str, dict], ids: Dict[str, int]) -> List[dict]:
+    # Rows keyed by their field names, then one array per field
+    by_fields: Dict[tuple, List[dict]] = {}
+    row_ids: Dict[tuple, List[int]] = {}
+    for key, row in rows.items():
+        fields = tuple(row)
+        group = by_fields.get(fields)
+        if group is None:
+            group = by_fields[fields] = []
+            row_ids[fields] = []
+        group.append(row)
+        row_ids[fields].append(ids[key])
+    return [
+        {"rows": row_ids[fields], "cols": {field: [row[field] for row in group] for field in fields}}
+        for fields, group in by_fields.items()
+    ]
+
+
+class FrameEncoder:
+    """Encodes streamer frames for the wire, once per frame and format.
+
+    ``ids(user_id)`` returns the user's position key -> id map, which the
+    streamer keeps in step with the frames it emits.
+    """
+
+    def __init__(self, ids: Callable[[int], Dict[str, int]]):
+        self.ids = ids
+
+    def encode(self, wire: str, user_id: int, frame: dict):
+        # str for text frames, bytes for binary ones
+        if wire == MSGPACK:
+            return self.columnar(user_id, frame)
+        return dumps_str(frame)
+
+    def columnar(self, user_id: int, frame: dict) -> bytes:
+        ids = self.ids(user_id)
+        if frame["type"] == "snapshot":
+            rows = frame["positions"]
+            new_keys = list(rows)
+            removed = []
+        else:
+            rows = frame["changed"]
+            new_keys = frame["added"]
+            removed = [ids[key] for key in frame["removed"] if key in ids]
+        return msgpack.packb({
+            "type": frame["type"],
+            "seq": frame["seq"],
+            "ids": [ids[key] for key in new_keys],
+            "keys": new_keys,
+            "groups": row_groups(rows, ids),
+            "removed": removed
+        }, use_bin_type=True)
+
+
+def decode_columnar(payload: bytes, known: Optional[Dict[int, dict]] = None) -> Dict[int, dict]:
+    """Applies one msgpack frame to ``known`` (id -> row) and returns it.
+
+    The reference decoder, used by the load test and benchmark; browser
+    clients do the same with their own msgpack library.
+    """
+    frame = msgpack.unpackb(payload, raw=False, strict_map_key=False)
+    known = {} if known is None or frame["type"] == "snapshot" else known
+    for row_id, key in zip(frame["ids"], frame["keys"]):
+        known[row_id] = {"key": key}
+    for group in frame["groups"]:
+        rows = [known[row_id] for row_id in group["rows"]]
+        for field, values in group["cols"].items():
+            for row, value in zip(rows, values):
+                row[field] = value
+    for row_id in frame["removed"]:
+        known.pop(row_id, None)
+    return known
@@ -0,0 +1,33 @@
+from datetime import datetime, time as dt_time, timedelta, timezone
+from typing import Optional
+
+from instruments import IST
+
+# Kite access tokens stop working at 06:00 IST the morning after login
+TOKEN_EXPIRY = dt_time(6, 0)
+MARKET_OPEN = dt_time(9, 15)
+
+
+def _now_ist(now: Optional[datetime]) -> datetime:
+    return datetime.now(IST) if now is None else now.astimezone(IST)
+
+
+def session_cutoff(now: Optional[datetime] = None) -> datetime:
+    """The most recent 06:00 IST; only logins after it hold a live token."""
+    now = _now_ist(now)
+    cutoff = datetime.combine(now.date(), TOKEN_EXPIRY, IST)
+    return cutoff if now >= cutoff else cutoff - timedelta(days=1)
+
+
+def market_open(now: Optional[datetime] = None) -> datetime:
+    # Today's opening bell (IST)
+    return datetime.combine(_now_ist(now).date(), MARKET_OPEN, IST)
+
+
+def session_valid(last_login: Optional[datetime], has_token: bool, now: Optional[datetime] = None) -> bool:
+    if not has_token or last_login is None:
+        return False
+    # SQLite hands back naive datetimes for timezone-aware columns
+    if last_login.tzinfo is None:
+        last_login = last_login.replace(tzinfo=timezone.utc)
+    return last_login >= session_cutoff(now)
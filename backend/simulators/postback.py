@@ -0,0 +1,78 @@
+"""Local stand-in for Kite order postbacks.
+
+Builds postback payloads signed the way Kite signs them
+(sha256(order_id + order_timestamp + api_secret)) and POSTs them to the
+webhook, optionally in bursts and with some deliberately bad checksums.
+
+    cd backend && python simulators/postback.py --url http://localhost:8000/api/postback \\
+        --api-secret <secret> --order-id 250101000000001 --status COMPLETE
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reconciliation import postback_checksum  # noqa: E402
+
+
+def make_postback(order_id: str, api_secret: str, status: str = "COMPLETE", **fields) -> dict:
+    order_timestamp = fields.pop("order_timestamp", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    payload = {
+        "user_id": "AB1234",
+        "app_id": 1234,
+        "order_id": str(order_id),
+        "exchange_order_id": f"1{order_id}"[:16],
+        "status": status,
+        "status_message": "Insufficient funds" if status == "REJECTED" else None,
+        "order_timestamp": order_timestamp,
+        "exchange_timestamp": order_timestamp,
+        "variety": "regular",
+        "exchange": "NFO",
+        "tradingsymbol": "NIFTY25JAN24000CE",
+        "order_type": "MARKET",
+        "transaction_type": "BUY",
+        "validity": "DAY",
+        "product": "MIS",
+        "quantity": 65,
+        "filled_quantity": 65 if status == "COMPLETE" else 0,
+        "pending_quantity": 0,
+        "average_price": 101.5 if status == "COMPLETE" else 0,
+        "checksum": postback_checksum(str(order_id), order_timestamp, api_secret),
+    }
+    payload.update(fields)
+    return payload
+
+
+def main():
+    import requests
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000/api/postback")
+    parser.add_argument("--api-secret", required=True)
+    parser.add_argument("--order-id", action="append", required=True, help="repeatable")
+    parser.add_argument("--status", default="COMPLETE")
+    parser.add_argument("--open-first", action="store_true", help="send an OPEN update before the final one")
+    parser.add_argument("--bad-checksum", type=int, default=0, help="extra payloads with a wrong secret")
+    args = parser.parse_args()
+
+    payloads = []
+    for order_id in args.order_id:
+        if args.open_first:
+            payloads.append(make_postback(order_id, args.api_secret, "OPEN"))
+        payloads.append(make_postback(order_id, args.api_secret, args.status))
+    for order_id in args.order_id[:args.bad_checksum]:
+        payloads.append(make_postback(order_id, "wrong-secret", "CANCELLED"))
+
+    session = requests.Session()
+    started = time.perf_counter()
+    for payload in payloads:
+        response = session.post(args.url, json=payload, timeout=5)
+        print(payload["order_id"], payload["status"], response.status_code)
+    print(f"sent {len(payloads)} postbacks in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import database
+import main
+from models import Order, ZerodhaAccount
+from schemas import AccountCreate, SetTokenRequest, UserCreate
+from user_cache import AuthenticatedUser
+
+
+@pytest.fixture
+def db(session_factory, monkeypatch):
+    # run_db opens its sessions from database.SessionLocal
+    monkeypatch.setattr(database, "SessionLocal", session_factory)
+    return session_factory
+
+
+def test_register_and_duplicate_email(db):
+    user = asyncio.run(main.register(UserCreate(email="a@example.com", full_name="A", password="secret-pass")))
+    assert user.id and user.email == "a@example.com"
+    assert user.verify_password("secret-pass")
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main.register(UserCreate(email="a@example.com", full_name="B", password="other-pass")))
+    assert exc.value.status_code == 400
+
+
+def test_account_lifecycle(db, monkeypatch):
+    owner = AuthenticatedUser.from_user(
+        asyncio.run(main.register(UserCreate(email="b@example.com", full_name="B", password="secret-pass")))
+    )
+    stranger = AuthenticatedUser(id=owner.id + 1, email="c@example.com", full_name=None, is_active=True,
+                                 created_at=None)
+
+    account = asyncio.run(main.create_account(
+        AccountCreate(nickname="main", api_key="key1", api_secret="sec1"), current_user=owner
+    ))
+    assert account.id and account.is_active
+
+    login = asyncio.run(main.request_token(account.id, current_user=owner))
+    assert "api_key=key1" in login["login_url"]
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main.request_token(account.id, current_user=stranger))
+    assert exc.value.status_code == 404
+
+    async def generate_session(api_key, pool, fn, request_token, api_secret, priority):
+        assert (api_key, request_token, api_secret) == ("key1", "req-1", "sec1")
+        return {"access_token": "acc-1", "public_token": "pub-1"}
+
+    refreshed = []
+    monkeypatch.setattr(main.broker, "call", generate_session)
+    monkeypatch.setattr(main.positions_cache, "refresh_soon", lambda *accounts: refreshed.extend(accounts))
+    response = asyncio.run(main.set_token(SetTokenRequest(account_id=account.id, request_token="req-1"),
+                                          current_user=owner))
+    assert response.success
+    assert [a.id for a in refreshed] == [account.id]
+
+    session = db()
+    try:
+        stored = session.get(ZerodhaAccount, account.id)
+        assert main.vault.decrypt(stored.access_token) == "acc-1"
+        assert (stored.request_token, stored.public_token) == ("req-1", "pub-1")
+        assert stored.last_login is not None
+        session.add(Order(account_id=account.id, tradingsymbol="NIFTY25JAN23500CE", exchange="NFO",
+                          transaction_type="BUY", quantity=65, product="NRML", order_type="MARKET", status="COMPLETE"))
+        session.commit()
+    finally:
+        session.close()
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main.delete_account(account.id, current_user=stranger))
+    assert exc.value.status_code == 404
+
+    assert asyncio.run(main.delete_account(account.id, current_user=owner))["success"]
+    session = db()
+    try:
+        assert session.get(ZerodhaAccount, account.id) is None
+        assert session.query(Order).count() == 0
+    finally:
+        session.close()
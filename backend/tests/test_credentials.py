@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+from cryptography.fernet import Fernet, InvalidToken
+
+from credentials import CredentialVault, legacy_key, parse_keys
+from models import User, ZerodhaAccount
+
+OLD, NEW = Fernet.generate_key(), Fernet.generate_key()
+
+
+@pytest.fixture
+def account(session_factory):
+    """Account 1 with its secret and access token encrypted under the old key."""
+    old = CredentialVault([OLD])
+    db = session_factory()
+    db.add(User(id=1, email="u@example.com", hashed_password="x"))
+    db.add(ZerodhaAccount(id=1, user_id=1, nickname="acc1", api_key="key1",
+                          api_secret_enc=old.encrypt("secret-one"), access_token=old.encrypt("token-one")))
+    db.commit()
+    db.close()
+
+    def stored():
+        db = session_factory()
+        try:
+            return db.get(ZerodhaAccount, 1)
+        finally:
+            db.close()
+    return stored
+
+
+def test_old_key_values_still_decrypt_after_rotation(account):
+    vault = CredentialVault([NEW, OLD])
+    row = account()
+    assert vault.decrypt(row.api_secret_enc) == "secret-one"
+    assert vault.reveal(1, "access_token", row.access_token) == "token-one"
+    # New values are written under the new key only
+    assert Fernet(NEW).decrypt(vault.encrypt("fresh").encode()) == b"fresh"
+
+
+def test_reads_re_encrypt_with_the_new_key(account, session_factory):
+    vault = CredentialVault([NEW, OLD], session_factory=session_factory)
+    row = account()
+    vault.reveal(1, "api_secret_enc", row.api_secret_enc)
+    vault.reveal(1, "access_token", row.access_token)
+    assert vault.pending_rotations() == 2
+
+    assert asyncio.run(vault.rotate_pending()) == 2
+    assert vault.pending_rotations() == 0
+    rotated = account()
+    assert rotated.api_secret_enc != row.api_secret_enc
+    new_only = CredentialVault([NEW])
+    assert new_only.decrypt(rotated.api_secret_enc) == "secret-one"
+    assert new_only.decrypt(rotated.access_token) == "token-one"
+
+
+def test_rotation_never_overwrites_a_newer_value(account, session_factory):
+    vault = CredentialVault([NEW, OLD], session_factory=session_factory)
+    row = account()
+    vault.reveal(1, "access_token", row.access_token)
+
+    # A fresh login lands before the background write
+    db = session_factory()
+    db.get(ZerodhaAccount, 1).access_token = vault.encrypt("token-two")
+    db.commit()
+    db.close()
+
+    asyncio.run(vault.rotate_pending())
+    assert vault.decrypt(account().access_token) == "token-two"
+
+
+def test_removed_key_fails_loudly(account):
+    vault = CredentialVault([NEW])
+    row = account()
+    with pytest.raises(InvalidToken):
+        vault.decrypt(row.api_secret_enc)
+    with pytest.raises(InvalidToken):
+        vault.reveal(1, "access_token", row.access_token)
+    assert vault.pending_rotations() == 0
+
+
+def test_parse_keys_keeps_order_and_the_legacy_key():
+    keys = parse_keys(f" {NEW.decode()} , {OLD.decode()} ", "jwt-secret")
+    assert keys == [NEW, OLD, legacy_key("jwt-secret")]
+    assert parse_keys(legacy_key("jwt-secret").decode(), "jwt-secret") == [legacy_key("jwt-secret")]
+
+    # Credentials from before CREDENTIAL_KEYS existed still decrypt
+    legacy = Fernet(legacy_key("jwt-secret")).encrypt(b"secret-one").decode()
+    assert CredentialVault(keys).decrypt(legacy) == "secret-one"
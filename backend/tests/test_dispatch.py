@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import time
+
+import main
+from dispatch import fan_out
+from models import ZerodhaAccount
+
+
+class NetworkException(Exception):
+    """Named like kiteconnect's, so the outcome counts as unknown."""
+
+
+def test_fan_out_captures_timeouts_and_errors_in_order():
+    async def worker(item):
+        if item == "slow":
+            await asyncio.sleep(1)
+        if item == "bad":
+            raise ValueError("rejected")
+        return item.upper()
+
+    results = asyncio.run(fan_out(["ok", "slow", "bad"], worker, timeout=0.05))
+    assert [r.item for r in results] == ["ok", "slow", "bad"]
+    ok, slow, bad = results
+    assert ok.ok and ok.value == "OK"
+    assert slow.timed_out and not slow.ok and slow.value is None
+    assert slow.elapsed < 0.5
+    assert isinstance(bad.error, ValueError) and not bad.timed_out
+
+
+def test_fan_out_times_out_blocking_workers():
+    release = threading.Event()
+
+    def worker(item):
+        if item == "stuck":
+            release.wait(5)
+        return item
+
+    async def run():
+        try:
+            return await fan_out(["stuck", "quick"], worker, timeout=0.05)
+        finally:
+            release.set()  # the thread can't be cancelled; let it finish before the loop closes
+
+    results = asyncio.run(run())
+    assert results[0].timed_out and results[1].value == "quick"
+
+
+def test_fan_out_limits_concurrency():
+    running, peak = 0, 0
+
+    async def worker(item):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    started = time.perf_counter()
+    asyncio.run(fan_out(range(8), worker, max_concurrency=3))
+    assert peak == 3
+    assert time.perf_counter() - started >= 0.02
+
+
+def test_dispatch_leg_reports_unknown_outcomes(monkeypatch):
+    accounts = [ZerodhaAccount(id=i, nickname=f"acc{i}", api_key=f"key{i}") for i in (1, 2, 3, 4)]
+    leg = main.OrderLeg(tradingsymbol="NIFTY25JAN23500CE", exchange="NFO", transaction_type="BUY", quantity=65,
+                        product="MIS", order_type="MARKET", price=None, amo=False, tag="zaptest")
+
+    async def submit_leg(account, leg):
+        if account.id == 2:
+            await asyncio.sleep(1)
+        if account.id == 3:
+            raise NetworkException("read timed out")
+        if account.id == 4:
+            raise ValueError("Invalid quantity")
+        return {"account": account.nickname, "account_id": account.id, "success": True, "order_id": "1"}, None
+
+    monkeypatch.setattr(main, "submit_leg", submit_leg)
+    monkeypatch.setattr(main.settings, "ORDER_DISPATCH_TIMEOUT", 0.05)
+    results, _ = asyncio.run(main.dispatch_leg(accounts, leg))
+
+    by_account = {r["account_id"]: r for r in results}
+    assert by_account[1]["success"] and not by_account[1].get("outcome_unknown")
+    # A timeout or a network error may still have reached the exchange
+    assert by_account[2]["outcome_unknown"] and "Timed out" in by_account[2]["message"]
+    assert by_account[3]["outcome_unknown"] and by_account[3]["tag"] == "zaptest"
+    assert not by_account[4].get("outcome_unknown") and not by_account[4]["success"]
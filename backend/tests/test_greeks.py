@@ -0,0 +1,122 @@
+import time
+
+import numpy as np
+import pytest
+
+from greeks import NO_GREEKS, GreeksService, bs_greeks, bs_price, implied_vol, years_to_expiry
+from instruments import UNDERLYING_TOKENS, InstrumentMaster
+from market_data import LTPBook
+from test_instruments import SAMPLE
+
+CALL, PUT = 1.0, -1.0
+
+
+# ========== Black-Scholes ==========
+def test_prices_match_known_values():
+    # Hull, Options, Futures and Other Derivatives: S=42, K=40, r=10%, vol 20%, six months
+    assert bs_price(42.0, 40.0, 0.5, 0.10, 0.20, CALL) == pytest.approx(4.7594, abs=1e-4)
+    assert bs_price(42.0, 40.0, 0.5, 0.10, 0.20, PUT) == pytest.approx(0.8086, abs=1e-4)
+    # At the money, one year, r=5%, vol 20%
+    assert bs_price(100.0, 100.0, 1.0, 0.05, 0.20, CALL) == pytest.approx(10.4506, abs=1e-4)
+    assert bs_price(100.0, 100.0, 1.0, 0.05, 0.20, PUT) == pytest.approx(5.5735, abs=1e-4)
+
+
+def test_greeks_match_known_values():
+    call = bs_greeks(100.0, 100.0, 1.0, 0.05, 0.20, CALL)
+    put = bs_greeks(100.0, 100.0, 1.0, 0.05, 0.20, PUT)
+    assert call["delta"] == pytest.approx(0.63683, abs=1e-5)
+    assert put["delta"] == pytest.approx(-0.36317, abs=1e-5)
+    assert call["gamma"] == pytest.approx(put["gamma"]) == pytest.approx(0.018762, abs=1e-6)
+    assert call["vega"] == pytest.approx(put["vega"]) == pytest.approx(0.375240, abs=1e-6)  # per vol point
+    assert call["theta"] == pytest.approx(-6.4140 / 365, abs=1e-6)  # per day
+    assert put["theta"] == pytest.approx(-1.6579 / 365, abs=1e-6)
+
+
+def test_put_call_parity():
+    spot = np.array([23000.0, 23500.0, 24000.0, 49800.0])
+    strike = np.array([23500.0, 23500.0, 23000.0, 51000.0])
+    t = np.array([2 / 365, 0.1, 0.5, 1.0])
+    sigma = np.array([0.12, 0.18, 0.35, 0.6])
+    call = bs_price(spot, strike, t, 0.065, sigma, CALL)
+    put = bs_price(spot, strike, t, 0.065, sigma, PUT)
+    assert call - put == pytest.approx(spot - strike * np.exp(-0.065 * t), abs=1e-6 * spot.max())
+
+
+# ========== Implied volatility ==========
+def test_implied_vol_round_trip():
+    spot = 23500.0
+    strike, t, sigma, kind = (a.ravel() for a in np.meshgrid(
+        spot * np.array([0.8, 0.9, 0.97, 1.0, 1.03, 1.1, 1.2]),
+        np.array([1 / 365, 7 / 365, 30 / 365, 0.5, 1.0]),
+        np.array([0.08, 0.15, 0.3, 0.8]),
+        np.array([CALL, PUT]),
+    ))
+    spot = np.full(len(strike), spot)
+    price = bs_price(spot, strike, t, 0.065, sigma, kind)
+    # Rows with time value left to solve for; the rest sit on the no-arbitrage bound
+    intrinsic = np.maximum(kind * (spot - strike * np.exp(-0.065 * t)), 0.0)
+    solvable = price - intrinsic > 1e-6 * spot
+
+    iv = implied_vol(price[solvable], spot[solvable], strike[solvable], t[solvable], 0.065, kind[solvable])
+    assert not np.isnan(iv).any()
+    repriced = bs_price(spot[solvable], strike[solvable], t[solvable], 0.065, iv, kind[solvable])
+    assert (np.abs(repriced - price[solvable]) <= 1e-6 * np.maximum(1.0, price[solvable])).all()
+
+    # Where the price carries real vega, the volatility itself comes back too
+    vega = bs_greeks(spot, strike, t, 0.065, sigma, kind)["vega"][solvable]
+    assert iv[vega > 1] == pytest.approx(sigma[solvable][vega > 1], abs=1e-6)
+
+
+def test_implied_vol_has_no_solution_outside_the_bounds():
+    spot = np.full(5, 23500.0)
+    strike = np.array([20000.0, 20000.0, 27000.0, 23500.0, 23500.0])
+    t = np.array([0.1, 0.1, 0.1, 0.0, 0.1])
+    kind = np.array([CALL, CALL, CALL, CALL, PUT])
+    price = np.array([
+        3400.0,   # deep ITM call below intrinsic (~3629)
+        23600.0,  # call above the spot itself
+        0.0,      # deep OTM call with no price
+        150.0,    # expired
+        23500.0,  # put above the discounted strike
+    ])
+    assert np.isnan(implied_vol(price, spot, strike, t, 0.065, kind)).all()
+
+
+# ========== Greeks Service ==========
+@pytest.fixture
+def service(tmp_path):
+    master = InstrumentMaster(str(tmp_path), source=SAMPLE)
+    master.load()
+    book = LTPBook()
+    book.update(UNDERLYING_TOKENS["NIFTY"], 23500.0)
+    return GreeksService(master, book)
+
+
+def test_service_solves_legs_with_time_value(service):
+    # The sample series has expired, so t is the one-minute floor; a price
+    # with time value above intrinsic still solves
+    t = years_to_expiry("2025-01-30", time.time())
+    price = float(bs_price(23500.0, 23500.0, t, 0.065, 0.15, CALL))
+    leg = service.solve([(10000001, price)])[10000001]
+    assert leg.iv == pytest.approx(0.15, abs=1e-3)
+    assert 0 < leg.delta < 1 and leg.gamma > 0 and leg.theta < 0 and leg.vega > 0
+
+
+def test_service_edge_cases(service):
+    # 10000001 is the 23500 call and 10000002 the 23500 put of an expired series
+    assert service.solve([(10000001, 0.0)])[10000001] is NO_GREEKS
+    assert service.solve([(99999999, 120.0)])[99999999] is NO_GREEKS  # not in the master
+    assert GreeksService(service.instruments, LTPBook()).solve([(10000001, 120.0)])[10000001] is NO_GREEKS  # no spot
+
+    service.ltp_book.update(UNDERLYING_TOKENS["NIFTY"], 24000.0)
+    # An expired leg at its intrinsic value has no volatility left to solve for
+    intrinsic_only = service.solve([(10000001, 500.0)])[10000001]
+    assert intrinsic_only.iv is None and intrinsic_only.delta is None
+    # Neither has a deep ITM leg below intrinsic, nor a deep OTM one above any fair value
+    below = service.solve([(10000001, 300.0)])[10000001]
+    above = service.solve([(10000002, 30000.0)])[10000002]
+    assert below == above == NO_GREEKS
+
+    rows = service.annotate([{"instrument_token": 10000001, "last_price": 500.0, "quantity": -65}])
+    assert rows[0]["iv"] is None and rows[0]["delta"] is None
+    assert GreeksService.totals(rows) == {"delta": 0.0, "gamma": 0.0, "theta": 0.0, "vega": 0.0}
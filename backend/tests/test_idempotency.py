@@ -0,0 +1,227 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+import database
+import main
+from idempotency import CLAIMED, INFLIGHT, RECLAIMED, UNKNOWN, OrderIdempotency, request_tag
+from models import Order, User, ZerodhaAccount
+from schemas import OrderPlaceRequest
+from user_cache import AuthenticatedUser
+
+USER = AuthenticatedUser(id=1, email="u@example.com", full_name=None, is_active=True, created_at=None)
+
+
+class NetworkException(Exception):
+    """Named like kiteconnect's, so the outcome counts as unknown."""
+
+
+class InputException(Exception):
+    """Named like kiteconnect's, so the broker rejected the order."""
+
+
+class FakeKite:
+    VARIETY_REGULAR = "regular"
+    VARIETY_AMO = "amo"
+    VALIDITY_DAY = "DAY"
+
+    def __init__(self):
+        self.book = []
+        self.placed = 0
+        self.fail = None  # raised after (NetworkException) or instead of (others) booking the order
+        self.book_down = False
+
+    def place_order(self, variety, **params):
+        if self.fail is not None and not isinstance(self.fail, NetworkException):
+            raise self.fail
+        self.placed += 1
+        order_id = str(900000 + self.placed)
+        self.book.append({"order_id": order_id, "tags": [params.get("tag")], **params})
+        if self.fail is not None:
+            raise self.fail
+        return order_id
+
+    def orders(self):
+        if self.book_down:
+            raise NetworkException("order book unavailable")
+        return list(self.book)
+
+
+@pytest.fixture
+def kite(session_factory, redis_client, monkeypatch):
+    monkeypatch.setattr(database, "SessionLocal", session_factory)
+    db = session_factory()
+    db.add(User(id=1, email="u@example.com", hashed_password="x"))
+    db.add(ZerodhaAccount(id=1, user_id=1, nickname="acc1", api_key="key1", api_secret_enc="x", access_token="tok"))
+    db.commit()
+    db.close()
+
+    fake = FakeKite()
+
+    async def call(api_key, pool, fn, *args, priority=None, **kwargs):
+        return fn(*args, **kwargs)
+
+    async def resolve_order_leg(*args):
+        return main.OrderLeg(tradingsymbol="NIFTY25JAN23500CE", exchange="NFO", transaction_type="BUY",
+                             quantity=65, product="MIS", order_type="MARKET", price=None, amo=False)
+
+    monkeypatch.setattr(main.broker, "call", call)
+    monkeypatch.setattr(main, "get_kite_instance", lambda account: fake)
+    monkeypatch.setattr(main, "resolve_order_leg", resolve_order_leg)
+    monkeypatch.setattr(main, "order_keys", OrderIdempotency(redis_client, ttl=60, poll_interval=0.01))
+    monkeypatch.setattr(main.settings, "RISK_CHECK_ENABLED", False)
+    return fake
+
+
+def request(lots=1):
+    return OrderPlaceRequest(account_ids=[1], index="NIFTY", expiry="2025-01-30", strike="23500", option_type="CE",
+                             lots=lots, transaction_type="BUY", product="MIS", order_type="MARKET")
+
+
+def place(order, key=None):
+    return asyncio.run(main.place_order(order, current_user=USER, idempotency_key=key))
+
+
+def saved_orders(session_factory):
+    db = session_factory()
+    try:
+        return [(order.kite_order_id, order.tag) for order in db.query(Order)]
+    finally:
+        db.close()
+
+
+# ========== Claims ==========
+def test_claim_states(redis_client):
+    keys = OrderIdempotency(redis_client, ttl=60, stale_after=60)
+    assert keys.claim(1, "k", "fp", [1, 2]) == {1: CLAIMED, 2: CLAIMED}
+    # Still being placed by the first request
+    assert keys.claim(1, "k", "fp", [1, 2]) == {1: INFLIGHT, 2: INFLIGHT}
+
+    keys.complete(1, "k", {1: {"account_id": 1, "success": True}, 2: None})
+    assert keys.claim(1, "k", "fp", [1, 2]) == {1: {"account_id": 1, "success": True}, 2: RECLAIMED}
+    assert keys.states(1, "k", [1, 3]) == {1: {"account_id": 1, "success": True}, 3: None}
+
+
+def test_stale_claim_is_reclaimed(redis_client):
+    keys = OrderIdempotency(redis_client, ttl=60, stale_after=0.01)
+    assert keys.claim(1, "k", "fp", [1]) == {1: CLAIMED}
+    time.sleep(0.02)  # the claiming worker died mid-dispatch
+    assert keys.claim(1, "k", "fp", [1]) == {1: RECLAIMED}
+
+
+def test_released_slot_is_claimed_again(redis_client):
+    keys = OrderIdempotency(redis_client, ttl=60)
+    keys.claim(1, "k", "fp", [1])
+    keys.complete(1, "k", {}, released=[1])
+    assert keys.states(1, "k", [1]) == {1: None}
+    assert keys.claim(1, "k", "fp", [1]) == {1: CLAIMED}
+
+
+# ========== Order placement ==========
+def test_retry_replays_the_stored_result(kite, session_factory):
+    first = place(request(), key="abc")
+    assert first.orders[0]["success"] and kite.placed == 1
+
+    again = place(request(), key="abc")
+    assert kite.placed == 1
+    assert again.orders[0]["replayed"]
+    assert again.orders[0]["order_id"] == first.orders[0]["order_id"]
+    assert saved_orders(session_factory) == [(first.orders[0]["order_id"], request_tag(1, "abc"))]
+
+
+def test_key_reused_for_another_request_is_rejected(kite):
+    place(request(lots=1), key="abc")
+    with pytest.raises(HTTPException) as exc:
+        place(request(lots=2), key="abc")
+    assert exc.value.status_code == 422
+    assert kite.placed == 1
+
+
+def test_concurrent_retry_waits_for_the_inflight_claim(kite):
+    fingerprint = main.request_fingerprint({**request().model_dump(), "account_ids": [1]})
+    assert main.order_keys.claim(1, "abc", fingerprint, [1]) == {1: CLAIMED}
+    stored = {"account": "acc1", "account_id": 1, "success": True, "order_id": "777"}
+
+    async def other_request_finishes():
+        await asyncio.sleep(0.05)
+        await asyncio.to_thread(main.order_keys.complete, 1, "abc", {1: stored})
+
+    async def run():
+        finisher = asyncio.create_task(other_request_finishes())
+        response = await main.place_order(request(), current_user=USER, idempotency_key="abc")
+        await finisher
+        return response
+
+    response = asyncio.run(run())
+    assert kite.placed == 0
+    assert response.orders == [{**stored, "replayed": True}]
+
+
+def test_unknown_outcome_is_recovered_by_tag_on_retry(kite, session_factory):
+    # The order reaches Kite but the response is lost, and the order book
+    # is unreachable for the immediate lookup too
+    kite.fail = NetworkException("read timed out")
+    kite.book_down = True
+    first = place(request(), key="abc")
+    assert first.orders[0]["outcome_unknown"] and kite.placed == 1
+    assert main.order_keys.states(1, "abc", [1]) == {1: UNKNOWN}
+
+    kite.fail = None
+    kite.book_down = False
+    again = place(request(), key="abc")
+    assert kite.placed == 1
+    assert again.orders[0]["recovered"] and again.orders[0]["order_id"] == "900001"
+    assert saved_orders(session_factory) == [("900001", request_tag(1, "abc"))]
+
+
+def test_recover_leg_places_only_when_the_tag_is_missing(kite, session_factory):
+    db = session_factory()
+    account = db.get(ZerodhaAccount, 1)
+    db.close()
+    leg = asyncio.run(main.resolve_order_leg())
+    leg.tag = request_tag(1, "abc")
+
+    placed, _ = asyncio.run(main.recover_leg(account, leg))
+    assert kite.placed == 1 and not placed.get("recovered")
+    recovered, row = asyncio.run(main.recover_leg(account, leg))
+    assert kite.placed == 1
+    assert recovered["recovered"] and recovered["order_id"] == placed["order_id"]
+    assert row["tag"] == leg.tag
+
+
+def test_unknown_outcome_without_key_is_found_by_tag(kite, session_factory):
+    kite.fail = NetworkException("read timed out")
+    response = place(request())
+    assert response.orders[0]["recovered"]
+    assert kite.placed == 1
+    [(order_id, tag)] = saved_orders(session_factory)
+    assert order_id == "900001" and tag.startswith("zap")
+
+
+def test_transient_failure_is_not_stored(kite, session_factory):
+    db = session_factory()
+    db.get(ZerodhaAccount, 1).access_token = None
+    db.commit()
+    failed = place(request(), key="abc")
+    assert failed.orders[0]["message"] == "Account not logged in"
+    assert main.order_keys.states(1, "abc", [1]) == {1: None}
+
+    # After logging in again the retry places the order
+    db.get(ZerodhaAccount, 1).access_token = "tok"
+    db.commit()
+    db.close()
+    retried = place(request(), key="abc")
+    assert retried.orders[0]["success"] and not retried.orders[0].get("replayed")
+    assert kite.placed == 1
+
+
+def test_broker_rejection_is_stored(kite):
+    kite.fail = InputException("Insufficient funds")
+    rejected = place(request(), key="abc")
+    assert rejected.orders[0]["rejected"]
+
+    kite.fail = None
+    again = place(request(), key="abc")
+    assert again.orders[0]["replayed"] and kite.placed == 0
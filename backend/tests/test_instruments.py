@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+import pytest
+
+from instruments import InstrumentMaster
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "instruments_sample.csv")
+
+
+@pytest.fixture
+def master(tmp_path):
+    return InstrumentMaster(str(tmp_path / "cache"), source=SAMPLE)
+
+
+def test_load_caches_the_day_as_columns(master, tmp_path):
+    master.load()
+    assert master.loaded
+    cached = os.listdir(tmp_path / "cache")
+    assert cached == [f"instruments_{master._today()}"]
+    day = tmp_path / "cache" / cached[0]
+    assert sorted(os.listdir(day)) == [
+        "instrument_token.npy", "lot_size.npy", "strike.npy", "strings.json", "tick_size.npy",
+    ]
+    assert os.stat(tmp_path / "cache").st_mode & 0o777 == 0o700
+
+    # A second master reads the cache without touching the source
+    again = InstrumentMaster(str(tmp_path / "cache"), source=str(tmp_path / "missing.csv"))
+    assert again.by_token(10000001).tradingsymbol == "NIFTY25JAN23500CE"
+    assert len(again.contracts("NIFTY")) == len(master.contracts("NIFTY"))
+
+
+def test_cache_never_unpickles(master, tmp_path):
+    master.load()
+    day = tmp_path / "cache" / f"instruments_{master._today()}"
+    # A pickled object array planted in place of a numeric column is refused
+    # and the day is fetched again from the source
+    np.save(day / "strike.npy", np.array([object()], dtype=object), allow_pickle=True)
+    again = InstrumentMaster(str(tmp_path / "cache"), source=SAMPLE)
+    assert again.by_token(10000001).strike == 23500.0
+    assert np.load(day / "strike.npy", allow_pickle=False).dtype == np.float64
+
+
+def test_prune_removes_old_days_and_pickles(master, tmp_path):
+    cache = tmp_path / "cache"
+    (cache / "instruments_2020-01-01").mkdir(parents=True)
+    (cache / "instruments_2020-01-01.pkl").write_bytes(b"stale")
+    master.load()
+    assert os.listdir(cache) == [f"instruments_{master._today()}"]
+
+
+def test_lookups_load_lazily(master):
+    assert not master.loaded
+    assert master.by_token(10000001) is not None
+    assert master.loaded
+
+
+def test_by_token(master):
+    instrument = master.by_token(10000001)
+    assert instrument.tradingsymbol == "NIFTY25JAN23500CE"
+    assert instrument.exchange == "NFO"
+    assert instrument.expiry == "2025-01-30"
+    assert instrument.strike == 23500.0
+    assert instrument.option_type == "CE"
+    assert instrument.lot_size == 65
+    assert instrument.tick_size == 0.05
+    assert master.by_token(1) is None
+
+
+def test_by_symbol(master):
+    instrument = master.by_symbol("BFO", "SENSEX2513177000PE")
+    assert (instrument.name, instrument.expiry, instrument.strike, instrument.option_type) == (
+        "SENSEX", "2025-01-31", 77000.0, "PE"
+    )
+    assert instrument.lot_size == 20
+    assert master.by_symbol("NFO", "SENSEX2513177000PE") is None
+    assert master.by_symbol("NFO", "NIFTY25JAN99999CE") is None
+
+
+@pytest.mark.parametrize("strike", ["23500", 23500, 23500.0, "23500.00"])
+def test_resolve_accepts_any_strike_spelling(master, strike):
+    assert master.resolve("NIFTY", "2025-01-30", strike, "PE").tradingsymbol == "NIFTY25JAN23500PE"
+
+
+def test_resolve_misses(master):
+    assert master.resolve("NIFTY", "2025-01-30", 23550, "CE") is None
+    assert master.resolve("NIFTY", "2025-03-27", 23500, "CE") is None
+    assert master.resolve("FINNIFTY", "2025-01-30", 23500, "CE") is None
+    with pytest.raises(ValueError):
+        master.resolve("NIFTY", "2025-01-30", "ATM", "CE")
+
+
+def test_contracts_filter_by_expiry(master):
+    weekly = master.contracts("NIFTY", expiry="2025-02-06")
+    assert weekly and {c.expiry for c in weekly} == {"2025-02-06"}
+    assert all(c.tradingsymbol.startswith("NIFTY25206") for c in weekly)
+    assert {c.expiry for c in master.contracts("NIFTY")} == {"2025-01-30", "2025-02-06", "2025-02-27"}
+    assert master.contracts("NIFTY", expiry="2025-03-27") == []
+
+
+def test_contracts_filter_by_strike_and_side(master):
+    calls = master.contracts("BANKNIFTY", expiry="2025-01-30", option_type="CE", min_strike=50500, max_strike="51000")
+    assert [(c.strike, c.option_type) for c in calls] == [(50500.0, "CE"), (51000.0, "CE")]
+
+    chain = master.contracts("BANKNIFTY", expiry="2025-01-30")
+    assert [c.strike for c in chain] == sorted(c.strike for c in chain)
+    assert {c.option_type for c in chain} == {"CE", "PE"}
+    assert {c.name for c in master.contracts("SENSEX", min_strike=78000)} == {"SENSEX"}
+    assert all(c.strike >= 78000 for c in master.contracts("SENSEX", min_strike=78000))
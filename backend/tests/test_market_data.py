@@ -0,0 +1,141 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from market_data import MarketDataService, ReplayTicker
+
+REPLAY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "ticks_replay.ndjson")
+NIFTY = 256265
+CALL, PUT = 10000001, 10000002
+
+
+def positions():
+    return [
+        {"tradingsymbol": "NIFTY25JAN23500CE", "instrument_token": CALL, "quantity": 65,
+         "buy_value": 6500.0, "sell_value": 0.0, "multiplier": 1, "last_price": 100.0, "pnl": 0.0},
+        {"tradingsymbol": "NIFTY25JAN23500PE", "instrument_token": PUT, "quantity": -65,
+         "buy_value": 0.0, "sell_value": 6500.0, "multiplier": 1, "last_price": 100.0, "pnl": 0.0},
+    ]
+
+
+async def wait_for(condition, timeout=3.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+class FailingTicker:
+    """Connects and immediately reports the given error, like KiteTicker on a bad token."""
+
+    MODE_LTP = "ltp"
+
+    def __init__(self, reason):
+        self.reason = reason
+        self.closed = False
+
+    def connect(self, threaded=True):
+        self.on_error(self, 1006, self.reason)
+
+    def is_connected(self):
+        return not self.closed
+
+    def subscribe(self, tokens):
+        pass
+
+    def set_mode(self, mode, tokens):
+        pass
+
+    def unsubscribe(self, tokens):
+        pass
+
+    def close(self, code=None, reason=None):
+        self.closed = True
+
+
+def test_replay_reprices_positions_and_resets_on_close():
+    published = []
+    tickers = []
+
+    def factory(api_key, access_token):
+        tickers.append(ReplayTicker(REPLAY, loop=False))
+        return tickers[-1]
+
+    service = MarketDataService(
+        publish=lambda user_id, account_id, rows: published.append((user_id, account_id, rows)),
+        ticker_factory=factory,
+        extra_tokens=[NIFTY]
+    )
+
+    async def run():
+        service.load_positions(7, 3, positions())
+        service.ensure_streaming("key", "token")
+        await wait_for(lambda: service._ticker is None)
+
+        # A closed ticker is replaced on the next call instead of being kept forever
+        service.ensure_streaming("key", "token")
+        assert service._ticker is tickers[1]
+        # No replay thread may outlive the loop
+        tickers[1].close()
+        for ticker in tickers:
+            ticker._thread.join(timeout=2)
+            assert not ticker._thread.is_alive()
+        service.close()
+
+    asyncio.run(run())
+
+    assert tickers[0].subscribed == {NIFTY, CALL, PUT}
+    assert service.book.get(NIFTY) == 23498.75
+    assert service.book.get(CALL) == 112.6
+    assert service.book.get(PUT) == 101.15
+    # Token 10000003 is in the file but nobody holds it
+    assert service.book.get(10000003) is None
+
+    user_id, account_id, rows = published[-1]
+    assert (user_id, account_id) == (7, 3)
+    by_symbol = {row["tradingsymbol"]: row for row in rows}
+    assert by_symbol["NIFTY25JAN23500CE"]["pnl"] == -6500.0 + 65 * 112.6
+    assert by_symbol["NIFTY25JAN23500PE"]["pnl"] == 6500.0 - 65 * 101.15
+    assert service.account_total(3) == sum(row["pnl"] for row in rows)
+
+
+def test_auth_error_drops_the_ticker():
+    service = MarketDataService(publish=lambda *args: None,
+                                ticker_factory=lambda key, token: FailingTicker("403 Forbidden"))
+
+    async def run():
+        service.ensure_streaming("key", "expired")
+        ticker = service._ticker
+        await wait_for(lambda: service._ticker is None)
+        return ticker
+
+    assert asyncio.run(run()).closed
+
+
+def test_other_errors_keep_the_ticker():
+    service = MarketDataService(publish=lambda *args: None,
+                                ticker_factory=lambda key, token: FailingTicker("connection reset"))
+
+    async def run():
+        service.ensure_streaming("key", "token")
+        await asyncio.sleep(0.05)
+        return service._ticker
+
+    ticker = asyncio.run(run())
+    assert ticker is not None and not ticker.closed
+
+
+def test_ticker_account_is_lowest_id_with_a_live_session():
+    from main import ticker_account
+
+    now = datetime.now(timezone.utc)
+    accounts = [
+        SimpleNamespace(id=9, access_token="t", last_login=now),
+        SimpleNamespace(id=4, access_token="t", last_login=now),
+        SimpleNamespace(id=2, access_token=None, last_login=now),
+        SimpleNamespace(id=1, access_token="t", last_login=now - timedelta(days=2)),
+    ]
+    assert ticker_account(accounts).id == 4
+    assert ticker_account(reversed(accounts)).id == 4
+    assert ticker_account(accounts[2:]) is None
@@ -0,0 +1,64 @@
+import pytest
+from sqlalchemy import insert
+
+from models import Order, User, ZerodhaAccount
+from order_history import decode_cursor, order_history_page
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    session.add(User(id=1, email="u@example.com", hashed_password="x"))
+    for account_id in (1, 2, 3):
+        session.add(ZerodhaAccount(id=account_id, user_id=1, nickname=f"acc{account_id}", api_key="k",
+                                   api_secret_enc="s"))
+    # The way save_orders writes them: one multi-row INSERT, created_at left to the default,
+    # so many rows share a timestamp
+    session.execute(insert(Order), [
+        {"account_id": 1 + i % 3, "order_id": str(1000 + i), "tradingsymbol": "NIFTY25JAN24000CE",
+         "exchange": "NFO", "transaction_type": "BUY", "quantity": 65, "product": "MIS",
+         "order_type": "MARKET", "status": "completed"}
+        for i in range(25)
+    ])
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def walk(db, account_ids, limit):
+    seen, cursor = [], None
+    for _ in range(100):
+        orders, cursor = order_history_page(db, account_ids, limit, cursor)
+        seen.extend(orders)
+        if cursor is None:
+            return seen
+    raise AssertionError("pagination never ended")
+
+
+@pytest.mark.parametrize("limit", [1, 4, 7, 25, 200])
+def test_walks_every_page_once(db, limit):
+    seen = walk(db, [1, 2, 3], limit)
+    assert len(seen) == 25
+    assert len({order.id for order in seen}) == 25
+    keys = [(order.created_at, order.id) for order in seen]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_only_the_requested_accounts(db):
+    seen = walk(db, [2, 3], 5)
+    assert {order.account_id for order in seen} == {2, 3}
+    assert len(seen) == 16
+
+
+def test_last_page_has_no_cursor(db):
+    orders, cursor = order_history_page(db, [1], 9)
+    assert len(orders) == 9 and cursor is None
+
+
+def test_bad_cursor(db):
+    with pytest.raises(ValueError):
+        order_history_page(db, [1], 5, "not-a-cursor")
+    with pytest.raises(ValueError):
+        decode_cursor("")
@@ -0,0 +1,68 @@
+from models import Position
+from position_store import PositionStore
+from positions_cache import POSITION_FIELDS, PositionsSnapshot
+
+
+def snapshot(account_id, *positions):
+    rows = [[pos.get(name) for name in POSITION_FIELDS] for pos in positions]
+    return PositionsSnapshot(account_id=account_id, ts=0.0, rows=rows)
+
+
+def position(symbol, quantity, last_price, product="NRML"):
+    return {
+        "tradingsymbol": symbol, "exchange": "NFO", "product": product, "quantity": quantity,
+        "average_price": 100.0, "last_price": last_price, "pnl": (last_price - 100.0) * quantity
+    }
+
+
+def stored(session_factory):
+    db = session_factory()
+    try:
+        return {(row.account_id, row.tradingsymbol): (row.id, row.quantity, row.last_price)
+                for row in db.query(Position)}
+    finally:
+        db.close()
+
+
+def test_sync_inserts_updates_and_deletes(session_factory):
+    store = PositionStore(session_factory)
+    first = snapshot(1, position("NIFTY24JAN23500CE", 50, 110.0), position("NIFTY24JAN23500PE", -50, 90.0))
+    assert store.sync([first]) == {"inserted": 2, "updated": 0, "deleted": 0, "unchanged": 0}
+    ids = {row[0]: row[-1] for row in first.rows}
+    assert all(ids.values())
+
+    second = snapshot(1, position("NIFTY24JAN23500CE", 50, 120.0))
+    assert store.sync([second]) == {"inserted": 0, "updated": 1, "deleted": 1, "unchanged": 0}
+    assert second.rows[0][-1] == ids["NIFTY24JAN23500CE"]
+    assert stored(session_factory) == {(1, "NIFTY24JAN23500CE"): (ids["NIFTY24JAN23500CE"], 50, 120.0)}
+
+    third = snapshot(1, position("NIFTY24JAN23500CE", 50, 120.0))
+    assert store.sync([third]) == {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 1}
+    assert third.rows[0][-1] == ids["NIFTY24JAN23500CE"]
+
+
+def test_sync_upserts_rows_another_worker_inserted(session_factory):
+    # Both workers start with an empty view of the account
+    ours, theirs = PositionStore(session_factory), PositionStore(session_factory)
+    ours.sync([snapshot(1)])
+    theirs.sync([snapshot(1, position("BANKNIFTY24JAN48000CE", 15, 200.0))])
+
+    latest = snapshot(1, position("BANKNIFTY24JAN48000CE", 30, 210.0), position("NIFTY24JAN23500CE", 50, 110.0))
+    ours.sync([latest])
+
+    rows = stored(session_factory)
+    assert rows[(1, "BANKNIFTY24JAN48000CE")][1:] == (30, 210.0)
+    assert rows[(1, "NIFTY24JAN23500CE")][1:] == (50, 110.0)
+    assert {row[0]: row[-1] for row in latest.rows} == {symbol: row[0] for (_, symbol), row in rows.items()}
+
+
+def test_sync_keeps_accounts_apart(session_factory):
+    store = PositionStore(session_factory)
+    store.sync([
+        snapshot(1, position("NIFTY24JAN23500CE", 50, 110.0)),
+        snapshot(2, position("NIFTY24JAN23500CE", -25, 105.0))
+    ])
+    rows = stored(session_factory)
+    assert rows[(1, "NIFTY24JAN23500CE")][1] == 50
+    assert rows[(2, "NIFTY24JAN23500CE")][1] == -25
+    assert rows[(1, "NIFTY24JAN23500CE")][0] != rows[(2, "NIFTY24JAN23500CE")][0]
@@ -0,0 +1,74 @@
+import asyncio
+
+from position_stream import PositionStreamer, diff_rows, open_position_rows
+
+
+def row(symbol, quantity, last_price, pnl, product="NRML"):
+    return {"tradingsymbol": symbol, "exchange": "NFO", "product": product, "quantity": quantity,
+            "last_price": last_price, "pnl": pnl, "average_price": 100.0, "instrument_token": 1}
+
+
+def apply_delta(previous, changed, removed):
+    # What a client does with a delta: added rows whole, the rest field by field
+    rows = {key: dict(value) for key, value in previous.items()}
+    for key, fields in changed.items():
+        rows.setdefault(key, {}).update(fields)
+    for key in removed:
+        rows.pop(key, None)
+    return rows
+
+
+class Manager:
+    def __init__(self):
+        self.frames = []
+
+    def has_connections(self, user_id):
+        return True
+
+    async def broadcast_to_user(self, user_id, frame):
+        self.frames.append(frame)
+
+
+STEPS = [
+    [row("NIFTY25JAN23500CE", 65, 118.2, 1183.0), row("NIFTY25JAN23600PE", -65, 160.0, 0.0)],
+    # LTP and P&L move on one row
+    [row("NIFTY25JAN23500CE", 65, 120.0, 1300.0), row("NIFTY25JAN23600PE", -65, 160.0, 0.0)],
+    # One row closes, another opens, same symbol under another product
+    [row("NIFTY25JAN23500CE", 65, 120.0, 1300.0), row("NIFTY25JAN23600PE", 0, 150.0, 650.0),
+     row("NIFTY25JAN23500CE", 130, 120.0, 0.0, product="MIS")],
+    # Nothing open
+    [],
+]
+
+
+def test_diff_applied_to_previous_rows_gives_the_new_rows():
+    previous = {}
+    for positions in STEPS:
+        current = open_position_rows(1, positions)
+        changed, removed = diff_rows(previous, current)
+        assert apply_delta(previous, changed, removed) == current
+        previous = current
+    assert diff_rows(previous, previous) == ({}, [])
+
+
+def test_streamer_frames_rebuild_the_positions():
+    async def run():
+        manager = Manager()
+        streamer = PositionStreamer(manager, window=0.01)
+        streamer.seed(7, {1: open_position_rows(1, STEPS[0])})
+        client = streamer.snapshot_frame(7)["positions"]
+        seen = [client]
+        for positions in STEPS[1:]:
+            # Two publishes inside one window coalesce into a single frame
+            streamer.publish(7, 1, open_position_rows(1, [dict(p, last_price=0.0) for p in positions]))
+            streamer.publish(7, 1, open_position_rows(1, positions))
+            await asyncio.sleep(0.05)
+            frame = manager.frames[-1]
+            client = apply_delta(client, frame["changed"], frame["removed"])
+            assert set(frame["added"]) <= set(frame["changed"])
+            seen.append(client)
+        return manager.frames, seen
+
+    frames, seen = asyncio.run(run())
+    assert [frame["seq"] for frame in frames] == [1, 2, 3]
+    assert seen == [open_position_rows(1, positions) for positions in STEPS]
@@ -0,0 +1,96 @@
+import asyncio
+import threading
+
+import pytest
+
+from executors import BoundedExecutor, ExecutorSaturated
+from rate_limiter import DEFAULT, PRIORITY_ORDER, PRIORITY_REFRESH, BrokerScheduler, TokenBucket, _Lane
+
+
+# ========== Token Bucket ==========
+def test_bucket_allows_a_burst_then_paces():
+    bucket = TokenBucket(rate=10, capacity=3)
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.try_acquire() == pytest.approx(0.1, abs=1e-3)
+
+
+def test_bucket_refills_at_its_rate_up_to_capacity():
+    bucket = TokenBucket(rate=10, capacity=3)
+    for _ in range(3):
+        bucket.try_acquire()
+    bucket.updated_at -= 0.25  # a quarter second passes
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() == pytest.approx(0.05, abs=1e-3)  # half a token left
+
+    bucket.updated_at -= 60
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.try_acquire() > 0
+
+
+def test_drain_empties_the_bucket():
+    bucket = TokenBucket(rate=10, capacity=3)
+    bucket.drain()
+    assert bucket.try_acquire() == pytest.approx(0.1, abs=1e-3)
+
+
+# ========== Priorities ==========
+def test_lane_releases_waiters_by_priority():
+    async def run():
+        lane = _Lane(TokenBucket(rate=50, capacity=1))
+        lane.bucket.drain()
+        released = []
+
+        async def waiter(name, priority):
+            await lane.acquire(priority)
+            released.append(name)
+
+        refreshes = [asyncio.create_task(waiter(f"refresh{i}", PRIORITY_REFRESH)) for i in range(3)]
+        await asyncio.sleep(0)
+        order = asyncio.create_task(waiter("order", PRIORITY_ORDER))
+        await asyncio.gather(order, *refreshes)
+        return released
+
+    assert asyncio.run(run()) == ["order", "refresh0", "refresh1", "refresh2"]
+
+
+def test_order_overtakes_refreshes_queued_on_the_shared_pool():
+    shared = BoundedExecutor("broker", 1, 4)
+    orders = BoundedExecutor("broker-order", 1, 4)
+    scheduler = BrokerScheduler(shared, limits={DEFAULT: (1000, 1000)}, order_executor=orders)
+    release = threading.Event()
+    finished = []
+
+    def refresh(i):
+        release.wait(5)
+        finished.append(f"refresh{i}")
+
+    def place():
+        finished.append("order")
+        return "order-id"
+
+    async def run():
+        # One refresh holds the only shared worker and four more fill its queue
+        refreshes = [
+            asyncio.create_task(scheduler.call("key", DEFAULT, refresh, i, priority=PRIORITY_REFRESH))
+            for i in range(5)
+        ]
+        await asyncio.sleep(0.05)
+        with pytest.raises(ExecutorSaturated):
+            await scheduler.call("key", DEFAULT, refresh, 5, priority=PRIORITY_REFRESH)
+
+        order_id = await asyncio.wait_for(
+            scheduler.call("key", DEFAULT, place, priority=PRIORITY_ORDER), timeout=1
+        )
+        assert finished == ["order"]
+        release.set()
+        await asyncio.gather(*refreshes)
+        return order_id
+
+    try:
+        assert asyncio.run(run()) == "order-id"
+    finally:
+        release.set()
+        shared.shutdown()
+        orders.shutdown()
+    assert finished[0] == "order" and len(finished) == 6
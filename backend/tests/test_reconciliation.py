@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+from cryptography.fernet import Fernet
+
+from credentials import CredentialVault
+from models import Order, User, ZerodhaAccount
+from reconciliation import OrderReconciler
+from simulators.postback import make_postback
+
+SECRETS = {1: "secret-one", 2: "secret-two"}
+
+
+@pytest.fixture
+def vault():
+    return CredentialVault([Fernet.generate_key()])
+
+
+@pytest.fixture
+def orders(session_factory, vault):
+    """Two accounts with two pending orders each: 1001, 1002 on account 1 and 2001, 2002 on account 2."""
+    db = session_factory()
+    try:
+        db.add(User(id=1, email="u@example.com", hashed_password="x"))
+        for account_id, secret in SECRETS.items():
+            db.add(ZerodhaAccount(id=account_id, user_id=1, nickname=f"acc{account_id}", api_key=f"key{account_id}",
+                                  api_secret_enc=vault.encrypt(secret)))
+            for n in (1, 2):
+                db.add(Order(account_id=account_id, order_id=str(account_id * 1000 + n),
+                             tradingsymbol="NIFTY25JAN24000CE", exchange="NFO", transaction_type="BUY",
+                             quantity=65, product="MIS", order_type="MARKET", status="pending"))
+        db.commit()
+    finally:
+        db.close()
+
+    def statuses():
+        db = session_factory()
+        try:
+            return {order.order_id: (order.status, order.error_message) for order in db.query(Order)}
+        finally:
+            db.close()
+    return statuses
+
+
+def reconciler(session_factory, vault, **kwargs):
+    return OrderReconciler(session_factory, credentials=vault, get_kite=None, broker=None, **kwargs)
+
+
+def test_forged_postback_cannot_shadow_a_valid_one(session_factory, vault, orders):
+    burst = [
+        make_postback("1001", SECRETS[1], "COMPLETE"),
+        # Same order, later in the burst, with a final status that would win the fold
+        make_postback("1001", "wrong-secret", "CANCELLED"),
+        # Signed, but with another account's secret
+        make_postback("1002", SECRETS[2], "REJECTED"),
+        make_postback("2001", SECRETS[2], "REJECTED"),
+        make_postback("9999", SECRETS[1], "COMPLETE"),
+    ]
+    stats = reconciler(session_factory, vault)._apply(burst, True)
+
+    assert stats == {"received": 5, "applied": 2, "rejected": 2, "unknown": 1}
+    assert orders() == {
+        "1001": ("completed", None),
+        "1002": ("pending", None),
+        "2001": ("rejected", "Insufficient funds"),
+        "2002": ("pending", None),
+    }
+
+
+def test_folding_prefers_final_statuses(session_factory, vault, orders):
+    burst = [
+        make_postback("1001", SECRETS[1], "OPEN"),
+        make_postback("1001", SECRETS[1], "COMPLETE"),
+        make_postback("1001", SECRETS[1], "OPEN"),
+        make_postback("2002", SECRETS[2], "OPEN"),
+    ]
+    assert reconciler(session_factory, vault)._apply(burst, True)["applied"] == 2
+    assert orders()["1001"] == ("completed", None)
+    assert orders()["2002"] == ("open", None)
+
+    # A final status is never rolled back by a later burst
+    reconciler(session_factory, vault)._apply([make_postback("1001", SECRETS[1], "CANCELLED")], True)
+    assert orders()["1001"] == ("completed", None)
+
+
+def test_submitted_burst_is_flushed_after_the_interval(session_factory, vault, orders):
+    recon = reconciler(session_factory, vault, flush_interval=0.05)
+
+    async def run():
+        for payload in (
+            make_postback("2001", SECRETS[2], "OPEN"),
+            make_postback("2001", "wrong-secret", "CANCELLED"),
+            make_postback("2001", SECRETS[2], "COMPLETE"),
+            make_postback("1002", SECRETS[1], "CANCELLED"),
+        ):
+            recon.submit_postback(payload)
+        assert orders()["2001"] == ("pending", None)
+        await recon._flush_task
+
+    asyncio.run(run())
+    assert orders()["2001"] == ("completed", None)
+    assert orders()["1002"] == ("cancelled", None)
+    assert recon._buffer == []
+
+
+def test_full_buffer_flushes_early(session_factory, vault, orders):
+    recon = reconciler(session_factory, vault, flush_interval=60, max_buffer=3)
+
+    async def run():
+        recon.submit_postback(make_postback("1001", SECRETS[1], "COMPLETE"))
+        recon.submit_postback(make_postback("1002", SECRETS[1], "COMPLETE"))
+        assert len(recon._buffer) == 2
+        recon.submit_postback(make_postback("2001", SECRETS[2], "COMPLETE"))
+        assert recon._buffer == []
+        await asyncio.gather(*recon._flushing)
+        statuses = orders()
+
+        recon.submit_postback(make_postback("2002", SECRETS[2], "COMPLETE"))
+        await recon.stop()
+        return statuses
+
+    early = asyncio.run(run())
+    assert {order_id: status for order_id, (status, _) in early.items()} == {
+        "1001": "completed", "1002": "completed", "2001": "completed", "2002": "pending"
+    }
+    # stop() applies whatever is still buffered
+    assert orders()["2002"] == ("completed", None)
@@ -0,0 +1,161 @@
+import os
+
+import numpy as np
+import pytest
+
+from instruments import UNDERLYING_TOKENS, InstrumentMaster
+from market_data import LTPBook
+from positions_cache import POSITION_FIELDS, PositionsSnapshot
+from risk import RiskEngine, expiry_value
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "instruments_sample.csv")
+
+
+def raw_snapshot(account_id, ts, quantity=65, last_price=118.2):
+    pos = {"tradingsymbol": "NIFTY25JAN23500CE", "exchange": "NFO", "quantity": quantity, "product": "NRML",
+           "average_price": 100.0, "last_price": last_price, "instrument_token": 10000001, "multiplier": 1,
+           "buy_value": 6500.0, "sell_value": 0.0}
+    return PositionsSnapshot(account_id, ts, [[pos.get(name) for name in POSITION_FIELDS]]).dumps()
+
+
+def engine(tmp_path):
+    return RiskEngine(InstrumentMaster(str(tmp_path), source=SAMPLE), LTPBook())
+
+
+def position(token, symbol, quantity, last_price, buy_value=0.0, sell_value=0.0, product="NRML"):
+    pos = {"tradingsymbol": symbol, "exchange": "NFO", "quantity": quantity, "product": product,
+           "last_price": last_price, "instrument_token": token, "multiplier": 1,
+           "buy_value": buy_value, "sell_value": sell_value}
+    return [pos.get(name) for name in POSITION_FIELDS]
+
+
+# Account 1 is long a NIFTY 23500 call, 2 is short the put, 3 is short the call
+BOOKS = {
+    1: [position(10000001, "NIFTY25JAN23500CE", 65, 118.2, buy_value=6500.0)],
+    2: [position(10000002, "NIFTY25JAN23500PE", -130, 100.0, sell_value=13000.0)],
+    3: [position(10000001, "NIFTY25JAN23500CE", -65, 118.2, sell_value=7000.0)],
+}
+
+
+@pytest.fixture
+def risk(tmp_path):
+    master = InstrumentMaster(str(tmp_path), source=SAMPLE)
+    master.load()
+    book = LTPBook()
+    book.update(UNDERLYING_TOKENS["NIFTY"], 23500.0)
+    return RiskEngine(master, book, moves=np.array([-0.05, 0.0, 0.05]))
+
+
+def snapshots(rows_by_account=BOOKS, ts=1000.0):
+    return {account_id: PositionsSnapshot(account_id, ts, rows).dumps() for account_id, rows in rows_by_account.items()}
+
+
+def test_new_ts_with_the_same_rows_keeps_the_book(tmp_path):
+    risk = engine(tmp_path)
+    book = risk.update(1, raw_snapshot(1, 1000.0))
+    refreshed = raw_snapshot(1, 1003.5)
+    assert risk.update(1, refreshed) is book
+    assert book.raw == refreshed
+    assert risk.update(1, refreshed) is book
+
+
+def test_changed_rows_rebuild_the_book(tmp_path):
+    risk = engine(tmp_path)
+    book = risk.update(1, raw_snapshot(1, 1000.0))
+    moved = risk.update(1, raw_snapshot(1, 1003.5, last_price=121.0))
+    assert moved is not book
+    assert moved.ltp.tolist() == [121.0]
+    resized = risk.update(1, raw_snapshot(1, 1007.0, quantity=130, last_price=121.0))
+    assert resized is not moved
+    assert resized.qty.tolist() == [130.0]
+
+
+def test_rows_text_ignores_only_the_ts():
+    a, b = raw_snapshot(1, 1000.0), raw_snapshot(1, 1000.123456)
+    assert a != b
+    assert PositionsSnapshot.rows_text(a) == PositionsSnapshot.rows_text(b)
+    assert PositionsSnapshot.has_rows(b, PositionsSnapshot.rows_text(a))
+    assert not PositionsSnapshot.has_rows(raw_snapshot(1, 1000.0, quantity=-65), PositionsSnapshot.rows_text(a))
+    # A longer rows list that merely ends the same way
+    assert not PositionsSnapshot.has_rows('{"ts":1,"rows":[[1],[2]]}', '"rows":[[2]]}')
+
+
+def test_scenario_grid(risk):
+    portfolio = risk.portfolio(snapshots(), [1, 2])
+    assert portfolio.per_account(portfolio.pnl).tolist() == pytest.approx([65 * 118.2 - 6500, 0.0])
+    grid = risk.scenarios(portfolio)
+    # Long call: premium lost unless NIFTY rallies; short put: premium kept unless it falls
+    assert grid[0] == pytest.approx([-6500.0, -6500.0, -6500.0 + 65 * 1175])
+    assert grid[1] == pytest.approx([13000.0 - 130 * 1175, 13000.0, 13000.0])
+
+
+def test_scenarios_match_per_row_expiry_values(risk):
+    rows = {
+        1: BOOKS[1] + [position(10000004, "NIFTY25JAN23600PE", -65, 160.0, sell_value=9750.0, product="MIS")],
+        2: BOOKS[2] + BOOKS[1],
+        4: [position(10000011, "NIFTY25JAN24000CE", 130, 12.5, buy_value=2000.0)],
+    }
+    risk.ltp_book.update(10000001, 131.0)  # a live tick overrides the snapshot price
+    portfolio = risk.portfolio(snapshots(rows), [1, 2, 4])
+    value = expiry_value(portfolio.kind, portfolio.strike, portfolio.ltp, portfolio.spot, risk.moves)
+    expected = portfolio.per_account(
+        portfolio.pnl[:, None] + (portfolio.qty * portfolio.mult)[:, None] * (value - portfolio.ltp[:, None])
+    )
+    assert risk.scenarios(portfolio) == pytest.approx(expected)
+
+
+def test_layout_is_reused_until_a_book_changes(risk):
+    first = risk.portfolio(snapshots(), [1, 2])
+    assert risk.portfolio(snapshots(ts=1003.0), [1, 2]).layout is first.layout
+    moved = {**BOOKS, 2: [position(10000002, "NIFTY25JAN23500PE", -65, 100.0, sell_value=6500.0)]}
+    again = risk.portfolio(snapshots(moved, ts=1006.0), [1, 2])
+    assert again.layout is not first.layout
+    assert risk.scenarios(again)[1] == pytest.approx([6500.0 - 65 * 1175, 6500.0, 6500.0])
+
+
+def test_notional_and_net_exposure(risk):
+    portfolio = risk.portfolio(snapshots(), [1, 2, 3])
+    assert risk.notional(portfolio).tolist() == pytest.approx([65 * 23500.0, 130 * 23500.0, 65 * 23500.0])
+
+    exposure = {(row["strike"], row["option_type"]): row for row in risk.exposure(portfolio)}
+    assert set(exposure) == {(23500.0, "CE"), (23500.0, "PE")}
+    # Accounts 1 and 3 cancel out in the call
+    assert exposure[23500.0, "CE"]["net_quantity"] == 0
+    assert exposure[23500.0, "CE"]["notional"] == pytest.approx(0.0)
+    assert exposure[23500.0, "PE"]["net_quantity"] == -130
+    assert exposure[23500.0, "PE"]["notional"] == pytest.approx(-130 * 23500.0)
+    assert exposure[23500.0, "PE"]["underlying"] == "NIFTY"
+    assert exposure[23500.0, "PE"]["expiry"] == "2025-01-30"
+
+
+def test_check_blocks_a_leg_over_the_loss_limit(risk):
+    portfolio = risk.portfolio(snapshots(), [1, 2])
+    put = risk.instruments.by_token(10000002)
+
+    # Selling more puts deepens account 2's downside past the limit
+    more = risk.check(portfolio, put, "SELL", 65, price=100.0, max_loss=150_000)
+    assert [check.allowed for check in more] == [True, False]
+    assert more[1].worst_before == pytest.approx(13000.0 - 130 * 1175)
+    assert more[1].worst_after == pytest.approx(more[1].worst_before - 65 * (1175 - 100.0))
+    assert "Worst-case loss" in more[1].reason
+
+    # Buying some back reduces it, so it passes although the account stays over
+    less = risk.check(portfolio, put, "BUY", 65, price=100.0, max_loss=100_000)
+    assert [check.allowed for check in less] == [True, True]
+    assert less[1].worst_after > less[1].worst_before
+
+
+def test_check_blocks_a_leg_over_the_notional_limit(risk):
+    portfolio = risk.portfolio(snapshots(), [1])
+    call = risk.instruments.by_token(10000001)
+
+    [over] = risk.check(portfolio, call, "BUY", 65, price=118.2, max_notional=2_000_000)
+    assert not over.allowed and "Notional" in over.reason
+    assert over.notional_after == pytest.approx(130 * 23500.0)
+
+    [closing] = risk.check(portfolio, call, "SELL", 65, price=118.2, max_notional=1_000_000)
+    assert closing.allowed
+    assert closing.notional_after == pytest.approx(0.0)
+
+    [under] = risk.check(portfolio, call, "BUY", 65, price=118.2, max_notional=5_000_000)
+    assert under.allowed and under.reason is None
@@ -0,0 +1,61 @@
+import asyncio
+
+import orjson
+
+from position_stream import PositionStreamer, open_position_rows
+from serialization import JSON, MSGPACK, FrameEncoder, decode_columnar, negotiate, row_groups
+from test_position_stream import STEPS, Manager
+
+
+class EncodingManager(Manager):
+    # Encodes during the broadcast, as ConnectionManager does: ids of removed
+    # rows are only released once the broadcast returns
+    encoder = None
+
+    async def broadcast_to_user(self, user_id, frame):
+        self.frames.append(self.encoder.encode(MSGPACK, user_id, frame))
+
+
+def by_key(known):
+    # decode_columnar's id -> row map, keyed like the streamer's rows
+    return {row["key"]: {name: value for name, value in row.items() if name != "key"} for row in known.values()}
+
+
+def test_columnar_frames_decode_back_to_the_rows():
+    async def run():
+        manager = EncodingManager()
+        streamer = PositionStreamer(manager, window=0.01)
+        encoder = manager.encoder = FrameEncoder(streamer.ids)
+        streamer.seed(7, {1: open_position_rows(1, STEPS[0])})
+        known = decode_columnar(encoder.encode(MSGPACK, 7, streamer.snapshot_frame(7)))
+        decoded = [by_key(known)]
+        for positions in STEPS[1:]:
+            streamer.publish(7, 1, open_position_rows(1, positions))
+            await asyncio.sleep(0.05)
+            payload = manager.frames[-1]
+            assert isinstance(payload, bytes)
+            known = decode_columnar(payload, known)
+            decoded.append(by_key(known))
+        return decoded
+
+    assert asyncio.run(run()) == [open_position_rows(1, positions) for positions in STEPS]
+
+
+def test_json_frames_round_trip():
+    frame = {"type": "delta", "seq": 3, "changed": {"1:NFO:X:NRML": {"pnl": 12.5}}, "added": [], "removed": ["k"]}
+    text = FrameEncoder(lambda user_id: {}).encode(JSON, 7, frame)
+    assert isinstance(text, str) and orjson.loads(text) == frame
+
+
+def test_rows_with_the_same_fields_share_a_group():
+    rows = {"a": {"pnl": 1.0, "last_price": 10.0}, "b": {"pnl": 2.0, "last_price": 20.0}, "c": {"pnl": 3.0}}
+    assert row_groups(rows, {"a": 0, "b": 1, "c": 2}) == [
+        {"rows": [0, 1], "cols": {"pnl": [1.0, 2.0], "last_price": [10.0, 20.0]}},
+        {"rows": [2], "cols": {"pnl": [3.0]}},
+    ]
+
+
+def test_negotiate_prefers_the_client_order():
+    assert negotiate(["zap.msgpack.v1", "zap.json.v1"]) == ("zap.msgpack.v1", MSGPACK)
+    assert negotiate(["zap.json.v1", "zap.msgpack.v1"]) == ("zap.json.v1", JSON)
+    assert negotiate(["other"]) == (None, JSON)
@@ -0,0 +1,79 @@
+import asyncio
+import threading
+from datetime import datetime, timezone
+
+from user_cache import AuthenticatedUser, UserPrincipalCache
+
+USER = AuthenticatedUser(id=5, email="u@example.com", full_name="U", is_active=True,
+                         created_at=datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc))
+
+
+class ThreadRecordingRedis:
+    """Records which thread each command ran on."""
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        command = getattr(self.client, name)
+
+        def call(*args, **kwargs):
+            self.calls.append((name, threading.get_ident()))
+            return command(*args, **kwargs)
+        return call
+
+
+def test_redis_round_trips_leave_the_event_loop(redis_client):
+    redis = ThreadRecordingRedis(redis_client)
+    writer, reader = UserPrincipalCache(ttl=30), UserPrincipalCache(ttl=30)
+    writer.attach_redis(redis)
+    reader.attach_redis(redis)
+
+    async def run():
+        loop_thread = threading.get_ident()
+        await writer.put_async(USER)
+        # Another worker: empty memory tier, so it has to ask Redis
+        user = await reader.get_async(USER.id)
+        return loop_thread, user
+
+    loop_thread, user = asyncio.run(run())
+    assert user == USER
+    assert [name for name, _ in redis.calls] == ["set", "get"]
+    assert all(thread != loop_thread for _, thread in redis.calls)
+
+
+def test_memory_hits_skip_redis(redis_client):
+    redis = ThreadRecordingRedis(redis_client)
+    cache = UserPrincipalCache(ttl=30)
+    cache.attach_redis(redis)
+    cache.put(USER)
+    redis.calls.clear()
+
+    assert asyncio.run(cache.get_async(USER.id)) == USER
+    assert cache.get(USER.id) == USER
+    assert redis.calls == []
+
+
+def test_invalidate_clears_both_tiers(redis_client):
+    cache = UserPrincipalCache(ttl=30)
+    cache.attach_redis(redis_client)
+    cache.put(USER)
+    cache.invalidate(USER.id)
+    assert asyncio.run(cache.get_async(USER.id)) is None
+    assert redis_client.get(f"{cache.key_prefix}{USER.id}") is None
+
+
+def test_redis_errors_fall_back_to_the_database():
+    class Down:
+        def get(self, key):
+            raise ConnectionError("redis down")
+
+        def set(self, *args, **kwargs):
+            raise ConnectionError("redis down")
+
+    cache = UserPrincipalCache(ttl=30)
+    cache.attach_redis(Down())
+    assert asyncio.run(cache.get_async(USER.id)) is None
+    asyncio.run(cache.put_async(USER))
+    assert cache.get(USER.id) == USER
@@ -0,0 +1,81 @@
+import asyncio
+
+import fakeredis
+from fakeredis import aioredis
+
+from ws_fanout import RedisFanout
+
+
+class Streamer:
+    """Records what reaches the worker's local PositionStreamer."""
+
+    def __init__(self, connected=()):
+        self.received = []
+        self.manager = self
+        self.connected = set(connected)
+
+    def has_connections(self, user_id):
+        return user_id in self.connected
+
+    def publish(self, user_id, account_id, rows):
+        self.received.append((user_id, account_id, rows))
+
+
+def worker(server, streamer):
+    fanout = RedisFanout("redis://unused", streamer, window=0.01, reconnect_delay=0.01)
+    fanout._redis = aioredis.FakeRedis(server=server, decode_responses=True)
+    return fanout
+
+
+async def eventually(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+ROWS = {"1:NFO:NIFTY25JAN23500CE:NRML": {"quantity": 65, "last_price": 118.2, "pnl": 1183.0}}
+
+
+def test_publish_reaches_every_subscribed_worker():
+    async def run():
+        server = fakeredis.FakeServer()
+        producer = worker(server, Streamer())
+        consumers = [worker(server, Streamer(connected={7})) for _ in range(2)]
+        bystander = worker(server, Streamer())
+        try:
+            for fanout in consumers:
+                await fanout.subscribe(7)
+            await bystander.subscribe(8)
+            await eventually(lambda: all(f._pubsub is not None and f._pubsub.subscribed for f in consumers))
+
+            producer.publish(7, 3, ROWS)
+            await eventually(lambda: all(f.streamer.received for f in consumers))
+            # The producer's own sockets get it directly, never back through Redis
+            assert producer.streamer.received == [(7, 3, ROWS)]
+            for fanout in consumers:
+                assert fanout.streamer.received == [(7, 3, ROWS)]
+            assert bystander.streamer.received == []
+            assert await producer.flush(7) == 0  # nothing pending
+        finally:
+            for fanout in (producer, bystander, *consumers):
+                await fanout.close()
+
+    asyncio.run(run())
+
+
+def test_publish_to_nobody_marks_the_user_idle():
+    async def run():
+        server = fakeredis.FakeServer()
+        producer = worker(server, Streamer())
+        try:
+            producer.publish(9, 1, ROWS)
+            await asyncio.sleep(0.05)
+            assert not producer.wants(9)
+            # While idle only the local streamer is fed
+            producer.publish(9, 1, ROWS)
+            assert producer._pending == {}
+        finally:
+            await producer.close()
+
+    asyncio.run(run())
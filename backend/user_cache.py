@@ -0,0 +1,169 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class AuthenticatedUser:
+    # The fields request handlers need from a User, detached from any session
+    id: int
+    email: str
+    full_name: Optional[str]
+    is_active: bool
+    created_at: Optional[datetime]
+
+    @classmethod
+    def from_user(cls, user) -> "AuthenticatedUser":
+        return cls(
+            id=user.id,
+            email=user.email,
+            full_name=user.full_name,
+            is_active=bool(user.is_active),
+            created_at=user.created_at,
+        )
+
+    def dumps(self) -> str:
+        data = asdict(self)
+        data["created_at"] = self.created_at.isoformat() if self.created_at else None
+        return json.dumps(data)
+
+    @classmethod
+    def loads(cls, raw: str) -> "AuthenticatedUser":
+        data = json.loads(raw)
+        if data.get("created_at"):
+            data["created_at"] = datetime.fromisoformat(data["created_at"])
+        return cls(**data)
+
+
+# ========== TTL Cache ==========
+class TTLCache:
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[object, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def put(self, key, value, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, expires_at)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# ========== Principal Cache ==========
+class UserPrincipalCache:
+    """Short-lived cache of authenticated users, so a valid request doesn't
+    need a database round trip.
+
+    Lookups check process memory first, then Redis when one is attached.
+    ``invalidate`` clears both tiers; other workers' memory tiers expire on
+    their own within ``ttl`` seconds. The client is sync, so request
+    handlers use ``get_async``/``put_async``, which only leave the event
+    loop when Redis has to be asked.
+    """
+
+    key_prefix = "auth:user:"
+
+    def __init__(self, ttl: float = 30, max_size: int = 10000):
+        self.ttl = ttl
+        self._memory = TTLCache(ttl, max_size)
+        self.redis = None
+
+    def attach_redis(self, redis_client) -> None:
+        self.redis = redis_client
+
+    def get(self, user_id: int) -> Optional[AuthenticatedUser]:
+        user = self._memory.get(user_id)
+        if user is not None or self.redis is None:
+            return user
+        return self._get_remote(user_id)
+
+    async def get_async(self, user_id: int) -> Optional[AuthenticatedUser]:
+        user = self._memory.get(user_id)
+        if user is not None or self.redis is None:
+            return user
+        return await asyncio.to_thread(self._get_remote, user_id)
+
+    def _get_remote(self, user_id: int) -> Optional[AuthenticatedUser]:
+        try:
+            raw = self.redis.get(f"{self.key_prefix}{user_id}")
+        except Exception:
+            logger.warning("User cache Redis read failed", exc_info=True)
+            return None
+        if not raw:
+            return None
+        user = AuthenticatedUser.loads(raw)
+        self._memory.put(user_id, user)
+        return user
+
+    def put(self, user: AuthenticatedUser) -> None:
+        self._memory.put(user.id, user)
+        if self.redis is not None:
+            self._put_remote(user)
+
+    async def put_async(self, user: AuthenticatedUser) -> None:
+        self._memory.put(user.id, user)
+        if self.redis is not None:
+            await asyncio.to_thread(self._put_remote, user)
+
+    def _put_remote(self, user: AuthenticatedUser) -> None:
+        try:
+            self.redis.set(f"{self.key_prefix}{user.id}", user.dumps(), ex=max(1, int(self.ttl)))
+        except Exception:
+            logger.warning("User cache Redis write failed", exc_info=True)
+
+    def invalidate(self, user_id: int) -> None:
+        self._memory.pop(user_id)
+        if self.redis is not None:
+            try:
+                self.redis.delete(f"{self.key_prefix}{user_id}")
+            except Exception:
+                logger.warning("User cache Redis delete failed", exc_info=True)
+
+
+# ========== Token Memo ==========
+class TokenCache:
+    """Decoded JWT payloads, kept until the token's own expiry."""
+
+    def __init__(self, max_size: int = 10000):
+        self._memory = TTLCache(ttl=0, max_size=max_size)
+
+    def get(self, token: str) -> Optional[dict]:
+        return self._memory.get(token)
+
+    def put(self, token: str, payload: dict) -> None:
+        exp = payload.get("exp")
+        if exp is None:
+            return
+        remaining = float(exp) - time.time()
+        if remaining > 0:
+            self._memory.put(token, payload, ttl=remaining)
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import time
+import uuid
+from typing import Dict, Optional
+
+import orjson
+
+from metrics import WS_FANOUT_MESSAGES, count_error
+from serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+
+# ========== Redis Fan-out ==========
+class RedisFanout:
+    """Relays position rows between workers over Redis pub/sub, one channel per user.
+
+    The worker that produced an update delivers it to its own sockets straight
+    away and publishes the latest rows per account (coalesced over ``window``
+    seconds) on ``ws:user:<id>``. Every worker subscribes to the channels of
+    the users it holds sockets for and feeds received rows into its local
+    ``PositionStreamer``, which diffs them into delta frames as usual. Full
+    rows rather than deltas go over the wire, so a message lost to a Redis
+    reconnect heals with the next one.
+
+    A publish that reached no subscriber marks the user idle for ``idle_ttl``
+    seconds, so users with no socket anywhere cost one PUBLISH per idle_ttl.
+    """
+
+    channel_prefix = "ws:user:"
+
+    def __init__(self, redis_url: str, streamer, window: float = 0.1, idle_ttl: float = 1.0,
+                 reconnect_delay: float = 1.0):
+        self.redis_url = redis_url
+        self.streamer = streamer
+        self.window = window
+        self.idle_ttl = idle_ttl
+        self.reconnect_delay = reconnect_delay
+        self.origin = uuid.uuid4().hex[:12]
+        self._redis = None
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._subscribed: set = set()
+        self._pending: Dict[int, Dict[int, dict]] = {}
+        self._flush_tasks: Dict[int, asyncio.Task] = {}
+        self._idle_until: Dict[int, float] = {}
+
+    def channel(self, user_id: int) -> str:
+        return f"{self.channel_prefix}{user_id}"
+
+    def _client(self):
+        if self._redis is None:
+            import redis.asyncio as aioredis
+            self._redis = aioredis.from_url(self.redis_url, decode_responses=True)
+        return self._redis
+
+    # ----- Producer -----
+    def wants(self, user_id: int) -> bool:
+        # False while the last publish for this user reached nobody
+        return self.streamer.manager.has_connections(user_id) or self._idle_until.get(user_id, 0) <= time.monotonic()
+
+    def publish(self, user_id: int, account_id: int, rows: Dict[str, dict]) -> None:
+        self.streamer.publish(user_id, account_id, rows)
+        if self._idle_until.get(user_id, 0) > time.monotonic():
+            return
+        self._pending.setdefault(user_id, {})[account_id] = rows
+        if user_id not in self._flush_tasks:
+            self._flush_tasks[user_id] = asyncio.create_task(self._flush_later(user_id))
+
+    async def _flush_later(self, user_id: int) -> None:
+        try:
+            await asyncio.sleep(self.window)
+            await self.flush(user_id)
+        except Exception as e:
+            count_error("ws_fanout", e)
+            logger.warning("Fan-out publish for user %s failed: %r", user_id, e)
+        finally:
+            self._flush_tasks.pop(user_id, None)
+
+    async def flush(self, user_id: int) -> int:
+        accounts = self._pending.pop(user_id, None)
+        if not accounts:
+            return 0
+        message = dumps({"origin": self.origin, "accounts": accounts})
+        receivers = await self._client().publish(self.channel(user_id), message)
+        WS_FANOUT_MESSAGES.labels("published").inc()
+        # Our own subscription counts as a receiver
+        if receivers - (1 if user_id in self._subscribed else 0) <= 0:
+            self._idle_until[user_id] = time.monotonic() + self.idle_ttl
+        else:
+            self._idle_until.pop(user_id, None)
+        return receivers
+
+    # ----- Consumer -----
+    async def subscribe(self, user_id: int) -> None:
+        if user_id in self._subscribed:
+            return
+        self._subscribed.add(user_id)
+        if self._pubsub is not None:
+            await self._pubsub.subscribe(self.channel(user_id))
+        self._ensure_listener()
+
+    async def unsubscribe(self, user_id: int) -> None:
+        if user_id not in self._subscribed:
+            return
+        self._subscribed.discard(user_id)
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.unsubscribe(self.channel(user_id))
+            except Exception as e:
+                count_error("ws_fanout", e)
+
+    def _ensure_listener(self) -> None:
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        # Reconnects (and resubscribes every local user) after any Redis error,
+        # including Redis dropping us for overrunning the pub/sub output buffer
+        while True:
+            try:
+                self._pubsub = self._client().pubsub(ignore_subscribe_messages=True)
+                if self._subscribed:
+                    await self._pubsub.subscribe(*(self.channel(user_id) for user_id in self._subscribed))
+                while True:
+                    if not self._subscribed:
+                        await asyncio.sleep(self.window)
+                        continue
+                    message = await self._pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        self._deliver(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                count_error("ws_fanout", e)
+                logger.warning("Fan-out subscriber lost Redis, reconnecting: %r", e)
+                await self._reset_pubsub()
+                await asyncio.sleep(self.reconnect_delay)
+
+    def _deliver(self, message: dict) -> None:
+        try:
+            payload = orjson.loads(message["data"])
+            user_id = int(message["channel"][len(self.channel_prefix):])
+        except (ValueError, TypeError, KeyError) as e:
+            count_error("ws_fanout", e)
+            return
+        if payload.get("origin") == self.origin:
+            return
+        WS_FANOUT_MESSAGES.labels("received").inc()
+        for account_id, rows in payload.get("accounts", {}).items():
+            self.streamer.publish(user_id, int(account_id), rows)
+
+    async def _reset_pubsub(self) -> None:
+        pubsub, self._pubsub = self._pubsub, None
+        if pubsub is not None:
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except BaseException:
+                pass
+            self._listener = None
+        for task in list(self._flush_tasks.values()):
+            task.cancel()
+        await self._reset_pubsub()
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None